@@ -55,10 +55,13 @@ import pyodbc
 import logging
 from config import Config
 import os
+import time
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 from PIL import Image
 import uuid
+import json
+import base64
 from sqlalchemy import text
 from sqlalchemy.sql import case
 from functools import wraps
@@ -73,6 +76,16 @@ from odoo_service import OdooService
 # Location service for country detection
 from location_service import location_service
 
+# Background side-effect pipeline (durable outbox)
+from outbox import outbox
+from ticket_side_effects import (
+    enqueue_ticket_side_effects, register_ticket_side_effects, run_ticket_fanout,
+    emit_ticket_message, GEOLOCATE_EVENT
+)
+
+# Safe client retries for ticket/message creation (Idempotency-Key header)
+from idempotency import idempotent
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -356,6 +369,7 @@ class Ticket(db.Model):
     current_sla_target = db.Column(db.DateTime, nullable=True)
     resolution_method = db.Column(db.String(50), nullable=True)  # Bot, ICP, YouCloud
     bot_attempted = db.Column(db.Boolean, default=False)
+    bot_attempts = db.Column(db.Integer, default=0)  # BotInteraction rows, maintained by the interaction writer
     partner_id = db.Column(db.Integer, nullable=True)  # Will add FK later
     
     # Odoo Integration fields
@@ -371,8 +385,22 @@ class Ticket(db.Model):
     device_brand = db.Column(db.String(50), nullable=True)  # Apple, Samsung, etc.
     device_model = db.Column(db.String(50), nullable=True)  # iPhone 12, Galaxy S21, etc.
     device_fingerprint = db.Column(db.String(255), nullable=True)  # Unique device identifier
+    device_fingerprint_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of user agent + client IP, indexed
     user_agent = db.Column(db.Text, nullable=True)  # Full user agent string
     ip_address = db.Column(db.String(45), nullable=True)  # IPv4 or IPv6 address
+    
+    # Denormalized last-message fields, maintained by record_ticket_message()
+    LastMessageAt = db.Column(db.DateTime, nullable=True)  # CreatedAt of the latest message
+    LastMessageID = db.Column(db.Integer, nullable=True)  # MessageID of the latest message
+    UnreadUserMessageCount = db.Column(db.Integer, default=0)  # User messages since the last admin reply
+
+    # Indexes backing the admin ticket list (keyset pagination and status filters)
+    __table_args__ = (
+        db.Index('IX_Tickets_CreatedAt_TicketID', 'CreatedAt', 'TicketID'),
+        db.Index('IX_Tickets_Status_CreatedAt', 'Status', 'CreatedAt'),
+        db.Index('IX_Tickets_Status_UpdatedAt', 'Status', 'UpdatedAt'),
+        db.Index('IX_Tickets_DeviceFingerprintHash', 'device_fingerprint_hash', 'CreatedAt'),
+    )
 
     # Relationships
     user = db.relationship('User', foreign_keys=[UserID], backref='tickets')
@@ -491,6 +519,58 @@ def load_user(user_id):
     except:
         return None
 
+def record_ticket_message(ticket, message):
+    """Update the ticket's denormalized last-message columns for a flushed message"""
+    if not ticket or not message:
+        return
+    
+    ticket.LastMessageAt = message.CreatedAt or datetime.utcnow()
+    ticket.LastMessageID = message.MessageID
+    
+    if message.IsAdminReply:
+        # Only a human reply means the user's messages were read; bot replies leave the count alone
+        if not message.IsBotResponse:
+            ticket.UnreadUserMessageCount = 0
+    else:
+        # Increment in SQL so concurrent messages on the same ticket are not lost
+        ticket.UnreadUserMessageCount = db.func.coalesce(Ticket.UnreadUserMessageCount, 0) + 1
+
+# Device analytics tables come from db.create_all(); until they exist tickets skip the device bookkeeping
+_device_tables = {'ready': False, 'checked_at': 0.0}
+
+def _device_tables_ready():
+    """Whether the device analytics tables exist (rechecked every 5 minutes until they do)"""
+    if _device_tables['ready'] or time.monotonic() - _device_tables['checked_at'] < 300:
+        return _device_tables['ready']
+    
+    _device_tables['checked_at'] = time.monotonic()
+    count = db.session.execute(text("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES 
+        WHERE TABLE_NAME IN ('device_daily_rollups', 'device_fingerprints', 'device_fingerprint_users', 'device_fingerprint_events')
+    """)).scalar()
+    _device_tables['ready'] = count >= 4
+    if not _device_tables['ready']:
+        logger.warning("Device analytics tables missing, tickets are not added to device rollups or the "
+                       "fingerprint index; run db.create_all() (python app.py), then flask "
+                       "rebuild-device-rollups and flask backfill-device-fingerprints")
+    return _device_tables['ready']
+
+def record_ticket_device(ticket):
+    """Add a committed ticket to the daily device rollups and the fingerprint index.
+
+    Runs in its own transaction after the ticket commit, so a missing table or
+    any other failure here never fails ticket creation.
+    """
+    try:
+        if not _device_tables_ready():
+            return
+        device_rollups.record_ticket(ticket)
+        device_fingerprints.record_ticket(ticket)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Device analytics recording failed for ticket {ticket.TicketID}: {e}")
+
 # SocketIO event handlers for real-time chat
 @socketio.on('join_room')
 def handle_join_room(data):
@@ -527,16 +607,19 @@ def handle_send_message(data):
         msg = Message(TicketID=ticket_id, SenderID=sender_id,
                       Content=content, IsAdminReply=is_admin)
         db.session.add(msg)
+        db.session.flush()
         
         # Update ticket status and timestamp
         ticket = Ticket.query.get(ticket_id)
         if ticket:
             ticket.UpdatedAt = datetime.utcnow()
+            record_ticket_message(ticket, msg)
             if not is_admin and ticket.Status == 'open':
                 ticket.Status = 'in_progress'
         
-        db.session.commit()
-        logger.info(f"✅ Message saved to database with ID: {msg.MessageID}")
+        # Message and attachment links are committed together below so pollers
+        # never see the message (and its ETag) before its attachments
+        logger.info(f"✅ Message flushed to database with ID: {msg.MessageID}")
         
         # Handle attachments if present
         attachments_info = []
@@ -620,6 +703,9 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Admin ticket list paging
+ADMIN_TICKETS_MAX_PAGE_SIZE = 200
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -1015,6 +1101,7 @@ def get_common_queries(category_id):
     } for q in queries])
 
 @app.route('/api/tickets', methods=['POST'])
+@idempotent
 def create_ticket():
     try:
         logger.info("Creating new ticket...")
@@ -1026,7 +1113,7 @@ def create_ticket():
             return jsonify({
                 'status': 'error',
                 'message': 'No data provided'
-            }, 400)
+            }), 400
         
         # Validate required fields
         if not data.get('message'):
@@ -1034,7 +1121,7 @@ def create_ticket():
             return jsonify({
                 'status': 'error',
                 'message': 'Message is required'
-            }, 400)
+            }), 400
         
         # Handle authenticated user vs guest user
         user = None
@@ -1067,7 +1154,7 @@ def create_ticket():
                     return jsonify({
                         'status': 'error',
                         'message': 'Error creating user'
-                    }, 500)
+                    }), 500
         
         # Get category ID - default to 1 if not provided
         category_id = data.get('category_id', 1)
@@ -1086,17 +1173,9 @@ def create_ticket():
         
         logger.info(f"Auto-assigned escalation level: {escalation_level} (based on priority: {ticket_priority})")
         
-        # Auto-detect country from user's location
+        # Country is resolved in the background from the client IP captured here
         ticket_country = 'Unknown'
-        try:
-            location_info = location_service.detect_country_from_request(request)
-            if location_info and location_info.get('country'):
-                ticket_country = location_info['country']
-                logger.info(f"Auto-detected country for new ticket: {ticket_country}")
-            else:
-                logger.warning("Could not auto-detect country for new ticket")
-        except Exception as e:
-            logger.warning(f"Country auto-detection failed: {e}")
+        client_ip = location_service.get_client_ip(request)
         
         # Create ticket with enhanced information
         try:
@@ -1139,7 +1218,7 @@ def create_ticket():
             return jsonify({
                 'status': 'error',
                 'message': 'Error creating ticket'
-            }, 500)
+            }), 500
         
         # Create initial message
         try:
@@ -1151,6 +1230,7 @@ def create_ticket():
             )
             db.session.add(message)
             db.session.flush()  # Get message ID without committing
+            record_ticket_message(ticket, message)
             logger.info(f"Created message with ID: {message.MessageID}")
         except Exception as e:
             logger.error(f"Error creating message: {str(e)}")
@@ -1158,83 +1238,23 @@ def create_ticket():
             return jsonify({
                 'status': 'error',
                 'message': 'Error creating message'
-            }, 500)
-        # Try bot response first (Level 0 automation)
-        bot_response = None
-        bot_attempted = False
-        try:
-            bot_response = bot_service.process_query(data['message'], ticket.TicketID)
-            bot_attempted = True
-            
-            if bot_response and bot_response.get('confidence', 0) >= 0.7:
-                # Bot provided a confident response
-                bot_message = Message(
-                    TicketID=ticket.TicketID,
-                    SenderID=None,  # Bot response
-                    Content=bot_response['response'],
-                    IsAdminReply=True,
-                    IsBotResponse=True
-                )
-                db.session.add(bot_message)
-                ticket.bot_attempted = True
-                ticket.resolution_method = 'bot'
-                logger.info(f"Bot provided confident response for ticket {ticket.TicketID}")
-            else:
-                # Bot response not confident enough, escalate to human
-                ticket.bot_attempted = True
-                ticket.escalation_level = 1
-                ticket.resolution_method = 'human'
-                logger.info(f"Bot response not confident enough, escalating ticket {ticket.TicketID} to human")
-                
-        except Exception as e:
-            logger.error(f"Error processing bot response: {str(e)}")
-            ticket.bot_attempted = bot_attempted
-            ticket.escalation_level = 1
-            ticket.resolution_method = 'human'
-
-        # 🔥 NEW: Sync ticket to Odoo Online
-        odoo_customer_id = None
-        odoo_ticket_id = None
+            }), 500
+        # Level 0 bot reply, Odoo sync and geolocation run after commit via the outbox.
+        # With SYNC_BOT_REPLY the request tries them itself first, so hold the events back meanwhile.
+        sync_bot_reply = app.config.get('SYNC_BOT_REPLY', False)
+        fanout_deadline_ms = app.config.get('TICKET_FANOUT_DEADLINE_MS', 800)
         try:
-            if odoo_service:
-                logger.info(f"Syncing ticket {ticket.TicketID} to Odoo Online...")
-                
-                # First, create/find customer in Odoo
-                if user and user.Email:
-                    try:
-                        odoo_customer_id = odoo_service.create_customer(
-                            name=user.Name,
-                            email=user.Email,
-                            comment=f"Organization: {user.OrganizationName}" if user.OrganizationName else None
-                        )
-                        logger.info(f"Created/found customer in Odoo with ID: {odoo_customer_id}")
-                    except Exception as e:
-                        logger.warning(f"Could not create customer in Odoo: {e}")
-                
-                # Create ticket in Odoo
-                try:
-                    odoo_ticket_id = odoo_service.create_ticket(
-                        name=ticket.Subject,
-                        description=f"Ticket #{ticket.TicketID} from {ticket.OrganizationName}\n\nMessage: {data['message']}",
-                        partner_id=odoo_customer_id,
-                        priority='2' if ticket.Priority == 'high' else '1',  # Odoo priority mapping
-                        tag_ids=['chatbot-created']
-                    )
-                    
-                    # Store Odoo IDs for future reference
-                    ticket.odoo_customer_id = odoo_customer_id
-                    ticket.odoo_ticket_id = odoo_ticket_id
-                    
-                    logger.info(f"✅ Ticket {ticket.TicketID} synced to Odoo ticket {odoo_ticket_id}")
-                    
-                except Exception as e:
-                    logger.warning(f"Could not create ticket in Odoo: {e}")
-            else:
-                logger.warning("Odoo service not available for ticket sync")
-                
+            side_effect_events = enqueue_ticket_side_effects(
+                outbox, ticket, data['message'], client_ip, user=user,
+                delay_seconds=fanout_deadline_ms / 1000.0 + 30 if sync_bot_reply else 0
+            )
         except Exception as e:
-            logger.error(f"Error syncing ticket to Odoo: {e}")
-            # Don't fail the entire ticket creation if Odoo sync fails
+            logger.error(f"Error queueing side effects for ticket {ticket.TicketID}: {e}")
+            db.session.rollback()
+            return jsonify({
+                'status': 'error',
+                'message': 'Error creating ticket'
+            }), 500
 
         # Set initial SLA target based on priority and partner
         try:
@@ -1284,7 +1304,24 @@ def create_ticket():
             return jsonify({
                 'status': 'error',
                 'message': 'Error saving ticket'
-            }, 500)
+            }), 500
+        
+        record_ticket_device(ticket)
+        
+        # Optionally answer with the bot reply inline (deadline-bounded, the outbox fills in the rest)
+        bot_message = None
+        if sync_bot_reply:
+            try:
+                bot_message = run_ticket_fanout(ticket, user, data['message'], client_ip,
+                                                side_effect_events, deadline_ms=fanout_deadline_ms)
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Inline side effects failed for ticket {ticket.TicketID}: {e}")
+                db.session.rollback()
+                bot_message = None
+        outbox.notify()
+        if bot_message:
+            emit_ticket_message(bot_message)
         
         logger.info(f"Successfully created ticket {ticket.TicketID} for organization {ticket.OrganizationName}")
         
@@ -1295,14 +1332,13 @@ def create_ticket():
             'organization': ticket.OrganizationName,
             'status': 'success',
             'message': 'Ticket created successfully',
-            'bot_attempted': bot_attempted,
+            'bot_attempted': bool(ticket.bot_attempted),
+            'bot_reply_pending': not ticket.bot_attempted,  # Delivered to the ticket room as a new_message event
             'resolution_method': ticket.resolution_method,
             'escalation_level': ticket.escalation_level
         }
-        
-        if bot_response and bot_response.get('confidence', 0) >= 0.7:
-            response_data['bot_response'] = bot_response['response']
-            response_data['bot_confidence'] = bot_response['confidence']
+        if bot_message:
+            response_data['bot_response'] = bot_message.Content
         
         return jsonify(response_data)
         
@@ -1312,20 +1348,67 @@ def create_ticket():
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
-        }, 500)
+        }), 500
+
+def _load_ticket_attachments(ticket_id, since_id=0):
+    """Load attachments for a ticket's messages in one query, grouped by MessageID"""
+    attachments = Attachment.query.join(
+        Message, Attachment.MessageID == Message.MessageID
+    ).filter(
+        Message.TicketID == ticket_id,
+        Message.MessageID > since_id
+    ).order_by(Attachment.AttachmentID).all()
+    
+    grouped = {}
+    for att in attachments:
+        grouped.setdefault(att.MessageID, []).append(att)
+    return grouped
+
+def _messages_not_modified(etag):
+    """Check the request's If-None-Match against the message thread ETag"""
+    # No Last-Modified/If-Modified-Since: its one-second resolution would hide
+    # a message posted in the same second, while the ETag carries LastMessageID
+    return bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
+
+def _set_message_validators(response, etag):
+    """Attach the ETag and force clients to revalidate on every poll"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
 
 @app.route('/api/tickets/<int:ticket_id>/messages', methods=['GET', 'POST'])
+@idempotent
 def handle_messages(ticket_id):
     if request.method == 'GET':
-        messages = Message.query.filter_by(TicketID=ticket_id).order_by(Message.CreatedAt).all()
+        # Incremental sync: only return messages newer than the client's last seen ID
+        since_id = request.args.get('since_id', request.args.get('after', 0), type=int) or 0
+        
+        # Validators come from the ticket's denormalized last-message columns
+        last_message = db.session.query(Ticket.LastMessageID).filter(
+            Ticket.TicketID == ticket_id
+        ).first()
+        
+        etag = None
+        if last_message and last_message.LastMessageID:
+            etag = f"t{ticket_id}-m{last_message.LastMessageID}-s{since_id}"
+            
+            if _messages_not_modified(etag):
+                response = app.response_class(status=304)
+                _set_message_validators(response, etag)
+                return response
+        
+        messages = Message.query.filter(
+            Message.TicketID == ticket_id,
+            Message.MessageID > since_id
+        ).order_by(Message.CreatedAt, Message.MessageID).all()
+        attachments_by_message = _load_ticket_attachments(ticket_id, since_id)
         message_list = []
         
         for m in messages:
-            # Get attachments for this message
-            attachments = Attachment.query.filter_by(MessageID=m.MessageID).all()
+            attachments = attachments_by_message.get(m.MessageID, [])
             
             message_data = {
-                'id': m.MessageID,                'content': m.Content,
+                'id': m.MessageID,
+                'content': m.Content,
                 'is_admin': m.IsAdminReply,
                 'created_at': format_timestamp_with_tz(m.CreatedAt),
                 'attachments': [{
@@ -1338,7 +1421,10 @@ def handle_messages(ticket_id):
             }
             message_list.append(message_data)
         
-        return jsonify(message_list)
+        response = jsonify(message_list)
+        if etag:
+            _set_message_validators(response, etag)
+        return response
     
     # POST new message
     data = request.json
@@ -1349,10 +1435,13 @@ def handle_messages(ticket_id):
         IsAdminReply=data.get('is_admin', False)
     )
     db.session.add(message)
-      # Update ticket timestamp
+    db.session.flush()
+    
+    # Update ticket timestamp
     ticket = Ticket.query.get(ticket_id)
     if ticket:
         ticket.UpdatedAt = datetime.utcnow()
+        record_ticket_message(ticket, message)
         if data.get('is_admin', False) and ticket.Status == 'open':
             ticket.Status = 'in_progress'
     
@@ -1392,6 +1481,7 @@ def upload_file():
         return jsonify({'error': 'Upload failed'}), 500
 
 @app.route('/api/tickets/with-attachment', methods=['POST'])
+@idempotent
 def create_ticket_with_attachment():
     """Create ticket with file attachment"""
     try:
@@ -1411,34 +1501,18 @@ def create_ticket_with_attachment():
         # Create or get user
         user = User.query.filter_by(Email=data['email']).first()
         if not user:
-            # Auto-detect country for new user
-            user_country = 'Unknown'
-            try:
-                location_info = location_service.detect_country_from_request(request)
-                if location_info and location_info.get('country'):
-                    user_country = location_info['country']
-                    logger.info(f"Auto-detected country for new user: {user_country}")
-            except Exception as e:
-                logger.warning(f"User country auto-detection failed: {e}")
-            
             user = User(
                 Name=data['name'], 
                 Email=data['email'],
                 OrganizationName=data.get('organization', 'Unknown'),
-                Country=user_country  # Add country auto-detection for new users
+                Country='Unknown'  # Resolved in the background with the ticket country
             )
             db.session.add(user)
             db.session.flush()
         
-        # Auto-detect country for ticket
+        # Country is resolved in the background from the client IP captured here
         ticket_country = 'Unknown'
-        try:
-            location_info = location_service.detect_country_from_request(request)
-            if location_info and location_info.get('country'):
-                ticket_country = location_info['country']
-                logger.info(f"Auto-detected country for new ticket: {ticket_country}")
-        except Exception as e:
-            logger.warning(f"Ticket country auto-detection failed: {e}")
+        client_ip = location_service.get_client_ip(request)
         
         # Create ticket
         ticket = Ticket(
@@ -1460,6 +1534,7 @@ def create_ticket_with_attachment():
         )
         db.session.add(message)
         db.session.flush()
+        record_ticket_message(ticket, message)
         
         # Handle file attachment if present
         if 'file' in request.files and request.files['file'].filename != '':
@@ -1475,7 +1550,14 @@ def create_ticket_with_attachment():
                         MimeType=file_info['mime_type']                    )
                     db.session.add(attachment)
         
+        outbox.enqueue(GEOLOCATE_EVENT, ticket.TicketID, {
+            'client_ip': client_ip,
+            'user_id': user.UserID if user.Country in (None, 'Unknown') else None
+        })
+        
         db.session.commit()
+        record_ticket_device(ticket)
+        outbox.notify()
         
         return jsonify({
             'ticket_id': ticket.TicketID,
@@ -1490,6 +1572,7 @@ def create_ticket_with_attachment():
         return jsonify({'error': 'Failed to create ticket'}), 500
 
 @app.route('/api/tickets/<int:ticket_id>/messages/with-attachment', methods=['POST'])
+@idempotent
 def add_message_with_attachment(ticket_id):
     """Add message to existing ticket with optional attachment"""
     try:
@@ -1530,6 +1613,7 @@ def add_message_with_attachment(ticket_id):
         ticket = Ticket.query.get(ticket_id)
         if ticket:
             ticket.UpdatedAt = datetime.utcnow()
+            record_ticket_message(ticket, message)
             if is_admin and ticket.Status == 'open':
                 ticket.Status = 'in_progress'
         
@@ -1582,35 +1666,15 @@ def get_dashboard_stats():
     try:
         logger.info("Loading dashboard stats...")
         
-        # Test database connection first
-        try:
-            db.session.execute(text('SELECT 1'))
-            logger.info("Database connection successful")
-        except Exception as db_error:
-            logger.error(f"Database connection failed: {str(db_error)}")
-            return jsonify({
-                "error": "Database connection failed",
-                "details": str(db_error)
-            }), 500
-        
-        # Get stats with detailed logging
-        total_tickets = Ticket.query.count()
-        logger.info(f"Total tickets: {total_tickets}")
-        
-        pending_tickets = Ticket.query.filter(Ticket.Status.in_(['open', 'in_progress'])).count()
-        logger.info(f"Pending tickets: {pending_tickets}")
+        # Counts come from the incrementally maintained ticket counters
+        counts = ticket_counters.snapshot()
+        by_status = counts['by_status']
         
-        resolved_tickets = Ticket.query.filter_by(Status='resolved').count()
-        logger.info(f"Resolved tickets: {resolved_tickets}")
-        
-        active_chats = Ticket.query.filter(Ticket.Status.in_(['open', 'in_progress'])).count()
-        logger.info(f"Active chats: {active_chats}")
-        
-        # Also get some sample tickets for debugging
-        sample_tickets = Ticket.query.limit(5).all()
-        logger.info(f"Sample tickets found: {len(sample_tickets)}")
-        for ticket in sample_tickets:
-            logger.info(f"Ticket {ticket.TicketID}: {ticket.Subject} - Status: {ticket.Status}")
+        total_tickets = counts['total']
+        pending_tickets = by_status.get('open', 0) + by_status.get('in_progress', 0)
+        resolved_tickets = by_status.get('resolved', 0)
+        active_chats = pending_tickets
+        logger.info(f"Dashboard counts: total={total_tickets}, pending={pending_tickets}, resolved={resolved_tickets}")
         
         result = {
             'totalTickets': total_tickets,
@@ -1694,14 +1758,17 @@ def get_admin_tickets():
             filters = apply_query_filters(request.args)
             logger.info(f"Applied filters: {filters}")
         except:
-            filters = {'status': 'all', 'priority': 'all', 'category': 'all', 'limit': 50, 'offset': 0}
+            filters = _parse_admin_ticket_filters(request.args)
         
-        # Ensure tables exist first
-        try:
-            db.create_all()
-            logger.info("Database tables created/verified")
-        except Exception as table_error:
-            logger.error(f"Error creating tables: {str(table_error)}")
+        # Keyset pagination is used when the client sends a cursor (or asks for it explicitly)
+        cursor = request.args.get('cursor')
+        use_cursor = bool(cursor) or request.args.get('pagination') == 'cursor'
+        cursor_key = None
+        if cursor:
+            try:
+                cursor_key = _decode_ticket_cursor(cursor)
+            except Exception:
+                return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
         
         # Test database connection
         try:
@@ -1714,70 +1781,25 @@ def get_admin_tickets():
                 "details": str(db_error)
             }), 500
         
-        # Try simple query first to check if Ticket table exists
-        try:
-            ticket_count = db.session.query(Ticket).count()
-            logger.info(f"Found {ticket_count} tickets in database")
-            
-            if ticket_count == 0:
-                logger.info("No tickets found, returning empty response")
-                return jsonify({
-                    'success': True,
-                    'tickets': [],
-                    'pagination': {
-                        'total': 0,
-                        'limit': filters['limit'],
-                        'offset': filters['offset'],
-                        'has_more': False
-                    },
-                    'filters': {
-                        'status': filters['status'],
-                        'priority': filters['priority'],
-                        'category': filters['category']
-                    }
-                })
-            
-        except Exception as count_error:
-            logger.error(f"Error counting tickets: {str(count_error)}")
-            # Table might not exist, return empty response
-            return jsonify({
-                'success': True,
-                'tickets': [],
-                'pagination': {
-                    'total': 0,
-                    'limit': filters['limit'],
-                    'offset': filters['offset'],
-                    'has_more': False
-                },
-                'filters': {
-                    'status': filters['status'],
-                    'priority': filters['priority'],
-                    'category': filters['category']
-                }
-            })
-        
-        # Try to get tickets with detailed logging and priority sorting
+        # Filters, ordering and the page window are all evaluated by the database
         try:
-            tickets = db.session.query(Ticket, User, Category).join(
-                User, Ticket.UserID == User.UserID, isouter=True
-            ).join(
-                Category, Ticket.CategoryID == Category.CategoryID, isouter=True
-            ).order_by(
-                # Sort by priority first (critical -> high -> medium -> low), then by created date
-                case(
-                    (Ticket.Priority == 'critical', 4),
-                    (Ticket.Priority == 'high', 3),
-                    (Ticket.Priority == 'medium', 2),
-                    (Ticket.Priority == 'low', 1),
-                    else_=2
-                ).desc(),
-                Ticket.CreatedAt.desc()            ).all()
+            query = _apply_admin_ticket_filters(
+                db.session.query(Ticket, User, Category).join(
+                    User, Ticket.UserID == User.UserID, isouter=True
+                ).join(
+                    Category, Ticket.CategoryID == Category.CategoryID, isouter=True
+                ),
+                filters
+            )
             
-            logger.info(f"Found {len(tickets)} tickets in database")
+            if use_cursor:
+                rows, pagination = _fetch_ticket_page_by_cursor(query, filters, cursor_key)
+            else:
+                rows, pagination = _fetch_ticket_page_by_offset(query, filters)
             
             result = []
-            for ticket, user, category in tickets:
-                ticket_data = {
+            for ticket, user, category in rows:
+                result.append({
                     'id': ticket.TicketID,
                     'subject': ticket.Subject,
                     'category': category.Name if category else 'Unknown',
@@ -1797,61 +1819,23 @@ def get_admin_tickets():
                     'updated_at': format_timestamp_with_tz(ticket.UpdatedAt) if ticket.UpdatedAt else format_timestamp_with_tz(ticket.CreatedAt),
                     'end_date': format_timestamp_with_tz(ticket.EndDate) if ticket.EndDate else None,
                     'country': ticket.Country if ticket.Country else 'Unknown'  # Add country information
-                }
-                result.append(ticket_data)
-                logger.info(f"Processed ticket {ticket.TicketID}: {ticket.Subject} - Priority: {ticket.Priority}, Org: {ticket_data['organization']}")
-            
-            logger.info(f"Returning {len(result)} tickets to admin panel sorted by priority")
-            
-            # Apply filters if using Urban Vyapari integration
-            if filters['status'] != 'all':
-                result = [t for t in result if t['status'] == filters['status']]
-            if filters['priority'] != 'all':
-                result = [t for t in result if t['priority'] == filters['priority']]
-            if filters['category'] != 'all' and filters['category'] != 'Unknown':
-                result = [t for t in result if t['category'].lower() == filters['category'].lower()]
-            
-            # Apply pagination
-            total_count = len(result)
-            start_idx = filters['offset']
-            end_idx = start_idx + filters['limit']
-            paginated_result = result[start_idx:end_idx]
-            
-            # Always return consistent dictionary format
-            response_data = {
-                'success': True,
-                'tickets': paginated_result,
-                'pagination': {
-                    'total': total_count,
-                    'limit': filters['limit'],
-                    'offset': filters['offset'],
-                    'has_more': end_idx < total_count
-                },
-                'filters': {
-                    'status': filters['status'],
-                    'priority': filters['priority'],
-                    'category': filters['category']
-                }
-            }
-            
-            # Add Urban Vyapari metadata if accessed via token
-            if hasattr(request, 'uv_admin'):
-                response_data['uv_metadata'] = {
-                    'accessed_by': request.uv_admin['admin_name'],
-                    'source': 'urbanvyapari',
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'admin_id': request.uv_admin['admin_id']
-                }
-                logger.info(f"Urban Vyapari access by: {request.uv_admin['admin_name']}")
+                })
             
-            return jsonify(response_data)
+            logger.info(f"Returning {len(result)} tickets to admin panel")
+            return jsonify(_admin_tickets_response(result, filters, pagination))
             
         except Exception as query_error:
             logger.error(f"Error querying tickets with joins: {str(query_error)}", exc_info=True)
+            db.session.rollback()
             
             # Try a simpler query as fallback
             try:
-                simple_tickets = Ticket.query.all()
+                query = _apply_admin_ticket_filters(Ticket.query, filters)
+                
+                if use_cursor:
+                    simple_tickets, pagination = _fetch_ticket_page_by_cursor(query, filters, cursor_key)
+                else:
+                    simple_tickets, pagination = _fetch_ticket_page_by_offset(query, filters)
                 logger.info(f"Fallback: Found {len(simple_tickets)} tickets with simple query")
                 
                 result = []
@@ -1864,53 +1848,13 @@ def get_admin_tickets():
                         'user_email': 'Unknown',
                         'organization': ticket.OrganizationName or 'Unknown Organization',
                         'priority': ticket.Priority or 'medium',
-                        'status': ticket.Status,                        'created_at': format_timestamp_with_tz(ticket.CreatedAt),
+                        'status': ticket.Status,
+                        'created_at': format_timestamp_with_tz(ticket.CreatedAt),
                         'updated_at': format_timestamp_with_tz(ticket.UpdatedAt) if ticket.UpdatedAt else format_timestamp_with_tz(ticket.CreatedAt),
                         'end_date': format_timestamp_with_tz(ticket.EndDate) if ticket.EndDate else None
                     })
                 
-                # Apply filters if using Urban Vyapari integration
-                if filters['status'] != 'all':
-                    result = [t for t in result if t['status'] == filters['status']]
-                if filters['priority'] != 'all':
-                    result = [t for t in result if t['priority'] == filters['priority']]
-                if filters['category'] != 'all' and filters['category'] != 'Unknown':
-                    result = [t for t in result if t['category'].lower() == filters['category'].lower()]
-                
-                # Apply pagination
-                total_count = len(result)
-                start_idx = filters['offset']
-                end_idx = start_idx + filters['limit']
-                result = result[start_idx:end_idx]
-                
-                # Enhance response for Urban Vyapari
-                response_data = {
-                    'success': True,
-                    'tickets': result,
-                    'pagination': {
-                        'total': total_count,
-                        'limit': filters['limit'],
-                        'offset': filters['offset'],
-                        'has_more': end_idx < total_count
-                    },
-                    'filters': {
-                        'status': filters['status'],
-                        'priority': filters['priority'],
-                        'category': filters['category']
-                    }
-                }
-                
-                # Add Urban Vyapari metadata if accessed via token
-                if hasattr(request, 'uv_admin'):
-                    response_data['uv_metadata'] = {
-                        'accessed_by': request.uv_admin['admin_name'],
-                        'source': 'urbanvyapari',
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'admin_id': request.uv_admin['admin_id']
-                    }
-                    logger.info(f"Urban Vyapari access by: {request.uv_admin['admin_name']}")
-                
-                return jsonify(response_data)
+                return jsonify(_admin_tickets_response(result, filters, pagination))
                 
             except Exception as simple_error:
                 logger.error(f"Even simple query failed: {str(simple_error)}")
@@ -1944,6 +1888,137 @@ def get_admin_tickets():
             }
         })
 
+def _parse_admin_ticket_filters(args):
+    """Read status/priority/category filters and the page window from request args"""
+    try:
+        limit = int(args.get('limit', 50))
+    except (TypeError, ValueError):
+        limit = 50
+    try:
+        offset = int(args.get('offset', 0))
+    except (TypeError, ValueError):
+        offset = 0
+    
+    return {
+        'status': args.get('status', 'all') or 'all',
+        'priority': args.get('priority', 'all') or 'all',
+        'category': args.get('category', 'all') or 'all',
+        'limit': max(1, min(limit, ADMIN_TICKETS_MAX_PAGE_SIZE)),
+        'offset': max(0, offset)
+    }
+
+def _apply_admin_ticket_filters(query, filters):
+    """Push the admin ticket filters down into the SQL WHERE clause"""
+    if filters['status'] != 'all':
+        query = query.filter(Ticket.Status == filters['status'])
+    
+    if filters['priority'] != 'all':
+        if filters['priority'] == 'medium':
+            # Tickets without a priority are displayed (and filtered) as medium
+            query = query.filter(db.or_(Ticket.Priority == 'medium', Ticket.Priority.is_(None)))
+        else:
+            query = query.filter(Ticket.Priority == filters['priority'])
+    
+    if filters['category'] != 'all' and filters['category'] != 'Unknown':
+        category_ids = db.session.query(Category.CategoryID).filter(
+            db.func.lower(Category.Name) == filters['category'].lower()
+        )
+        query = query.filter(Ticket.CategoryID.in_(category_ids))
+    
+    return query
+
+def _fetch_ticket_page_by_offset(query, filters):
+    """Fetch one priority-sorted page with LIMIT/OFFSET evaluated in SQL"""
+    total_count = query.order_by(None).count()
+    
+    rows = query.order_by(
+        # Sort by priority first (critical -> high -> medium -> low), then by created date
+        case(
+            (Ticket.Priority == 'critical', 4),
+            (Ticket.Priority == 'high', 3),
+            (Ticket.Priority == 'medium', 2),
+            (Ticket.Priority == 'low', 1),
+            else_=2
+        ).desc(),
+        Ticket.CreatedAt.desc(),
+        Ticket.TicketID.desc()
+    ).offset(filters['offset']).limit(filters['limit']).all()
+    
+    return rows, {
+        'total': total_count,
+        'limit': filters['limit'],
+        'offset': filters['offset'],
+        'has_more': filters['offset'] + len(rows) < total_count
+    }
+
+def _fetch_ticket_page_by_cursor(query, filters, cursor_key):
+    """Fetch one page ordered by (CreatedAt, TicketID) using keyset pagination"""
+    if cursor_key:
+        created_at, ticket_id = cursor_key
+        query = query.filter(db.or_(
+            Ticket.CreatedAt < created_at,
+            db.and_(Ticket.CreatedAt == created_at, Ticket.TicketID < ticket_id)
+        ))
+    
+    # Fetch one extra row to know whether another page exists without counting
+    rows = query.order_by(
+        Ticket.CreatedAt.desc(),
+        Ticket.TicketID.desc()
+    ).limit(filters['limit'] + 1).all()
+    
+    has_more = len(rows) > filters['limit']
+    rows = rows[:filters['limit']]
+    
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = _encode_ticket_cursor(last if isinstance(last, Ticket) else last[0])
+    
+    return rows, {
+        'mode': 'cursor',
+        'total': None,
+        'limit': filters['limit'],
+        'offset': 0,
+        'has_more': has_more,
+        'next_cursor': next_cursor
+    }
+
+def _encode_ticket_cursor(ticket):
+    """Build an opaque cursor pointing just after the given ticket"""
+    payload = json.dumps({'c': ticket.CreatedAt.isoformat(), 'id': ticket.TicketID})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_ticket_cursor(cursor):
+    """Decode a cursor produced by _encode_ticket_cursor into (CreatedAt, TicketID)"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    return datetime.fromisoformat(payload['c']), int(payload['id'])
+
+def _admin_tickets_response(tickets, filters, pagination):
+    """Wrap a page of admin tickets in the standard response envelope"""
+    response_data = {
+        'success': True,
+        'tickets': tickets,
+        'pagination': pagination,
+        'filters': {
+            'status': filters['status'],
+            'priority': filters['priority'],
+            'category': filters['category']
+        }
+    }
+    
+    # Add Urban Vyapari metadata if accessed via token
+    if hasattr(request, 'uv_admin'):
+        response_data['uv_metadata'] = {
+            'accessed_by': request.uv_admin['admin_name'],
+            'source': 'urbanvyapari',
+            'timestamp': datetime.utcnow().isoformat(),
+            'admin_id': request.uv_admin['admin_id']
+        }
+        logger.info(f"Urban Vyapari access by: {request.uv_admin['admin_name']}")
+    
+    return response_data
+
 @app.route('/api/admin/tickets/<int:ticket_id>', methods=['GET'])
 @admin_required
 def get_admin_ticket_details(ticket_id):
@@ -1968,11 +2043,10 @@ def get_admin_ticket_details(ticket_id):
         logger.info(f"Found {len(messages)} messages for ticket {ticket_id}")
         
         # Build message list with attachment information
+        attachments_by_message = _load_ticket_attachments(ticket_id)
         message_list = []
         for msg in messages:
-            # Get attachments for this message
-            attachments = Attachment.query.filter_by(MessageID=msg.MessageID).all()
-            logger.info(f"Message {msg.MessageID} has {len(attachments)} attachments")
+            attachments = attachments_by_message.get(msg.MessageID, [])
             
             message_data = {
                 'content': msg.Content,
@@ -2027,6 +2101,46 @@ def get_admin_ticket_details(ticket_id):
         logger.error(f"Error getting admin ticket details for {ticket_id}: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/admin/tickets/<int:ticket_id>/same-device', methods=['GET'])
+@admin_required
+def get_same_device_tickets(ticket_id):
+    """Other tickets and users seen on the same device as this ticket"""
+    try:
+        row = db.session.query(Ticket.device_fingerprint_hash, Ticket.user_agent, Ticket.ip_address).filter(
+            Ticket.TicketID == ticket_id
+        ).first()
+        if not row:
+            return jsonify({'error': 'Ticket not found'}), 404
+        
+        hashed = row.device_fingerprint_hash
+        if not hashed:
+            # Ticket created before the fingerprint index existed
+            from device_fingerprints import device_hash
+            hashed = device_hash(row.user_agent, row.ip_address)
+        if not hashed:
+            return jsonify({'ticket_id': ticket_id, 'device': None, 'tickets': []})
+        
+        limit = min(request.args.get('limit', 20, type=int) or 20, 100)
+        tickets = device_fingerprints.tickets_for_device(hashed, exclude_ticket_id=ticket_id, limit=limit)
+        
+        return jsonify({
+            'ticket_id': ticket_id,
+            'device': device_fingerprints.get_device(
+                hashed, user_limit=min(request.args.get('user_limit', 50, type=int) or 50, 200)
+            ),
+            'tickets': [{
+                'id': t.TicketID,
+                'subject': t.Subject,
+                'status': t.Status,
+                'user_id': t.UserID,
+                'created_by': t.CreatedBy,
+                'created_at': format_timestamp_with_tz(t.CreatedAt)
+            } for t in tickets]
+        })
+    except Exception as e:
+        logger.error(f"Error getting same-device tickets for {ticket_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/admin/active-conversations', methods=['GET'])
 @admin_required
 def get_active_conversations():
@@ -2038,21 +2152,17 @@ def get_active_conversations():
             Category, Ticket.CategoryID == Category.CategoryID
         ).filter(Ticket.Status.in_(['open', 'in_progress', 'escalated'])).order_by(Ticket.UpdatedAt.desc()).all()
         
+        # Last message time and unread count come from the denormalized ticket columns
         result = []
         for ticket, user, category in conversations:
-            # Get last message time
-            last_message = Message.query.filter_by(TicketID=ticket.TicketID).order_by(Message.CreatedAt.desc()).first()
-            
-            # Count unread admin messages (assuming we track this)
-            unread_count = Message.query.filter_by(TicketID=ticket.TicketID, IsAdminReply=False).count()
-            
             result.append({
                 'id': ticket.TicketID,
                 'subject': ticket.Subject,
                 'user_name': user.Name if user else None,
-                'category': category.Name,                'status': ticket.Status,
-                'last_message_at': format_timestamp_with_tz(last_message.CreatedAt) if last_message else format_timestamp_with_tz(ticket.CreatedAt),
-                'unread_count': min(unread_count, 5)  # Cap at 5 for display
+                'category': category.Name,
+                'status': ticket.Status,
+                'last_message_at': format_timestamp_with_tz(ticket.LastMessageAt or ticket.CreatedAt),
+                'unread_count': min(ticket.UnreadUserMessageCount or 0, 5)  # Cap at 5 for display
             })
         
         return jsonify(result)
@@ -2103,6 +2213,7 @@ def update_ticket_status(ticket_id):
                 CreatedAt=datetime.utcnow()
             )
             db.session.add(notification_message)
+            last_message = notification_message
             
             # Also add a system closure message
             if new_status == 'closed':
@@ -2114,6 +2225,10 @@ def update_ticket_status(ticket_id):
                     CreatedAt=datetime.utcnow()
                 )
                 db.session.add(closure_message)
+                last_message = closure_message
+            
+            db.session.flush()
+            record_ticket_message(ticket, last_message)
         
         db.session.commit()
         
@@ -2185,6 +2300,8 @@ def submit_feedback():
         )
         
         db.session.add(feedback_message)
+        db.session.flush()
+        record_ticket_message(ticket, feedback_message)
         db.session.commit()
         
         logger.info(f"Feedback submitted for ticket {ticket_id}: Rating={rating}")
@@ -2276,9 +2393,10 @@ def get_ticket_details(ticket_id):
         messages = Message.query.filter_by(TicketID=ticket_id).order_by(Message.CreatedAt).all()
         
         # Build message list with attachments
+        attachments_by_message = _load_ticket_attachments(ticket_id)
         message_list = []
         for msg in messages:
-            attachments = Attachment.query.filter_by(MessageID=msg.MessageID).all()
+            attachments = attachments_by_message.get(msg.MessageID, [])
             message_data = {
                 'content': msg.Content,
                 'is_admin': msg.IsAdminReply,
@@ -2581,10 +2699,46 @@ def get_ticket_escalation_history(ticket_id):
 # Import Bot Service and SLA Monitor
 from bot_service import bot_service
 from sla_monitor import sla_monitor
+from ticket_counters import ticket_counters
+from device_rollup import device_rollups
+from device_fingerprints import device_fingerprints
+from http_client import http_client
+from bot_answer_cache import BotAnswerCache
 
 # Initialize services
 bot_service.app = app
+bot_service.interaction_writer.app = app
+bot_service.stream_replies = app.config.get('BOT_STREAM_REPLIES', False)
+bot_service.turn_deadline_ms = app.config.get('BOT_TURN_DEADLINE_MS', 5000)
+bot_service.hedge_default_ms = app.config.get('BOT_HEDGE_DEFAULT_MS', 1000)
+bot_service.hedger.app = app
+bot_service.hedger.cooperative = socketio.async_mode == 'eventlet'
+bot_service.hedger.configure(pool_size=app.config.get('BOT_HEDGE_POOL_SIZE'))
+bot_service.answer_cache = BotAnswerCache(
+    maxsize=app.config.get('BOT_ANSWER_CACHE_SIZE', 5000),
+    ttl=app.config.get('BOT_ANSWER_CACHE_TTL', 6 * 3600),
+    prewarm_remote=app.config.get('BOT_ANSWER_CACHE_PREWARM_REMOTE', False),
+    prewarm_limit=app.config.get('BOT_ANSWER_CACHE_PREWARM_LIMIT', 200)
+)
+bot_service.answer_cache.enabled = app.config.get('BOT_ANSWER_CACHE', True)
+http_client.configure(
+    pool_maxsize=app.config.get('BOT_HTTP_POOL_SIZE'),
+    connect_timeout=app.config.get('BOT_CONNECT_TIMEOUT'),
+    read_timeout=app.config.get('BOT_READ_TIMEOUT')
+)
 sla_monitor.app = app
+ticket_counters.init_app(app, db, Ticket)
+outbox.app = app
+register_ticket_side_effects(outbox)
+location_service.http_enrichment = app.config.get('LOCATION_HTTP_ENRICHMENT', False)
+location_service.load_country_db(app.config.get('IP_COUNTRY_DB_PATH'))
+device_rollups.app = app
+device_fingerprints.app = app
+DeviceAnalytics.rollup_source = device_rollups.query
+
+# Register maintenance CLI commands (flask <command>)
+from maintenance_commands import register_commands
+register_commands(app)
 
 # Start SLA monitoring service only if tables exist
 try:
@@ -2605,6 +2759,21 @@ try:
 except Exception as e:
     logger.warning(f"SLA monitoring service not started: {e}")
 
+# Start outbox workers for ticket side effects (geolocation, bot replies, Odoo sync)
+outbox.start()
+
+# Fold per-ticket device analytics deltas into daily rollup rows
+device_rollups.start()
+
+# Fold device fingerprint events into the fingerprint index
+device_fingerprints.start()
+
+# Bulk-insert buffered bot interaction logs
+bot_service.interaction_writer.start()
+
+# Ask the bot the CommonQuery/FAQ questions up front so repeated questions hit the answer cache
+bot_service.answer_cache.start_prewarm(bot_service)
+
 # Import extended models
 from models import (
     Partner, SLALog, TicketStatusLog, AuditLog, EscalationRule,
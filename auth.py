@@ -66,6 +66,15 @@ def login():
         except:
             db.session.rollback()
         
+        # Separate transaction: a failing device index insert must not undo LastLogin
+        try:
+            from device_fingerprints import device_fingerprints
+            device_fingerprints.record_login(user)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: Could not index device fingerprint for user {user.Email}: {e}")
+        
         login_user(user)
         flash(f'Welcome back, {user.Name}!', 'success')
         return redirect(url_for('index'))
@@ -149,12 +158,22 @@ def register():
         try:
             db.session.add(new_user)
             db.session.commit()
-            flash('Registration successful! You can now log in with your credentials.', 'success')
-            return redirect(url_for('auth.login'))
         except Exception as e:
             db.session.rollback()
             flash('Registration failed. Please try again.', 'error')
             return redirect(url_for('auth.register'))
+        
+        # Separate transaction: a failing device index insert must not fail the sign-up
+        try:
+            from device_fingerprints import device_fingerprints
+            device_fingerprints.record_login(new_user)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: Could not index device fingerprint for new user {email}: {e}")
+        
+        flash('Registration successful! You can now log in with your credentials.', 'success')
+        return redirect(url_for('auth.login'))
     
     return render_template('register.html')
 
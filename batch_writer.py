@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Batch Writer
+Buffers high-volume log rows in memory and bulk-inserts them in the background
+"""
+
+import atexit
+import importlib
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class BatchWriter:
+    """Bounded queue of row dicts drained by a background flusher.
+
+    Rows are bulk-inserted every `batch_size` rows or `flush_interval_ms`,
+    whichever comes first, and once more at shutdown. When the queue is full
+    submit() waits up to `block_timeout` seconds (backpressure) and then drops
+    the row, counting it. The default does not wait: under eventlet without
+    monkey patching a blocking put would stall every greenlet.
+
+    `model` is a model class or a 'module:Class' path resolved on first use,
+    which keeps model imports out of service module import time.
+    `before_commit(rows)` runs in the insert transaction, for derived writes
+    (counters and the like) that must land atomically with the rows;
+    `after_commit(rows)` runs only once they are committed.
+    """
+
+    def __init__(self, name: str, model, app=None, max_queue: int = 10000,
+                 batch_size: int = 200, flush_interval_ms: int = 500,
+                 block_timeout: float = 0, before_commit: Callable[[List[Dict]], None] = None,
+                 after_commit: Callable[[List[Dict]], None] = None):
+        self.name = name
+        self.model = model
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.block_timeout = block_timeout
+        self.before_commit = before_commit
+        self.after_commit = after_commit
+        self.running = False
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'submitted': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'flushes': 0}
+
+    def _model_class(self):
+        if isinstance(self.model, str):
+            module_name, class_name = self.model.split(':')
+            self.model = getattr(importlib.import_module(module_name), class_name)
+        return self.model
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    # ------------------------------------------------------------------
+    # Producing
+    # ------------------------------------------------------------------
+
+    def submit(self, row: Dict) -> bool:
+        """Queue a row for insertion; returns False when it had to be dropped"""
+        if not self.running:
+            # No flusher (CLI, scripts): write straight through in the caller's context
+            return self._write([row], use_app_context=False)
+
+        try:
+            if self.block_timeout:
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            if self.stats['dropped'] % 1000 == 1:
+                logger.warning(f"{self.name} writer queue full, {self.stats['dropped']} rows dropped so far")
+            return False
+
+        self._count('submitted')
+        return True
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the background flusher and flush what is left at interpreter exit"""
+        if self.running:
+            return
+
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"{self.name} batch writer started")
+
+    def stop(self):
+        """Stop the flusher after writing everything still queued"""
+        if not self.running:
+            return
+
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._drain()
+        logger.info(f"{self.name} batch writer stopped: {self.stats}")
+
+    def _run(self):
+        while self.running:
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+
+    def _collect_batch(self) -> List[Dict]:
+        """Wait for the first row, then gather more until the batch is full or the interval ends"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        """Write all queued rows in batches (used at shutdown)"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        self._drain()
+
+    def _write(self, rows: List[Dict], use_app_context: bool = True) -> bool:
+        if use_app_context and self.app is not None:
+            with self.app.app_context():
+                return self._bulk_insert(rows)
+        return self._bulk_insert(rows)
+
+    def _bulk_insert(self, rows: List[Dict]) -> bool:
+        from app import db
+
+        try:
+            db.session.bulk_insert_mappings(self._model_class(), rows)
+            if self.before_commit:
+                self.before_commit(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._count('failed', len(rows))
+            logger.error(f"{self.name} writer failed to insert {len(rows)} rows: {e}")
+            return False
+
+        self._count('written', len(rows))
+        self._count('flushes')
+        if self.after_commit:
+            try:
+                self.after_commit(rows)
+            except Exception as e:
+                logger.error(f"{self.name} writer after-commit hook failed: {e}")
+        return True
+
+    def get_statistics(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({
+            'running': self.running,
+            'queued': self._queue.qsize(),
+            'max_queue': self._queue.maxsize,
+            'batch_size': self.batch_size,
+            'flush_interval_ms': int(self.flush_interval * 1000)
+        })
+        return stats
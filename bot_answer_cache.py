@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Bot Answer Cache
+Reuses bot answers for repeated (canned) questions, prewarmed from CommonQuery and FAQ
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Crude English suffix folding: "payments"/"payment", "declined"/"decline", "updating"/"update"
+SUFFIXES = ('ing', 'ed', 'es', 's')
+
+# Only answers with these fields are cached; per-call details are left out
+CACHED_FIELDS = ('response', 'confidence', 'intent', 'resolution_suggested')
+
+def _stem(word: str) -> str:
+    for suffix in SUFFIXES:
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+def normalize_question(text: str, stem: bool = True) -> str:
+    """Fold case, punctuation and whitespace (and optionally suffixes) out of a message"""
+    words = WORD_PATTERN.findall((text or '').lower())
+    if stem:
+        words = [_stem(word) for word in words]
+    return ' '.join(words)
+
+class BotAnswerCache:
+    """LRU/TTL cache of bot answers keyed by (config version, normalized text).
+
+    The config version in the key means answers from an old configuration
+    are never served; clear() drops them eagerly when the configuration
+    changes. prewarm() asks the active bot every CommonQuery question and
+    published FAQ question in the background, so the common ones hit from
+    the first customer on. Every process prewarms its own cache, so remote
+    providers (billed and rate limited) are only prewarmed when
+    prewarm_remote is set, and then for at most prewarm_limit questions.
+    """
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 6 * 3600, stem: bool = True,
+                 prewarm_pause: float = 0.05, prewarm_remote: bool = False, prewarm_limit: int = 200):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.stem = stem
+        self.enabled = True
+        self.prewarm_pause = prewarm_pause  # Seconds between prewarm calls, to go easy on remote providers
+        self.prewarm_remote = prewarm_remote
+        self.prewarm_limit = prewarm_limit  # Questions per run for remote providers
+        self._prewarm_thread = None
+        self._prewarm_requested = False
+        self._prewarm_lock = threading.Lock()
+        self.prewarm_stats = {'runs': 0, 'questions': 0, 'cached': 0, 'last_run_at': None}
+
+    def _key(self, message: str, version) -> Optional[tuple]:
+        normalized = normalize_question(message, self.stem)
+        return (version, normalized) if normalized else None
+
+    def get(self, message: str, version) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        key = self._key(message, version)
+        return self.cache.get(key) if key else None
+
+    def set(self, message: str, version, answer: Dict):
+        key = self._key(message, version)
+        if self.enabled and key:
+            self.cache.set(key, {field: answer.get(field) for field in CACHED_FIELDS})
+
+    def clear(self):
+        self.cache.clear()
+
+    # ------------------------------------------------------------------
+    # Prewarming
+    # ------------------------------------------------------------------
+
+    def start_prewarm(self, bot_service):
+        """Prewarm in a background thread; a request during a run triggers one more run"""
+        if not self.enabled or bot_service.app is None:
+            return
+
+        with self._prewarm_lock:
+            self._prewarm_requested = True
+            if self._prewarm_thread and self._prewarm_thread.is_alive():
+                return
+            self._prewarm_thread = threading.Thread(target=self._prewarm_loop, args=(bot_service,),
+                                                    name='bot-answer-prewarm', daemon=True)
+            self._prewarm_thread.start()
+
+    def _prewarm_loop(self, bot_service):
+        while True:
+            with self._prewarm_lock:
+                if not self._prewarm_requested:
+                    self._prewarm_thread = None
+                    return
+                self._prewarm_requested = False
+            try:
+                with bot_service.app.app_context():
+                    self.prewarm(bot_service)
+            except Exception as e:
+                logger.error(f"Error prewarming bot answer cache: {e}")
+
+    def prewarm(self, bot_service) -> int:
+        """Ask the active bot each canned question not cached yet; returns the number cached"""
+        from bot_service import HEDGED_BOT_TYPES
+
+        bot_config = bot_service._get_active_bot_config()
+        if not bot_config:
+            return 0
+        remote = bot_config['bot_type'] in HEDGED_BOT_TYPES
+        if remote and not self.prewarm_remote:
+            logger.info(f"Not prewarming bot answer cache for remote provider {bot_config['bot_type']}")
+            return 0
+        version = bot_service.config_version
+
+        questions = self._canned_questions()
+        limit = min(self.prewarm_limit, self.cache.maxsize) if remote else self.cache.maxsize
+        cached = 0
+        started_at = time.perf_counter()
+        for question in questions[:limit]:
+            if bot_service.config_version != version:
+                logger.info("Bot configuration changed during prewarm, stopping")
+                break
+            if self.get(question, version) is not None:
+                continue
+
+            answer = bot_service._call_bot_api(question, bot_config)
+            if bot_service._is_adequate(answer):
+                self.set(question, version, answer)
+                cached += 1
+            if self.prewarm_pause:
+                time.sleep(self.prewarm_pause)
+
+        self.prewarm_stats['runs'] += 1
+        self.prewarm_stats['questions'] = len(questions)
+        self.prewarm_stats['cached'] = cached
+        self.prewarm_stats['last_run_at'] = time.time()
+        logger.info(f"Bot answer cache prewarmed: {cached} of {len(questions)} questions cached "
+                    f"in {time.perf_counter() - started_at:.1f}s")
+        return cached
+
+    def _canned_questions(self) -> List[str]:
+        """CommonQuery and published FAQ questions, one per normalized form"""
+        from app import db, FAQ, CommonQuery
+
+        rows = db.session.query(CommonQuery.Question).all() + db.session.query(FAQ.question).filter(
+            FAQ.status == 'published', FAQ.deleted_at.is_(None)
+        ).all()
+        db.session.rollback()  # Release the connection before the (slow) bot calls
+
+        questions = {}
+        for (question,) in rows:
+            normalized = normalize_question(question, self.stem)
+            if normalized and normalized not in questions:
+                questions[normalized] = question
+        return list(questions.values())
+
+    def get_statistics(self) -> Dict:
+        return dict(self.cache.stats(), enabled=self.enabled, stem=self.stem, prewarm=dict(self.prewarm_stats))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Bot Latency Benchmark
+Drives BotService.process_user_message at a target rate against the local stub server
+
+Usage:
+    python bot_benchmark.py --providers dialogflow,rasa,custom,rules --qps 50 --duration 20
+    python bot_benchmark.py --providers custom --tail-rate 0.05 --tail-ms 4000   # exercise hedging
+
+By default a stub server (bot_stub_server.py) is started in-process; pass
+--endpoint to benchmark a stub or provider running elsewhere. No database is
+used: the configuration is injected and interaction logs are discarded.
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from bot_service import BotService
+from bot_stub_server import add_behavior_arguments, behavior_from_args, start_in_background
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_MESSAGES = [
+    'Hi, I cannot log in to my account',
+    'I forgot my password, please help',
+    'Where can I download my latest invoice?',
+    'I was charged twice for my subscription',
+    'The app shows an error when I upload a file',
+    'Dashboard is not working since this morning',
+    'I want to cancel my plan and get a refund',
+    'Hello, how do I change my email address?',
+    'Can you tell me about your enterprise pricing?',
+    'The export button is broken on Safari'
+]
+
+# api_endpoint for each provider type, relative to the stub base URL
+PROVIDER_PATHS = {
+    'dialogflow': '/dialogflow/sessions/benchmark:detectIntent',
+    'rasa': '/rasa',
+    'custom': '/custom',
+    'rules': ''
+}
+
+class _DiscardWriter:
+    """Stands in for the interaction log writer so runs need no database"""
+    running = True
+
+    def submit(self, row: Dict) -> bool:
+        return True
+
+def make_service(provider: str, base_url: str, hedge: bool, config_data: Dict = None,
+                 answer_cache: bool = False) -> BotService:
+    """A BotService with `provider` injected as its active configuration"""
+    service = BotService()
+    service.interaction_writer = _DiscardWriter()
+    # The sample set is small, so the answer cache would serve nearly everything
+    service.answer_cache.enabled = answer_cache
+    service._config_cache = {
+        'id': 1,
+        'name': f"benchmark-{provider}",
+        'bot_type': provider,
+        'api_endpoint': base_url + PROVIDER_PATHS[provider],
+        'api_key': 'benchmark',
+        'confidence_threshold': service.confidence_threshold,
+        'config_data': dict(config_data or {}, hedge=hedge)
+    }
+    service._config_version = ('benchmark', provider)
+    service._config_loaded = True
+    service.config_check_interval = math.inf
+    return service
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def run_provider(service: BotService, qps: float, duration: float, concurrency: int,
+                 stream: bool = False) -> Dict:
+    """Open-loop load: requests are scheduled at a fixed rate whatever the response times.
+
+    Latency is measured from each request's scheduled start, so queueing
+    behind slow calls is counted rather than hidden.
+    """
+    total = max(1, int(qps * duration))
+    latencies: List[float] = []
+    first_chunks: List[float] = []
+    outcomes = {'escalated': 0, 'errors': 0, 'bot_errors': 0}
+    outcomes_lock = threading.Lock()
+    randomizer = random.Random(42)
+
+    def one(scheduled_at: float, message: str):
+        first = []
+        on_chunk = (lambda chunk: first or first.append(time.perf_counter())) if stream else None
+        try:
+            result = service.process_user_message(message, on_chunk=on_chunk)
+        except Exception:
+            with outcomes_lock:
+                outcomes['errors'] += 1
+            return
+        finished = time.perf_counter()
+        latencies.append((finished - scheduled_at) * 1000)
+        if first:
+            first_chunks.append((first[0] - scheduled_at) * 1000)
+        with outcomes_lock:
+            if result.get('escalate_to_human'):
+                outcomes['escalated'] += 1
+            if result.get('intent') == 'bot_error':
+                outcomes['bot_errors'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in range(total):
+            scheduled_at = started + index / qps
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, scheduled_at, randomizer.choice(SAMPLE_MESSAGES))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    first_chunks.sort()
+    completed = len(latencies)
+    report = {
+        'requests': total,
+        'completed': completed,
+        'errors': outcomes['errors'],
+        'throughput_rps': round(completed / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 1),
+        'p95_ms': round(percentile(latencies, 0.95), 1),
+        'p99_ms': round(percentile(latencies, 0.99), 1),
+        'max_ms': round(latencies[-1], 1) if latencies else 0.0,
+        'escalation_rate': round(outcomes['escalated'] / completed, 3) if completed else 0.0,
+        'bot_error_rate': round(outcomes['bot_errors'] / completed, 3) if completed else 0.0,
+        'hedging': service.hedger.get_statistics()
+    }
+    if stream:
+        report['first_chunk_p50_ms'] = round(percentile(first_chunks, 0.50), 1)
+        report['first_chunk_p95_ms'] = round(percentile(first_chunks, 0.95), 1)
+    return report
+
+def print_report(reports: Dict[str, Dict]):
+    columns = ['requests', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+               'escalation_rate', 'bot_error_rate']
+    print(f"{'provider':<12}" + ''.join(f"{column:>16}" for column in columns))
+    for provider, report in reports.items():
+        print(f"{provider:<12}" + ''.join(f"{report[column]:>16}" for column in columns))
+    for provider, report in reports.items():
+        hedging = report['hedging']
+        if hedging['hedged']:
+            print(f"{provider}: hedged {hedging['hedged']}/{hedging['turns']} turns, "
+                  f"hedge won {hedging['hedge_wins']}, deadline hit {hedging['deadline_exceeded']}")
+        if 'first_chunk_p50_ms' in report:
+            print(f"{provider}: first chunk p50 {report['first_chunk_p50_ms']}ms, "
+                  f"p95 {report['first_chunk_p95_ms']}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BotService against local stub providers')
+    parser.add_argument('--providers', default='dialogflow,rasa,custom,rules',
+                        help='Comma-separated bot types to benchmark')
+    parser.add_argument('--qps', type=float, default=20, help='Target requests per second')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per provider')
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum requests in flight')
+    parser.add_argument('--endpoint', default=None, help='Base URL of an already running stub server')
+    parser.add_argument('--no-hedge', action='store_true', help='Disable hedged provider calls')
+    parser.add_argument('--answer-cache', action='store_true', help='Keep the bot answer cache on')
+    parser.add_argument('--stream', action='store_true', help='Request streamed replies and report time to first chunk')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    server = None
+    base_url = args.endpoint
+    if not base_url:
+        server = start_in_background(behavior_from_args(args))
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+    reports = {}
+    try:
+        for provider in [name.strip() for name in args.providers.split(',') if name.strip()]:
+            if provider not in PROVIDER_PATHS:
+                parser.error(f"unknown provider {provider!r} (choose from {', '.join(PROVIDER_PATHS)})")
+            service = make_service(provider, base_url, hedge=not args.no_hedge,
+                                   config_data={'stream': True} if args.stream else None,
+                                   answer_cache=args.answer_cache)
+            reports[provider] = run_provider(service, args.qps, args.duration, args.concurrency, args.stream)
+    finally:
+        if server:
+            server.shutdown()
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_report(reports)
+
+if __name__ == '__main__':
+    main()
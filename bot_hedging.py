@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Hedged Bot Calls
+Races a slow primary bot provider against a secondary under one deadline per turn
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+try:
+    from eventlet import tpool
+except ImportError:  # Only needed when serving under eventlet
+    tpool = None
+
+logger = logging.getLogger(__name__)
+
+class BotHedger:
+    """Runs one bot turn as a hedged request.
+
+    The primary call starts at once. If it has not produced an adequate answer
+    after `hedge_after_ms` (normally the primary's observed p95), or fails
+    before that, the secondary is started too and the first adequate answer
+    wins. At `deadline_ms` the best answer so far is returned, or None.
+    """
+
+    def __init__(self, app=None, cooperative: bool = False, pool_size: int = 16):
+        self.app = app
+        # Under eventlet, wait in a native thread so other greenlets keep running
+        self.cooperative = cooperative
+        self.stats = {
+            'turns': 0,
+            'primary_fast': 0,  # Answered before the hedge fired
+            'hedged': 0,  # Secondary was started
+            'primary_wins': 0,  # Primary answered first after hedging
+            'hedge_wins': 0,  # Secondary answered first
+            'deadline_exceeded': 0,
+            'no_answer': 0,
+            'saturated': 0  # Secondary skipped because the pool was busy
+        }
+        self._stats_lock = threading.Lock()
+        # Losing calls finish here in the background; in_flight counts calls queued or running
+        self.in_flight = 0
+        self._build_executor(pool_size)
+
+    def _build_executor(self, pool_size: int):
+        self.pool_size = pool_size
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='bot-hedge')
+
+    def configure(self, pool_size: int = None):
+        """Apply app configuration (call once at startup)"""
+        if pool_size and pool_size != self.pool_size:
+            old_executor = self._executor
+            self._build_executor(pool_size)
+            old_executor.shutdown(wait=False)
+
+    @property
+    def saturated(self) -> bool:
+        """Every pool thread is taken: new calls would only queue behind slow ones"""
+        return self.in_flight >= self.pool_size
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        def run():
+            if self.app is not None:
+                with self.app.app_context():
+                    return fn(*args)
+            return fn(*args)
+
+        with self._stats_lock:
+            self.in_flight += 1
+        future = self._executor.submit(run)
+        future.add_done_callback(self._call_finished)
+        return future
+
+    def _call_finished(self, future: Future):
+        with self._stats_lock:
+            self.in_flight -= 1
+
+    def _wait(self, futures, timeout: float):
+        timeout = max(0.0, timeout)
+        if self.cooperative and tpool is not None and threading.current_thread() is threading.main_thread():
+            return tpool.execute(wait, futures, timeout, FIRST_COMPLETED)
+        return wait(futures, timeout, return_when=FIRST_COMPLETED)
+
+    def call(self, primary: Callable[[], Dict], secondary: Callable[[], Dict],
+             adequate: Callable[[Dict], bool], hedge_after_ms: float,
+             deadline_ms: float, secondary_inline: bool = False) -> Optional[Dict]:
+        """Return the winning result (tagged with 'answered_by'), or None when nothing usable arrived.
+
+        With secondary_inline the secondary is cheap and local, so it runs in
+        the calling thread instead of the pool.
+        """
+        self._count('turns')
+        started = time.perf_counter()
+        deadline = started + deadline_ms / 1000.0
+        best = None
+
+        primary_future = self._submit(primary)
+        self._wait([primary_future], min(hedge_after_ms, deadline_ms) / 1000.0)
+
+        if primary_future.done():
+            result = self._result(primary_future, 'primary')
+            if result is not None and adequate(result):
+                self._count('primary_fast')
+                return result
+            best = result
+
+        if not secondary_inline and self.saturated:
+            # Starting the secondary would only queue it; give the primary the rest of the turn
+            self._count('saturated')
+            if not primary_future.done():
+                self._wait([primary_future], deadline - time.perf_counter())
+                if primary_future.done():
+                    best = self._result(primary_future, 'primary') or best
+                else:
+                    primary_future.cancel()
+                    self._count('deadline_exceeded')
+                    logger.warning(f"Bot turn hit its {deadline_ms:.0f}ms deadline")
+            if best is None:
+                self._count('no_answer')
+            return best
+
+        self._count('hedged')
+        logger.info(f"Hedging bot turn after {(time.perf_counter() - started) * 1000:.0f}ms")
+
+        if secondary_inline:
+            secondary_future = Future()
+            try:
+                secondary_future.set_result(secondary())
+            except Exception as e:
+                secondary_future.set_exception(e)
+        else:
+            secondary_future = self._submit(secondary)
+
+        pending = {secondary_future} if primary_future.done() else {primary_future, secondary_future}
+        names = {primary_future: 'primary', secondary_future: 'secondary'}
+        while pending:
+            done, pending = self._wait(pending, deadline - time.perf_counter())
+            if not done:
+                break
+            for future in done:
+                result = self._result(future, names[future])
+                if result is None:
+                    continue
+                if adequate(result):
+                    self._count('primary_wins' if names[future] == 'primary' else 'hedge_wins')
+                    self._cancel(pending)
+                    return result
+                if best is None or result.get('confidence', 0) > best.get('confidence', 0):
+                    best = result
+
+        if pending:
+            self._cancel(pending)
+            self._count('deadline_exceeded')
+            logger.warning(f"Bot turn hit its {deadline_ms:.0f}ms deadline")
+        if best is None:
+            self._count('no_answer')
+        return best
+
+    def _cancel(self, futures):
+        """Drop losing calls that have not started yet (running HTTP calls end at their read timeout)"""
+        for future in futures:
+            future.cancel()
+
+    def _result(self, future: Future, name: str) -> Optional[Dict]:
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Hedged bot call ({name}) failed: {e}")
+            return None
+        if result is not None:
+            result['answered_by'] = name
+        return result
+
+    def get_statistics(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        hedged = stats['hedged']
+        stats['hedge_win_rate'] = round(stats['hedge_wins'] / hedged, 3) if hedged else 0.0
+        stats['pool_size'] = self.pool_size
+        stats['in_flight'] = self.in_flight
+        return stats
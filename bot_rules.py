@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Bot Rule Engine
+Keyword rules compiled into a single matcher with weighted intent scoring
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Built-in rules, used when the active configuration does not define its own.
+# config_data['rules'] uses the same shape; keywords may be plain strings or
+# {"text": ..., "weight": ...} objects.
+DEFAULT_RULES = [
+    {
+        'intent': 'greeting',
+        'keywords': ['hello', 'hi', 'hey', 'good morning', 'good afternoon'],
+        'response': 'Hello! I\'m here to help you with your support request. How can I assist you today?',
+        'confidence': 0.9,
+        'weight': 0.5,  # A greeting only wins when nothing more specific matched
+        'resolution_suggested': False
+    },
+    {
+        'intent': 'password_help',
+        'keywords': ['password', 'login', 'sign in', 'access'],
+        'response': 'For password and login issues, I can help you reset your password. Would you like me to send you a password reset link to your registered email?',
+        'confidence': 0.8,
+        'resolution_suggested': True
+    },
+    {
+        'intent': 'billing_inquiry',
+        'keywords': ['billing', 'payment', 'invoice', 'charge'],
+        'response': 'I can help with billing questions. Are you looking for your latest invoice, need to update payment information, or have a question about charges?',
+        'confidence': 0.8,
+        'resolution_suggested': False
+    },
+    {
+        'intent': 'technical_issue',
+        'keywords': ['bug', 'error', 'broken', 'not working'],
+        'response': 'I understand you\'re experiencing a technical issue. Can you please describe what you were trying to do when the problem occurred?',
+        'confidence': 0.7,
+        'resolution_suggested': False
+    },
+    {
+        'intent': 'cancellation_request',
+        'keywords': ['cancel', 'refund', 'money back'],
+        'response': 'I\'ll connect you with a human agent who can help with cancellation and refund requests. Please hold on.',
+        'confidence': 0.6,
+        'resolution_suggested': False
+    }
+]
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+class RuleEngine:
+    """Matches a message against every rule's keywords in one regex pass.
+
+    All keywords are compiled into one alternation, longest first, anchored
+    at the start of a word (so "charges" matches "charge" but "this" does not
+    match "hi"). Each distinct keyword found adds its weight times the rule
+    weight to the rule's score; the highest score wins and ties go to the rule
+    listed first.
+    """
+
+    def __init__(self, rules: List[Dict] = None):
+        self.rules: List[Dict] = []
+        self._keywords: Dict[str, List] = {}
+        self._pattern = None
+        self.compile(DEFAULT_RULES if rules is None else rules)
+
+    def compile(self, rules: List[Dict]):
+        """Build the matcher for `rules`; invalid rules are skipped with a warning"""
+        compiled_rules = []
+        keywords: Dict[str, List] = {}
+
+        for rule in rules:
+            if not isinstance(rule, dict) or not rule.get('intent') or not rule.get('response'):
+                logger.warning(f"Skipping invalid bot rule: {rule!r}")
+                continue
+
+            index = len(compiled_rules)
+            compiled_rules.append(rule)
+            rule_weight = float(rule.get('weight', 1.0))
+            for keyword in rule.get('keywords') or []:
+                if isinstance(keyword, dict):
+                    text, weight = keyword.get('text', ''), float(keyword.get('weight', 1.0))
+                else:
+                    text, weight = keyword, 1.0
+                text = _normalize(str(text))
+                if text:
+                    keywords.setdefault(text, []).append((index, weight * rule_weight))
+
+        pattern = None
+        if keywords:
+            alternatives = sorted(keywords, key=len, reverse=True)
+            pattern = re.compile(
+                r'(?<!\w)(?:' + '|'.join(re.escape(k).replace(r'\ ', r'\s+') for k in alternatives) + ')'
+            )
+
+        # Swap in the new state together so concurrent readers see one rule set or the other
+        self.rules, self._keywords, self._pattern = compiled_rules, keywords, pattern
+        logger.info(f"Compiled {len(compiled_rules)} bot rules with {len(keywords)} keywords")
+
+    def score(self, message: str) -> List[Dict]:
+        """Matching rules with their scores, best first"""
+        rules, keywords, pattern = self.rules, self._keywords, self._pattern
+        if not pattern or not message:
+            return []
+
+        found = {_normalize(m.group(0)) for m in pattern.finditer(message.lower())}
+        scores: Dict[int, float] = {}
+        for keyword in found:
+            for index, weight in keywords[keyword]:
+                scores[index] = scores.get(index, 0.0) + weight
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [{'rule': rules[index], 'score': score} for index, score in ranked]
+
+    def match(self, message: str) -> Optional[Dict]:
+        """Best matching rule, or None"""
+        scored = self.score(message)
+        return scored[0]['rule'] if scored else None
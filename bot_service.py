@@ -6,12 +6,33 @@ Handles Level 0 chatbot responses with fallback to human agents
 
 import json
 import logging
+import re
+import threading
+import time
 import requests
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+from batch_writer import BatchWriter
+from bot_answer_cache import BotAnswerCache
+from bot_hedging import BotHedger
+from bot_rules import DEFAULT_RULES, RuleEngine
+from http_client import http_client
+from provider_health import ProviderHealth
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Remote providers whose calls are hedged; the local engines answer in microseconds
+HEDGED_BOT_TYPES = ('dialogflow', 'rasa', 'custom')
+
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+def split_sentences(text: str) -> List[str]:
+    """Split a reply into sentence chunks (each keeps its trailing space, except the last)"""
+    parts = [part for part in SENTENCE_BREAK.split(text or '') if part]
+    return [part + ' ' for part in parts[:-1]] + parts[-1:]
+
 class BotService:
     """Manages bot interactions and escalation logic"""
     
@@ -20,11 +41,57 @@ class BotService:
         self.confidence_threshold = 0.7
         self.max_bot_attempts = 3
         
+        # Active configuration cached in process, keyed by (id, updated_at) of the active row.
+        # Writers in this process call invalidate_config_cache(); changes made elsewhere are
+        # picked up by a cheap version check every config_check_interval seconds.
+        self.config_check_interval = 30
+        self._config_cache = None
+        self._config_version = None
+        self._config_loaded = False
+        self._config_checked_at = 0.0
+        self._config_lock = threading.Lock()
+        
+        # Interaction logs are buffered and bulk-inserted off the request path; each flush
+        # also bumps Tickets.bot_attempts in the same transaction
+        self.interaction_writer = BatchWriter('bot_interactions', 'models:BotInteraction',
+                                              before_commit=self._count_flushed_attempts,
+                                              after_commit=self._settle_flushed_attempts)
+        
+        # Per-ticket attempt counts known to this process. Misses fall back to
+        # Tickets.bot_attempts plus rows still waiting in the writer queue.
+        self._attempt_counts = TTLCache(maxsize=10000, ttl=60)
+        self._pending_attempts: Dict[int, int] = {}
+        self._attempts_lock = threading.Lock()
+        
+        # Keyword rules per configuration id (the active one and any hedge secondary),
+        # recompiled from config_data['rules'] when that configuration changes
+        self._rule_engines: Dict[Optional[int], Tuple[Tuple, RuleEngine]] = {}
+        self._rules_lock = threading.Lock()
+        
+        # Stream partial replies to callers that pass on_chunk (BOT_STREAM_REPLIES)
+        self.stream_replies = False
+        self.first_chunk_latency = ProviderHealth('bot_first_chunk')
+        
+        # Hedged provider calls: once the primary is slower than its observed p95, a
+        # secondary (config_data.hedge_config_id, else the keyword rules) races it
+        self.hedger = BotHedger()
+        self.provider_latency: Dict[int, ProviderHealth] = {}
+        self.turn_deadline_ms = 5000
+        self.hedge_default_ms = 1000  # Hedge delay until the primary has enough samples
+        self._hedge_configs = TTLCache(maxsize=16, ttl=60)
+        
+        # Answers to repeated questions, keyed by normalized text and config version
+        self.answer_cache = BotAnswerCache()
+        
     def process_user_message(self, message: str, user_id: int = None, 
-                           ticket_id: int = None, session_id: str = None) -> Dict:
+                           ticket_id: int = None, session_id: str = None,
+                           on_chunk: Callable[[str], None] = None) -> Dict:
         """
         Process user message through bot and determine if escalation is needed
         
+        With on_chunk, the reply is also passed on in pieces as it becomes available:
+        as streamed by providers that support it, otherwise sentence by sentence.
+        
         Returns:
             {
                 'bot_response': str,
@@ -42,7 +109,22 @@ class BotService:
                 return self._fallback_response(message, ticket_id, session_id)
             
             # Process message through bot
-            bot_response = self._call_bot_api(message, bot_config)
+            if on_chunk:
+                on_chunk = self._timed_chunks(on_chunk)
+            version = self.config_version
+            bot_response = self.answer_cache.get(message, version)
+            if bot_response:
+                bot_response = dict(bot_response)
+                self._stream_sentences(bot_response, on_chunk)
+            else:
+                if self._should_hedge(bot_config, on_chunk):
+                    bot_response = self._call_hedged(message, bot_config)
+                    self._stream_sentences(bot_response, on_chunk)
+                else:
+                    bot_response = self._call_bot_api(message, bot_config, on_chunk)
+                # A hedge's answer stands in for the configured bot only for this turn
+                if self._is_adequate(bot_response) and bot_response.get('answered_by') != 'secondary':
+                    self.answer_cache.set(message, version, bot_response)
             
             # Determine if escalation is needed
             escalate = self._should_escalate(bot_response, ticket_id)
@@ -71,40 +153,186 @@ class BotService:
             return self._fallback_response(message, ticket_id, session_id)
     
     def _get_active_bot_config(self) -> Optional[Dict]:
-        """Get active bot configuration"""
+        """Get active bot configuration (cached; treat the returned dict as read-only)"""
+        if self._config_loaded and time.monotonic() - self._config_checked_at < self.config_check_interval:
+            return self._config_cache
+        
+        with self._config_lock:
+            if self._config_loaded and time.monotonic() - self._config_checked_at < self.config_check_interval:
+                return self._config_cache
+            
+            try:
+                version = self._get_active_config_version()
+                if not self._config_loaded or version != self._config_version:
+                    changed = self._config_loaded
+                    self._config_cache = self._load_active_bot_config()
+                    self._config_version = version
+                    self._config_loaded = True
+                    logger.info(f"Loaded bot configuration version {version}")
+                    if changed:
+                        # Changed by another process: cached answers belong to the old configuration
+                        self.answer_cache.clear()
+                        self.answer_cache.start_prewarm(self)
+                self._config_checked_at = time.monotonic()
+                return self._config_cache
+            except Exception as e:
+                logger.error(f"Error getting bot config: {e}")
+                # Keep serving the last good configuration while the database is unavailable
+                return self._config_cache
+    
+    def _get_active_config_version(self) -> Optional[Tuple]:
+        """(id, updated_at) of the active configuration row, None when there is none"""
         from app import db
         from models import BotConfiguration
         
-        try:
-            config = BotConfiguration.query.filter_by(is_active=True).first()
-            if config:
-                return {
-                    'id': config.id,
-                    'name': config.name,
-                    'bot_type': config.bot_type,
-                    'api_endpoint': config.api_endpoint,
-                    'api_key': config.api_key,
-                    'confidence_threshold': config.confidence_threshold,
-                    'config_data': json.loads(config.config_data) if config.config_data else {}
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Error getting bot config: {e}")
-            return None
+        row = db.session.query(BotConfiguration.id, BotConfiguration.updated_at).filter(
+            BotConfiguration.is_active == True
+        ).order_by(BotConfiguration.id).first()
+        return (row.id, row.updated_at) if row else None
     
-    def _call_bot_api(self, message: str, bot_config: Dict) -> Dict:
+    def _load_active_bot_config(self) -> Optional[Dict]:
+        """Load and parse the active configuration row"""
+        from models import BotConfiguration
+        
+        config = BotConfiguration.query.filter_by(is_active=True).order_by(BotConfiguration.id).first()
+        return self._config_to_dict(config) if config else None
+    
+    def _config_to_dict(self, config) -> Dict:
+        return {
+            'id': config.id,
+            'name': config.name,
+            'bot_type': config.bot_type,
+            'api_endpoint': config.api_endpoint,
+            'api_key': config.api_key,
+            'confidence_threshold': config.confidence_threshold,
+            'config_data': json.loads(config.config_data) if config.config_data else {},
+            'updated_at': config.updated_at
+        }
+    
+    def invalidate_config_cache(self):
+        """Drop the cached configuration; the next message reloads it"""
+        with self._config_lock:
+            self._config_loaded = False
+            self._config_cache = None
+            self._config_version = None
+        self._hedge_configs.clear()
+        self.answer_cache.clear()
+        self.answer_cache.start_prewarm(self)
+        logger.info("Bot configuration cache invalidated")
+    
+    @property
+    def config_version(self) -> Optional[Tuple]:
+        """Version stamp of the cached configuration, for caches derived from it"""
+        return self._config_version
+    
+    def _call_bot_api(self, message: str, bot_config: Dict,
+                      on_chunk: Callable[[str], None] = None) -> Dict:
         """Call external bot API (Dialogflow, Rasa, etc.)"""
         
         bot_type = bot_config['bot_type']
         
         if bot_type == 'dialogflow':
-            return self._call_dialogflow(message, bot_config)
+            result = self._call_dialogflow(message, bot_config)
         elif bot_type == 'rasa':
-            return self._call_rasa(message, bot_config)
+            result = self._call_rasa(message, bot_config)
         elif bot_type == 'custom':
-            return self._call_custom_bot(message, bot_config)
+            result = self._call_custom_bot(message, bot_config, on_chunk)
+        elif bot_type == 'faq':
+            result = self._call_faq_index(message, bot_config)
+        else:
+            result = self._get_rule_based_response(message, bot_config)
+        
+        if not result.get('streamed'):
+            self._stream_sentences(result, on_chunk)
+        return result
+    
+    def _stream_sentences(self, result: Dict, on_chunk: Callable[[str], None] = None):
+        """Pass a finished reply on sentence by sentence (replies headed for escalation are not streamed)"""
+        if on_chunk and result.get('confidence', 0) >= self.confidence_threshold:
+            for sentence in split_sentences(result.get('response')):
+                on_chunk(sentence)
+    
+    def _should_hedge(self, bot_config: Dict, on_chunk: Callable[[str], None] = None) -> bool:
+        options = bot_config.get('config_data') or {}
+        if bot_config['bot_type'] not in HEDGED_BOT_TYPES or not options.get('hedge', True):
+            return False
+        if on_chunk and bot_config['bot_type'] == 'custom' and options.get('stream'):
+            # A provider stream goes straight to the caller; a hedge could only replace it halfway
+            return False
+        # With every hedge thread busy the turn would just queue, so call the provider directly
+        return not self.hedger.saturated
+    
+    def _call_hedged(self, message: str, bot_config: Dict) -> Dict:
+        """Call the provider with a hedge and an overall deadline for the turn"""
+        options = bot_config.get('config_data') or {}
+        health = self._provider_health(bot_config)
+        secondary_config = self._get_hedge_config(options.get('hedge_config_id'), bot_config)
+        
+        if secondary_config:
+            secondary = lambda: self._call_bot_api(message, secondary_config)
         else:
-            return self._get_rule_based_response(message)
+            secondary = lambda: self._get_rule_based_response(message, bot_config)
+        
+        result = self.hedger.call(
+            primary=lambda: self._timed_provider_call(message, bot_config, health),
+            secondary=secondary,
+            adequate=self._is_adequate,
+            hedge_after_ms=self._hedge_delay(health),
+            deadline_ms=options.get('turn_deadline_ms', self.turn_deadline_ms),
+            secondary_inline=secondary_config is None
+        )
+        return result or self._get_fallback_bot_response(message)
+    
+    def _timed_provider_call(self, message: str, bot_config: Dict, health: ProviderHealth) -> Dict:
+        started = time.perf_counter()
+        result = self._call_bot_api(message, bot_config)
+        health.record((time.perf_counter() - started) * 1000, success=result.get('intent') != 'bot_error')
+        return result
+    
+    def _is_adequate(self, result: Dict) -> bool:
+        return result.get('intent') != 'bot_error' and result.get('confidence', 0) >= self.confidence_threshold
+    
+    def _provider_health(self, bot_config: Dict) -> ProviderHealth:
+        health = self.provider_latency.get(bot_config['id'])
+        if health is None:
+            health = self.provider_latency.setdefault(
+                bot_config['id'], ProviderHealth(f"{bot_config['bot_type']}:{bot_config['name']}")
+            )
+        return health
+    
+    def _hedge_delay(self, health: ProviderHealth) -> float:
+        """Hedge once the primary is slower than its p95 (bucketed), given enough history"""
+        p95 = health.percentile(0.95) if health.calls >= 20 else None
+        return p95 or self.hedge_default_ms
+    
+    def _get_hedge_config(self, config_id, primary_config: Dict) -> Optional[Dict]:
+        """The secondary BotConfiguration named by hedge_config_id, if any"""
+        if not config_id or config_id == primary_config['id']:
+            return None
+        
+        config = self._hedge_configs.get(config_id)
+        if config is None:
+            from models import BotConfiguration
+            
+            row = BotConfiguration.query.get(config_id)
+            if not row:
+                logger.warning(f"Hedge bot configuration {config_id} not found")
+                return None
+            config = self._config_to_dict(row)
+            self._hedge_configs.set(config_id, config)
+        return config
+    
+    def _timed_chunks(self, on_chunk: Callable[[str], None]) -> Callable[[str], None]:
+        """Wrap on_chunk to record the time to the first chunk"""
+        started = time.perf_counter()
+        first = [True]
+        
+        def timed(chunk: str):
+            if first[0]:
+                first[0] = False
+                self.first_chunk_latency.record((time.perf_counter() - started) * 1000, success=True)
+            on_chunk(chunk)
+        return timed
     
     def _call_dialogflow(self, message: str, bot_config: Dict) -> Dict:
         """Call Google Dialogflow API"""
@@ -125,7 +353,7 @@ class BotService:
                 }
             }
             
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=10)
+            response = http_client.post(endpoint, headers=headers, json=payload)
             
             if response.status_code == 200:
                 data = response.json()
@@ -153,7 +381,7 @@ class BotService:
                 'message': message
             }
             
-            response = requests.post(endpoint, json=payload, timeout=10)
+            response = http_client.post(endpoint, json=payload)
             
             if response.status_code == 200:
                 data = response.json()
@@ -177,7 +405,8 @@ class BotService:
             logger.error(f"Rasa request error: {e}")
             return self._get_fallback_bot_response(message)
     
-    def _call_custom_bot(self, message: str, bot_config: Dict) -> Dict:
+    def _call_custom_bot(self, message: str, bot_config: Dict,
+                         on_chunk: Callable[[str], None] = None) -> Dict:
         """Call custom bot API"""
         try:
             endpoint = bot_config['api_endpoint']
@@ -188,9 +417,16 @@ class BotService:
                 'config': bot_config['config_data']
             }
             
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=10)
+            # Custom bots with config_data.stream may answer with NDJSON deltas
+            stream = bool(on_chunk and (bot_config['config_data'] or {}).get('stream'))
+            if stream:
+                payload['stream'] = True
+            
+            response = http_client.post(endpoint, headers=headers, json=payload, stream=stream)
             
             if response.status_code == 200:
+                if stream and response.headers.get('Content-Type', '').startswith('application/x-ndjson'):
+                    return self._read_custom_stream(response, message, on_chunk)
                 data = response.json()
                 return {
                     'response': data.get('response', 'Let me connect you with a human agent.'),
@@ -205,59 +441,111 @@ class BotService:
             logger.error(f"Custom bot request error: {e}")
             return self._get_fallback_bot_response(message)
     
-    def _get_rule_based_response(self, message: str) -> Dict:
-        """Simple rule-based responses for common queries"""
+    def _read_custom_stream(self, response, message: str, on_chunk: Callable[[str], None]) -> Dict:
+        """Read a streamed custom bot reply.
         
-        message_lower = message.lower()
+        Each line is a JSON object: {"delta": "..."} for a piece of the reply, and a
+        final {"done": true, "confidence": ..., "intent": ..., "resolved": ...}. Any
+        line may carry "confidence"; deltas are held back until one does, and are
+        only passed on if it reaches the confidence threshold, so replies headed for
+        escalation are never shown. Providers that send their confidence up front
+        (before the first delta) stream live, others in one piece at the end.
+        """
+        parts = []
+        final = {}
+        confidence = None
+        sent = 0
+        try:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if 'confidence' in event:
+                        confidence = event['confidence']
+                    if event.get('delta'):
+                        parts.append(event['delta'])
+                    if confidence is not None and confidence >= self.confidence_threshold:
+                        for part in parts[sent:]:
+                            on_chunk(part)
+                        sent = len(parts)
+                    if event.get('done'):
+                        final = event
+                        break
+        except ValueError as e:
+            logger.error(f"Custom bot stream error: {e}")
+            return self._get_fallback_bot_response(message)
         
-        # Common patterns and responses
-        if any(word in message_lower for word in ['hello', 'hi', 'hey', 'good morning', 'good afternoon']):
-            return {
-                'response': 'Hello! I\'m here to help you with your support request. How can I assist you today?',
-                'confidence': 0.9,
-                'intent': 'greeting',
-                'resolution_suggested': False
-            }
+        reply = final.get('response') or ''.join(parts)
+        if not reply:
+            return self._get_fallback_bot_response(message)
         
-        elif any(word in message_lower for word in ['password', 'login', 'sign in', 'access']):
-            return {
-                'response': 'For password and login issues, I can help you reset your password. Would you like me to send you a password reset link to your registered email?',
-                'confidence': 0.8,
-                'intent': 'password_help',
-                'resolution_suggested': True
-            }
+        return {
+            'response': reply,
+            'confidence': confidence if confidence is not None else 0.5,
+            'intent': final.get('intent'),
+            'resolution_suggested': final.get('resolved', False),
+            'streamed': bool(sent)
+        }
+    
+    def _call_faq_index(self, message: str, bot_config: Dict) -> Dict:
+        """Answer from the in-process FAQ/CommonQuery index, falling back to keyword rules"""
+        from faq_retrieval import faq_index
         
-        elif any(word in message_lower for word in ['billing', 'payment', 'invoice', 'charge']):
-            return {
-                'response': 'I can help with billing questions. Are you looking for your latest invoice, need to update payment information, or have a question about charges?',
-                'confidence': 0.8,
-                'intent': 'billing_inquiry',
-                'resolution_suggested': False
-            }
+        options = bot_config.get('config_data') or {}
+        faq_index.refresh()
+        matches = faq_index.search(message, top_k=options.get('top_k', 3), language=options.get('language', options.get('default_language')))
         
-        elif any(word in message_lower for word in ['bug', 'error', 'broken', 'not working']):
+        if matches and matches[0]['confidence'] >= options.get('min_confidence', 0.35):
+            best = matches[0]
             return {
-                'response': 'I understand you\'re experiencing a technical issue. Can you please describe what you were trying to do when the problem occurred?',
-                'confidence': 0.7,
-                'intent': 'technical_issue',
-                'resolution_suggested': False
+                'response': best['answer'],
+                'confidence': best['confidence'],
+                'intent': f"{best['source']}:{best['id']}",
+                'resolution_suggested': True,
+                'suggestions': [{'source': m['source'], 'id': m['id'], 'question': m['question']} for m in matches[1:]]
             }
         
-        elif any(word in message_lower for word in ['cancel', 'refund', 'money back']):
-            return {
-                'response': 'I\'ll connect you with a human agent who can help with cancellation and refund requests. Please hold on.',
-                'confidence': 0.6,
-                'intent': 'cancellation_request',
-                'resolution_suggested': False
-            }
+        return self._get_rule_based_response(message, bot_config)
+    
+    def _get_rule_based_response(self, message: str, bot_config: Dict = None) -> Dict:
+        """Keyword rule responses for common queries (see bot_rules)"""
         
-        else:
+        rule = self._rules_for(bot_config).match(message)
+        
+        if rule:
             return {
-                'response': 'Thank you for your message. Let me connect you with one of our human support agents who can better assist you with your specific request.',
-                'confidence': 0.4,
-                'intent': 'general_inquiry',
-                'resolution_suggested': False
+                'response': rule['response'],
+                'confidence': rule.get('confidence', 0.7),
+                'intent': rule['intent'],
+                'resolution_suggested': rule.get('resolution_suggested', False)
             }
+        
+        return {
+            'response': 'Thank you for your message. Let me connect you with one of our human support agents who can better assist you with your specific request.',
+            'confidence': 0.4,
+            'intent': 'general_inquiry',
+            'resolution_suggested': False
+        }
+    
+    def _rules_for(self, bot_config: Dict = None) -> RuleEngine:
+        """Rule engine compiled from this configuration's rules, recompiled when it changes"""
+        config_id = (bot_config or {}).get('id')
+        version = (config_id, (bot_config or {}).get('updated_at'))
+        cached = self._rule_engines.get(config_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        with self._rules_lock:
+            cached = self._rule_engines.get(config_id)
+            if cached and cached[0] == version:
+                return cached[1]
+            rules = ((bot_config or {}).get('config_data') or {}).get('rules')
+            if not isinstance(rules, list) or not rules:
+                rules = DEFAULT_RULES
+            engine = RuleEngine(rules)
+            self._rule_engines[config_id] = (version, engine)
+            return engine
     
     def _get_fallback_bot_response(self, message: str) -> Dict:
         """Fallback response when bot APIs fail"""
@@ -290,40 +578,85 @@ class BotService:
     
     def _get_bot_attempt_count(self, ticket_id: int) -> int:
         """Get number of bot attempts for this ticket"""
-        from app import db
-        from models import BotInteraction
+        count = self._attempt_counts.get(ticket_id)
+        if count is not None:
+            return count
+        
+        from app import db, Ticket
         
         try:
-            count = BotInteraction.query.filter_by(ticket_id=ticket_id).count()
-            return count
+            stored = db.session.query(Ticket.bot_attempts).filter(Ticket.TicketID == ticket_id).scalar()
         except Exception as e:
             logger.error(f"Error getting bot attempt count: {e}")
             return 0
+        
+        with self._attempts_lock:
+            count = (stored or 0) + self._pending_attempts.get(ticket_id, 0)
+            self._attempt_counts.set(ticket_id, count)
+        return count
+    
+    def _record_attempt(self, ticket_id: int):
+        """Count a logged interaction that has not reached the database yet"""
+        with self._attempts_lock:
+            self._pending_attempts[ticket_id] = self._pending_attempts.get(ticket_id, 0) + 1
+            count = self._attempt_counts.get(ticket_id)
+            if count is not None:
+                self._attempt_counts.set(ticket_id, count + 1)
+    
+    @staticmethod
+    def _attempts_by_ticket(rows) -> Dict[int, int]:
+        attempts: Dict[int, int] = {}
+        for row in rows:
+            if row.get('ticket_id'):
+                attempts[row['ticket_id']] = attempts.get(row['ticket_id'], 0) + 1
+        return attempts
+    
+    def _count_flushed_attempts(self, rows):
+        """Add flushed interactions to Tickets.bot_attempts (runs inside the writer's transaction)"""
+        from app import db
+        from sqlalchemy import text
+        
+        flushed = self._attempts_by_ticket(rows)
+        if not flushed:
+            return
+        
+        db.session.execute(
+            text("UPDATE Tickets SET bot_attempts = ISNULL(bot_attempts, 0) + :attempts WHERE TicketID = :ticket_id"),
+            [{'ticket_id': ticket_id, 'attempts': attempts} for ticket_id, attempts in flushed.items()]
+        )
+    
+    def _settle_flushed_attempts(self, rows):
+        """Stop counting committed interactions as pending (a failed flush leaves them pending)"""
+        self._settle_pending_attempts(self._attempts_by_ticket(rows))
+    
+    def _settle_pending_attempts(self, settled: Dict[int, int]):
+        with self._attempts_lock:
+            for ticket_id, attempts in settled.items():
+                remaining = self._pending_attempts.get(ticket_id, 0) - attempts
+                if remaining > 0:
+                    self._pending_attempts[ticket_id] = remaining
+                else:
+                    self._pending_attempts.pop(ticket_id, None)
     
     def _log_bot_interaction(self, ticket_id: int, user_message: str, bot_response: str,
                            confidence: float, intent: str = None, escalated: bool = False,
                            session_id: str = None):
-        """Log bot interaction for analytics"""
-        from app import db
-        from models import BotInteraction
-        
-        try:
-            interaction = BotInteraction(
-                ticket_id=ticket_id,
-                user_message=user_message,
-                bot_response=bot_response,
-                confidence_score=confidence,
-                intent_detected=intent,
-                escalated_to_human=escalated,
-                session_id=session_id
-            )
-            
-            db.session.add(interaction)
-            db.session.commit()
-            
-        except Exception as e:
-            logger.error(f"Error logging bot interaction: {e}")
-            db.session.rollback()
+        """Log bot interaction for analytics (queued for the batched writer)"""
+        if ticket_id:
+            self._record_attempt(ticket_id)
+        queued = self.interaction_writer.submit({
+            'ticket_id': ticket_id,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'confidence_score': confidence,
+            'intent_detected': intent,
+            'escalated_to_human': escalated,
+            'session_id': session_id,
+            'created_at': datetime.utcnow()
+        })
+        if not queued and ticket_id and self.interaction_writer.running:
+            # Dropped by a full queue: it still counts as an attempt here, but nothing is pending
+            self._settle_pending_attempts({ticket_id: 1})
     
     def _fallback_response(self, message: str, ticket_id: int = None, 
                           session_id: str = None) -> Dict:
@@ -379,7 +712,8 @@ class BotService:
                 'message': f'Bot connection failed: {str(e)}'
             }
     
-    def process_query(self, message: str, ticket_id: int = None, session_id: str = None, test_mode: bool = False) -> Dict:
+    def process_query(self, message: str, ticket_id: int = None, session_id: str = None, test_mode: bool = False,
+                      on_chunk: Callable[[str], None] = None) -> Dict:
         """Process query with test mode support"""
         if test_mode:
             # In test mode, just try to get a response without logging
@@ -402,8 +736,11 @@ class BotService:
                     'confidence': 0
                 }
         else:
-            # Normal processing
-            return self.process_message(message, ticket_id, session_id)
+            # Normal processing; expose the reply under 'response' like test mode does
+            result = self.process_user_message(message, ticket_id=ticket_id, session_id=session_id,
+                                               on_chunk=on_chunk)
+            result['response'] = result.get('bot_response')
+            return result
 
 # Global bot service instance
 bot_service = BotService()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Bot Stub Server
+Local stand-in for the Dialogflow, Rasa and custom bot APIs, for load tests
+
+Usage:
+    python bot_stub_server.py --port 8099 --latency-ms 120 --jitter-ms 40 --error-rate 0.02
+
+Point a BotConfiguration at it:
+    dialogflow  api_endpoint = http://localhost:8099/dialogflow/sessions/test:detectIntent
+    rasa        api_endpoint = http://localhost:8099/rasa   (BotService appends /webhooks/rest/webhook)
+    custom      api_endpoint = http://localhost:8099/custom (config_data.stream streams NDJSON)
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+from bot_rules import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+# Share of the drawn latency a streamed reply spends before its first chunk
+FIRST_TOKEN_SHARE = 0.2
+
+class StubBehavior:
+    """Latency, error and confidence distribution shared by all stub endpoints.
+
+    Latency is normal(latency_ms, jitter_ms), floored at zero; a `tail_rate`
+    share of requests instead takes `tail_ms` (a latency spike). `error_rate`
+    of requests answer HTTP 500. Confidence is uniform in `confidence`.
+    """
+
+    def __init__(self, latency_ms: float = 100, jitter_ms: float = 20, tail_rate: float = 0.0,
+                 tail_ms: float = 3000, error_rate: float = 0.0,
+                 confidence: Tuple[float, float] = (0.5, 0.95), seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.error_rate = error_rate
+        self.confidence = confidence
+        self.rules = RuleEngine()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'spikes': 0}
+
+    def draw(self) -> Dict:
+        """Outcome of one request: delay in seconds, whether it fails, confidence"""
+        with self._lock:
+            self.stats['requests'] += 1
+            spike = self._random.random() < self.tail_rate
+            fail = self._random.random() < self.error_rate
+            delay_ms = self.tail_ms if spike else max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms))
+            confidence = round(self._random.uniform(*self.confidence), 3)
+            if spike:
+                self.stats['spikes'] += 1
+            if fail:
+                self.stats['errors'] += 1
+        return {'delay': delay_ms / 1000.0, 'fail': fail, 'confidence': confidence}
+
+    def answer(self, message: str) -> Tuple[str, str]:
+        """Reply text and intent, taken from the built-in keyword rules"""
+        rule = self.rules.match(message)
+        if rule:
+            return rule['response'], rule['intent']
+        return 'Thanks for reaching out. Could you tell me a bit more about the problem?', 'general_inquiry'
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real providers
+    behavior: StubBehavior = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.behavior.stats)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON'})
+            return
+
+        outcome = self.behavior.draw()
+        # Streamed replies only wait for the first token here; _custom spreads the rest over the words
+        streaming = self.path.startswith('/custom') and payload.get('stream')
+        time.sleep(outcome['delay'] * (FIRST_TOKEN_SHARE if streaming else 1.0))
+        if outcome['fail']:
+            self._send_json(500, {'error': 'stub failure'})
+            return
+
+        if self.path.startswith('/dialogflow'):
+            self._dialogflow(payload, outcome)
+        elif self.path.startswith('/rasa'):
+            self._rasa(payload, outcome)
+        elif self.path.startswith('/custom'):
+            self._custom(payload, outcome)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def _dialogflow(self, payload: Dict, outcome: Dict):
+        message = payload.get('queryInput', {}).get('text', {}).get('text', '')
+        reply, intent = self.behavior.answer(message)
+        self._send_json(200, {
+            'responseId': f"stub-{time.time_ns()}",
+            'queryResult': {
+                'queryText': message,
+                'fulfillmentText': reply,
+                'intent': {'displayName': intent},
+                'intentDetectionConfidence': outcome['confidence'],
+                'allRequiredParamsPresent': outcome['confidence'] > 0.8,
+                'languageCode': 'en'
+            }
+        })
+
+    def _rasa(self, payload: Dict, outcome: Dict):
+        reply, intent = self.behavior.answer(payload.get('message', ''))
+        self._send_json(200, [{
+            'recipient_id': payload.get('sender', 'user'),
+            'text': reply,
+            'confidence': outcome['confidence'],
+            'intent': intent
+        }])
+
+    def _custom(self, payload: Dict, outcome: Dict):
+        reply, intent = self.behavior.answer(payload.get('message', ''))
+        if not payload.get('stream'):
+            self._send_json(200, {
+                'response': reply,
+                'confidence': outcome['confidence'],
+                'intent': intent,
+                'resolved': outcome['confidence'] > 0.8
+            })
+            return
+
+        # NDJSON stream: the confidence up front, word deltas spread over the rest of the drawn latency, then a done line
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._write_chunk({'confidence': outcome['confidence']})
+        words = reply.split(' ')
+        for index, word in enumerate(words):
+            self._write_chunk({'delta': word + (' ' if index < len(words) - 1 else '')})
+            time.sleep(outcome['delay'] * (1 - FIRST_TOKEN_SHARE) / max(len(words), 1))
+        self._write_chunk({'done': True, 'confidence': outcome['confidence'], 'intent': intent,
+                           'resolved': outcome['confidence'] > 0.8})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, event: Dict):
+        data = (json.dumps(event) + '\n').encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+def create_server(host: str = '127.0.0.1', port: int = 0, behavior: StubBehavior = None) -> ThreadingHTTPServer:
+    """Build a stub server (port 0 picks a free port; see server.server_port)"""
+    handler = type('BoundStubHandler', (StubHandler,), {'behavior': behavior or StubBehavior()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_in_background(behavior: StubBehavior = None, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Serve from a daemon thread; call server.shutdown() when done"""
+    server = create_server(host, port, behavior)
+    threading.Thread(target=server.serve_forever, name='bot-stub-server', daemon=True).start()
+    return server
+
+def add_behavior_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency-ms', type=float, default=100, help='Mean response latency')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='Standard deviation of the latency')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='Share of requests that take --tail-ms')
+    parser.add_argument('--tail-ms', type=float, default=3000, help='Latency of a spike')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answering HTTP 500')
+    parser.add_argument('--confidence', default='0.5,0.95', help='Confidence range as min,max')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for repeatable runs')
+
+def behavior_from_args(args) -> StubBehavior:
+    low, high = (float(value) for value in args.confidence.split(','))
+    return StubBehavior(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tail_rate=args.tail_rate,
+                        tail_ms=args.tail_ms, error_rate=args.error_rate, confidence=(low, high),
+                        seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Dialogflow/Rasa/custom bot stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(args.host, args.port, behavior_from_args(args))
+    logger.info(f"Bot stub server listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
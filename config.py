@@ -74,6 +74,36 @@ class Config:
     API_TITLE = 'Support Chatbot API'
     API_VERSION = 'v1'
     
+    # Ticket creation: return the Level 0 bot reply inline instead of pushing it later.
+    # Geolocation, bot and Odoo customer lookup then run concurrently under one deadline.
+    SYNC_BOT_REPLY = os.getenv('SYNC_BOT_REPLY', 'False').lower() in ('true', '1', 't')
+    TICKET_FANOUT_DEADLINE_MS = int(os.getenv('TICKET_FANOUT_DEADLINE_MS', '800'))
+    
+    # Offline IP-to-country database (build with `flask build-ip-country-db <csv>`)
+    IP_COUNTRY_DB_PATH = os.getenv('IP_COUNTRY_DB_PATH', os.path.join('data', 'ip_country.bin'))
+    # Also query the HTTP geolocation providers for city/timezone
+    LOCATION_HTTP_ENRICHMENT = os.getenv('LOCATION_HTTP_ENRICHMENT', 'False').lower() in ('true', '1', 't')
+    
+    # Pooled keep-alive connections for bot provider calls (connect/read timeouts in seconds)
+    BOT_HTTP_POOL_SIZE = int(os.getenv('BOT_HTTP_POOL_SIZE', '20'))
+    BOT_CONNECT_TIMEOUT = float(os.getenv('BOT_CONNECT_TIMEOUT', '3.05'))
+    BOT_READ_TIMEOUT = float(os.getenv('BOT_READ_TIMEOUT', '10'))
+    # Push bot replies to the ticket room in pieces (bot_message_chunk) while they are generated
+    BOT_STREAM_REPLIES = os.getenv('BOT_STREAM_REPLIES', 'False').lower() in ('true', '1', 't')
+    # Hard limit for one bot turn, and the hedge delay used until a provider has a p95
+    BOT_TURN_DEADLINE_MS = int(os.getenv('BOT_TURN_DEADLINE_MS', '5000'))
+    BOT_HEDGE_DEFAULT_MS = int(os.getenv('BOT_HEDGE_DEFAULT_MS', '1000'))
+    # Threads for hedged provider calls (per process); turns are not hedged while all are busy
+    BOT_HEDGE_POOL_SIZE = int(os.getenv('BOT_HEDGE_POOL_SIZE', '16'))
+    # Reuse bot answers for repeated questions (prewarmed from CommonQuery and FAQ questions)
+    BOT_ANSWER_CACHE = os.getenv('BOT_ANSWER_CACHE', 'True').lower() in ('true', '1', 't')
+    BOT_ANSWER_CACHE_SIZE = int(os.getenv('BOT_ANSWER_CACHE_SIZE', '5000'))
+    BOT_ANSWER_CACHE_TTL = int(os.getenv('BOT_ANSWER_CACHE_TTL', str(6 * 3600)))
+    # Prewarming asks remote providers (Dialogflow, Rasa, custom) only when enabled, and
+    # then for at most LIMIT questions; enable it on a single instance
+    BOT_ANSWER_CACHE_PREWARM_REMOTE = os.getenv('BOT_ANSWER_CACHE_PREWARM_REMOTE', 'False').lower() in ('true', '1', 't')
+    BOT_ANSWER_CACHE_PREWARM_LIMIT = int(os.getenv('BOT_ANSWER_CACHE_PREWARM_LIMIT', '200'))
+    
     # Odoo configuration
     ODOO_URL = os.getenv('ODOO_URL')
     ODOO_DB = os.getenv('ODOO_DB')
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Device Fingerprint Index
+Hash-indexed lookups of tickets and users by device (user agent string and client IP)
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+def fingerprint_hash(fingerprint: Optional[str]) -> Optional[str]:
+    """Fixed-width key for a fingerprint string (SHA-256 hex, lower case)"""
+    if not fingerprint:
+        return None
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+def device_hash(user_agent: Optional[str], ip_address: Optional[str]) -> Optional[str]:
+    """Hash identifying one device: the full user agent string plus the client IP.
+
+    The device_fingerprint columns only hold the device class
+    ("desktop_Chrome_Windows"), which most visitors share, so they are kept
+    as a label and never used to match devices.
+    """
+    client_ip = (ip_address or '').split(',')[0].strip()
+    if not user_agent or not client_ip:
+        return None
+    return fingerprint_hash(f"ua:{user_agent}|ip:{client_ip}")
+
+class DeviceFingerprintService:
+    """Maintains device_fingerprints / device_fingerprint_users and answers lookups.
+
+    Ticket creation and logins only append a row to device_fingerprint_events
+    in the caller's transaction (nothing here commits). Fingerprints have few
+    distinct values, so bumping the shared counter rows per request would make
+    those requests queue behind each other; a background thread folds the
+    events into the index instead, like the device rollups. Lookups add any
+    events not folded in yet, so they are exact between compactions too.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.running = False
+        self.compact_interval = 60  # Seconds between compactions
+        self.thread = None
+
+    def start(self):
+        """Start the background compactor"""
+        if self.running:
+            return
+
+        self.running = True
+        self.thread = threading.Thread(target=self._compact_loop, name='device-fingerprint-compactor', daemon=True)
+        self.thread.start()
+        logger.info("Device fingerprint compactor started")
+
+    def stop(self):
+        """Stop the background compactor"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=10)
+        logger.info("Device fingerprint compactor stopped")
+
+    def _compact_loop(self):
+        while self.running:
+            try:
+                with self.app.app_context():
+                    self.compact()
+            except Exception as e:
+                logger.error(f"Error compacting device fingerprints: {e}")
+            time.sleep(self.compact_interval)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def record_ticket(self, ticket) -> Optional[str]:
+        """Index a new ticket's device and link its user"""
+        ticket.device_fingerprint_hash = device_hash(ticket.user_agent, ticket.ip_address)
+        if not ticket.device_fingerprint_hash:
+            return None
+
+        self._add_event(ticket.device_fingerprint_hash, ticket.device_fingerprint, ticket.UserID, is_login=False)
+        return ticket.device_fingerprint_hash
+
+    def record_login(self, user) -> Optional[str]:
+        """Index the device a user just logged in (or registered) with"""
+        hashed = device_hash(user.user_agent, user.ip_address)
+        if not hashed:
+            return None
+
+        self._add_event(hashed, user.device_fingerprint, user.UserID, is_login=True)
+        return hashed
+
+    def _add_event(self, hashed: str, fingerprint: str, user_id: Optional[int], is_login: bool):
+        from app import db
+        from models import DeviceFingerprintEvent
+
+        db.session.add(DeviceFingerprintEvent(
+            fingerprint_hash=hashed,
+            device_fingerprint=fingerprint,
+            user_id=user_id,
+            is_login=is_login,
+            seen_at=datetime.utcnow()
+        ))
+
+    def compact(self) -> int:
+        """Fold pending events into the index tables, returning the number folded"""
+        from app import db
+
+        try:
+            # DELETE ... OUTPUT claims the events atomically, so two processes
+            # compacting at once never fold the same event twice
+            folded = db.session.execute(text("""
+                SET NOCOUNT ON;
+                DECLARE @events TABLE (
+                    fingerprint_hash VARCHAR(64), device_fingerprint VARCHAR(255),
+                    user_id INT, is_login BIT, seen_at DATETIME
+                );
+
+                DELETE FROM device_fingerprint_events
+                OUTPUT deleted.fingerprint_hash, deleted.device_fingerprint, deleted.user_id,
+                       deleted.is_login, deleted.seen_at
+                INTO @events;
+
+                MERGE device_fingerprints WITH (HOLDLOCK) AS target
+                USING (
+                    SELECT fingerprint_hash, MAX(device_fingerprint) AS device_fingerprint,
+                           MIN(seen_at) AS first_seen, MAX(seen_at) AS last_seen,
+                           SUM(CASE WHEN is_login = 0 THEN 1 ELSE 0 END) AS ticket_count,
+                           SUM(CASE WHEN is_login = 1 THEN 1 ELSE 0 END) AS login_count
+                    FROM @events GROUP BY fingerprint_hash
+                ) AS source
+                ON target.fingerprint_hash = source.fingerprint_hash
+                WHEN MATCHED THEN
+                    UPDATE SET last_seen = CASE WHEN source.last_seen > target.last_seen
+                                                THEN source.last_seen ELSE target.last_seen END,
+                               ticket_count = ISNULL(target.ticket_count, 0) + source.ticket_count,
+                               login_count = ISNULL(target.login_count, 0) + source.login_count
+                WHEN NOT MATCHED THEN
+                    INSERT (fingerprint_hash, device_fingerprint, first_seen, last_seen, ticket_count, login_count)
+                    VALUES (source.fingerprint_hash, source.device_fingerprint, source.first_seen,
+                            source.last_seen, source.ticket_count, source.login_count);
+
+                MERGE device_fingerprint_users WITH (HOLDLOCK) AS target
+                USING (
+                    SELECT f.id AS fingerprint_id, e.user_id, MIN(e.seen_at) AS first_seen, MAX(e.seen_at) AS last_seen
+                    FROM @events e
+                    JOIN device_fingerprints f ON f.fingerprint_hash = e.fingerprint_hash
+                    WHERE e.user_id IS NOT NULL
+                    GROUP BY f.id, e.user_id
+                ) AS source
+                ON target.fingerprint_id = source.fingerprint_id AND target.user_id = source.user_id
+                WHEN MATCHED THEN
+                    UPDATE SET last_seen = CASE WHEN source.last_seen > target.last_seen
+                                                THEN source.last_seen ELSE target.last_seen END
+                WHEN NOT MATCHED THEN
+                    INSERT (fingerprint_id, user_id, first_seen, last_seen)
+                    VALUES (source.fingerprint_id, source.user_id, source.first_seen, source.last_seen);
+
+                SELECT COUNT(*) FROM @events;
+            """)).scalar()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if folded:
+            logger.info(f"Compacted {folded} device fingerprint events")
+        return folded or 0
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def get_device(self, hashed: str, user_limit: int = 50) -> Optional[Dict]:
+        """Fingerprint summary with the most recent `user_limit` users seen on it"""
+        from app import db
+
+        params = {'hash': hashed, 'user_limit': user_limit}
+        summary = db.session.execute(text("""
+            SELECT MAX(device_fingerprint) AS device_fingerprint, MIN(first_seen) AS first_seen,
+                   MAX(last_seen) AS last_seen, SUM(ticket_count) AS ticket_count,
+                   SUM(login_count) AS login_count, COUNT(*) AS sources
+            FROM (
+                SELECT device_fingerprint, first_seen, last_seen, ticket_count, login_count
+                FROM device_fingerprints WHERE fingerprint_hash = :hash
+                UNION ALL
+                SELECT device_fingerprint, seen_at, seen_at,
+                       CASE WHEN is_login = 0 THEN 1 ELSE 0 END, CASE WHEN is_login = 1 THEN 1 ELSE 0 END
+                FROM device_fingerprint_events WHERE fingerprint_hash = :hash
+            ) seen
+        """), params).first()
+        if not summary or not summary.sources:
+            return None
+
+        seen_users = """
+            SELECT u.user_id, u.last_seen
+            FROM device_fingerprint_users u
+            JOIN device_fingerprints f ON f.id = u.fingerprint_id
+            WHERE f.fingerprint_hash = :hash
+            UNION ALL
+            SELECT user_id, seen_at FROM device_fingerprint_events
+            WHERE fingerprint_hash = :hash AND user_id IS NOT NULL
+        """
+        user_ids = [row[0] for row in db.session.execute(text(f"""
+            SELECT TOP (:user_limit) user_id FROM ({seen_users}) seen
+            GROUP BY user_id ORDER BY MAX(last_seen) DESC
+        """), params)]
+        user_count = db.session.execute(text(
+            f"SELECT COUNT(DISTINCT user_id) FROM ({seen_users}) seen"
+        ), params).scalar()
+
+        return {
+            'fingerprint_hash': hashed,
+            'device_fingerprint': summary.device_fingerprint,
+            'first_seen': summary.first_seen.isoformat() if summary.first_seen else None,
+            'last_seen': summary.last_seen.isoformat() if summary.last_seen else None,
+            'ticket_count': int(summary.ticket_count or 0),
+            'login_count': int(summary.login_count or 0),
+            'user_ids': user_ids,
+            'user_count': user_count or 0
+        }
+
+    def has_seen(self, user_agent: str, ip_address: str) -> bool:
+        """Whether a (guest) device was seen before"""
+        from models import DeviceFingerprint, DeviceFingerprintEvent
+
+        hashed = device_hash(user_agent, ip_address)
+        if not hashed:
+            return False
+        return (DeviceFingerprint.query.filter_by(fingerprint_hash=hashed).first() is not None
+                or DeviceFingerprintEvent.query.filter_by(fingerprint_hash=hashed).first() is not None)
+
+    def tickets_for_device(self, hashed: str, exclude_ticket_id: int = None, limit: int = 50) -> List:
+        """Most recent tickets from the same device (index seek on Tickets.device_fingerprint_hash)"""
+        from app import Ticket
+
+        query = Ticket.query.filter(Ticket.device_fingerprint_hash == hashed)
+        if exclude_ticket_id:
+            query = query.filter(Ticket.TicketID != exclude_ticket_id)
+        return query.order_by(Ticket.CreatedAt.desc()).limit(limit).all()
+
+    # ------------------------------------------------------------------
+    # Backfill
+    # ------------------------------------------------------------------
+
+    def backfill(self, batch_size: int = 5000, echo=None) -> Dict:
+        """Re-hash every ticket's device and rebuild the index tables from Tickets and Users"""
+        from app import db, Ticket, User
+        from models import DeviceFingerprintEvent
+
+        echo = echo or logger.info
+
+        # Hashed in Python so the keys match record_ticket() byte for byte
+        hashed_tickets = 0
+        last_id = 0
+        while True:
+            rows = db.session.query(Ticket.TicketID, Ticket.user_agent, Ticket.ip_address).filter(
+                Ticket.TicketID > last_id
+            ).order_by(Ticket.TicketID).limit(batch_size).all()
+            if not rows:
+                break
+            db.session.bulk_update_mappings(Ticket, [
+                {'TicketID': row.TicketID, 'device_fingerprint_hash': device_hash(row.user_agent, row.ip_address)}
+                for row in rows
+            ])
+            db.session.commit()
+            last_id = rows[-1].TicketID
+            hashed_tickets += len(rows)
+            echo(f"Hashed {hashed_tickets} ticket devices")
+
+        # Rebuild by replaying every ticket and user as an event, then compacting
+        db.session.execute(text("DELETE FROM device_fingerprint_events"))
+        db.session.execute(text("DELETE FROM device_fingerprint_users"))
+        db.session.execute(text("DELETE FROM device_fingerprints"))
+        db.session.execute(text("""
+            INSERT INTO device_fingerprint_events (fingerprint_hash, device_fingerprint, user_id, is_login, seen_at)
+            SELECT device_fingerprint_hash, device_fingerprint, UserID, 0, CreatedAt
+            FROM Tickets WHERE device_fingerprint_hash IS NOT NULL
+        """))
+        users = db.session.query(User.UserID, User.user_agent, User.ip_address, User.device_fingerprint,
+                                 User.LastLogin, User.CreatedAt).filter(User.user_agent.isnot(None)).all()
+        db.session.bulk_insert_mappings(DeviceFingerprintEvent, [
+            {
+                'fingerprint_hash': device_hash(user.user_agent, user.ip_address),
+                'device_fingerprint': user.device_fingerprint,
+                'user_id': user.UserID,
+                'is_login': True,
+                'seen_at': user.LastLogin or user.CreatedAt or datetime.utcnow()
+            }
+            for user in users if device_hash(user.user_agent, user.ip_address)
+        ])
+        db.session.commit()
+        self.compact()
+
+        devices = db.session.execute(text("SELECT COUNT(*) FROM device_fingerprints")).scalar()
+        logger.info(f"Device fingerprint index rebuilt: {devices} devices")
+        return {'hashed_tickets': hashed_tickets, 'devices': devices}
+
+# Global device fingerprint instance
+device_fingerprints = DeviceFingerprintService()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Device Rollup Service
+Daily ticket counts per device type, browser and OS for the device analytics
+"""
+
+import logging
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = 'Unknown'
+
+class DeviceRollupService:
+    """Maintains the device_daily_rollups table.
+
+    Ticket creation only appends a one-row delta in its own transaction, so
+    there is no hot counter row to contend on. A background thread folds the
+    deltas into one compacted row per (day, device_type, browser, os). Reads
+    sum compacted rows and any pending deltas, so results are exact between
+    compactions too.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.running = False
+        self.compact_interval = 300  # Seconds between compactions
+        self.thread = None
+
+    def start(self):
+        """Start the background compactor"""
+        if self.running:
+            return
+
+        self.running = True
+        self.thread = threading.Thread(target=self._compact_loop, name='device-rollup-compactor', daemon=True)
+        self.thread.start()
+        logger.info("Device rollup compactor started")
+
+    def stop(self):
+        """Stop the background compactor"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=10)
+        logger.info("Device rollup compactor stopped")
+
+    def _compact_loop(self):
+        while self.running:
+            try:
+                with self.app.app_context():
+                    self.compact()
+            except Exception as e:
+                logger.error(f"Error compacting device rollups: {e}")
+            time.sleep(self.compact_interval)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def record_ticket(self, ticket, day: date = None):
+        """Append a delta for a new ticket to the current session (the caller commits)"""
+        from app import db
+        from models import DeviceDailyRollup
+
+        db.session.add(DeviceDailyRollup(
+            day=day or datetime.utcnow().date(),
+            device_type=ticket.device_type or UNKNOWN,
+            browser=ticket.browser or UNKNOWN,
+            operating_system=ticket.operating_system or UNKNOWN,
+            ticket_count=1,
+            compacted=False,
+            updated_at=datetime.utcnow()
+        ))
+
+    def compact(self) -> int:
+        """Fold pending deltas into the compacted rows, returning the number folded"""
+        from app import db
+
+        max_id = db.session.execute(text(
+            "SELECT MAX(id) FROM device_daily_rollups WHERE compacted = 0"
+        )).scalar()
+        if max_id is None:
+            db.session.rollback()
+            return 0
+
+        try:
+            db.session.execute(text("""
+                MERGE device_daily_rollups WITH (HOLDLOCK) AS target
+                USING (
+                    SELECT day, device_type, browser, operating_system, SUM(ticket_count) AS ticket_count
+                    FROM device_daily_rollups
+                    WHERE compacted = 0 AND id <= :max_id
+                    GROUP BY day, device_type, browser, operating_system
+                ) AS delta
+                ON target.compacted = 1
+                   AND target.day = delta.day
+                   AND target.device_type = delta.device_type
+                   AND target.browser = delta.browser
+                   AND target.operating_system = delta.operating_system
+                WHEN MATCHED THEN
+                    UPDATE SET ticket_count = target.ticket_count + delta.ticket_count, updated_at = :now
+                WHEN NOT MATCHED THEN
+                    INSERT (day, device_type, browser, operating_system, ticket_count, compacted, updated_at)
+                    VALUES (delta.day, delta.device_type, delta.browser, delta.operating_system,
+                            delta.ticket_count, 1, :now);
+            """), {'max_id': max_id, 'now': datetime.utcnow()})
+            result = db.session.execute(text(
+                "DELETE FROM device_daily_rollups WHERE compacted = 0 AND id <= :max_id"
+            ), {'max_id': max_id})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        folded = result.rowcount or 0
+        if folded:
+            logger.info(f"Compacted {folded} device rollup deltas")
+        return folded
+
+    def rebuild(self, start: Optional[date] = None) -> int:
+        """Recompute compacted rows from the Tickets table (one GROUP BY), from `start` on"""
+        from app import db
+
+        params = {'now': datetime.utcnow()}
+        day_filter = ''
+        if start:
+            day_filter = 'WHERE day >= :start'
+            params['start'] = start
+
+        try:
+            db.session.execute(text(f"DELETE FROM device_daily_rollups {day_filter}"), params)
+            result = db.session.execute(text(f"""
+                INSERT INTO device_daily_rollups
+                    (day, device_type, browser, operating_system, ticket_count, compacted, updated_at)
+                SELECT CAST(CreatedAt AS DATE),
+                       ISNULL(device_type, '{UNKNOWN}'),
+                       ISNULL(browser, '{UNKNOWN}'),
+                       ISNULL(operating_system, '{UNKNOWN}'),
+                       COUNT(*), 1, :now
+                FROM Tickets
+                {'WHERE CreatedAt >= :start' if start else ''}
+                GROUP BY CAST(CreatedAt AS DATE), ISNULL(device_type, '{UNKNOWN}'),
+                         ISNULL(browser, '{UNKNOWN}'), ISNULL(operating_system, '{UNKNOWN}')
+            """), params)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result.rowcount or 0
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def query(self, start: Optional[date] = None, end: Optional[date] = None) -> List[Dict]:
+        """Ticket counts per device_type/browser/OS for days in [start, end]"""
+        from app import db
+        from models import DeviceDailyRollup
+        from sqlalchemy import func
+
+        query = db.session.query(
+            DeviceDailyRollup.device_type,
+            DeviceDailyRollup.browser,
+            DeviceDailyRollup.operating_system,
+            func.sum(DeviceDailyRollup.ticket_count)
+        )
+        if start:
+            query = query.filter(DeviceDailyRollup.day >= start)
+        if end:
+            query = query.filter(DeviceDailyRollup.day <= end)
+
+        rows = query.group_by(
+            DeviceDailyRollup.device_type, DeviceDailyRollup.browser, DeviceDailyRollup.operating_system
+        ).all()
+
+        return [
+            {'device_type': device_type, 'browser': browser, 'operating_system': os_name, 'count': int(count or 0)}
+            for device_type, browser, os_name, count in rows
+        ]
+
+# Global device rollup instance
+device_rollups = DeviceRollupService()
@@ -7,6 +7,189 @@ Core device tracking functionality without Flask dependencies
 import re
 import json
 from datetime import datetime
+from functools import lru_cache
+
+# Optional: used by classify_user_agents for vectorized dedupe/broadcast when installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# Patterns are checked in order, the first match wins
+BROWSER_PATTERNS = tuple((name.title(), re.compile(pattern)) for name, pattern in (
+    ('chrome', r'chrome/([\d.]+)'),
+    ('firefox', r'firefox/([\d.]+)'),
+    ('safari', r'version/([\d.]+).*safari'),
+    ('edge', r'edge/([\d.]+)'),
+    ('opera', r'opera/([\d.]+)'),
+    ('internet explorer', r'msie ([\d.]+)')
+))
+
+OS_PATTERNS = tuple((name.title(), re.compile(pattern)) for name, pattern in (
+    ('windows', r'windows nt ([\d.]+)'),
+    ('macos', r'mac os x ([\d_]+)'),
+    ('ios', r'os ([\d_]+)'),
+    ('android', r'android ([\d.]+)'),
+    ('linux', r'linux')
+))
+
+def _substring_pattern(substrings):
+    return re.compile('|'.join(re.escape(substring) for substring in substrings))
+
+MOBILE_PATTERN = _substring_pattern([
+    'mobile', 'android', 'iphone', 'ipod', 'blackberry',
+    'windows phone', 'palm', 'symbian'
+])
+TABLET_PATTERN = _substring_pattern(['ipad', 'tablet', 'kindle'])
+BOT_PATTERN = _substring_pattern([
+    'bot', 'crawler', 'spider', 'scraper', 'curl', 'wget',
+    'python-requests', 'googlebot', 'bingbot', 'facebookexternalhit'
+])
+
+# Number of distinct user agent strings kept parsed in memory
+PARSE_CACHE_SIZE = 2048
+
+class ParsedUserAgent:
+    """Immutable result of parsing one user agent string"""
+    
+    __slots__ = (
+        'browser_family', 'browser_version_string', 'browser_version',
+        'os_family', 'os_version_string', 'os_version',
+        'is_mobile', 'is_tablet', 'is_bot'
+    )
+    
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("ParsedUserAgent is immutable")
+    
+    @property
+    def is_pc(self):
+        return not (self.is_mobile or self.is_tablet)
+    
+    def browser_info(self):
+        """Browser details in the dictionary shape used by DeviceInfo"""
+        return {
+            'family': self.browser_family,
+            'version_string': self.browser_version_string,
+            'version': list(self.browser_version)
+        }
+    
+    def os_info(self):
+        """OS details in the dictionary shape used by DeviceInfo"""
+        return {
+            'family': self.os_family,
+            'version_string': self.os_version_string,
+            'version': list(self.os_version)
+        }
+
+def _version_numbers(version_string):
+    return tuple(int(x) for x in version_string.split('.') if x.isdigit())
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_user_agent(user_agent_string):
+    """Parse a user agent string once; repeat devices are served from an LRU cache"""
+    ua_lower = (user_agent_string or "").lower()
+    
+    browser_family, browser_version_string, browser_version = 'Unknown', '0.0', (0, 0)
+    for family, pattern in BROWSER_PATTERNS:
+        match = pattern.search(ua_lower)
+        if match:
+            browser_family = family
+            browser_version_string = match.group(1)
+            browser_version = _version_numbers(browser_version_string)
+            break
+    
+    os_family, os_version_string, os_version = 'Unknown', 'Unknown', (0,)
+    for family, pattern in OS_PATTERNS:
+        match = pattern.search(ua_lower)
+        if match:
+            os_family = family
+            if pattern.groups:
+                os_version_string = match.group(1).replace('_', '.')
+                os_version = _version_numbers(os_version_string)
+            break
+    
+    return ParsedUserAgent(
+        browser_family=browser_family,
+        browser_version_string=browser_version_string,
+        browser_version=browser_version,
+        os_family=os_family,
+        os_version_string=os_version_string,
+        os_version=os_version,
+        is_mobile=MOBILE_PATTERN.search(ua_lower) is not None,
+        is_tablet=TABLET_PATTERN.search(ua_lower) is not None,
+        is_bot=BOT_PATTERN.search(ua_lower) is not None
+    )
+
+def _device_type(parsed):
+    if parsed.is_mobile:
+        return 'mobile'
+    if parsed.is_tablet:
+        return 'tablet'
+    return 'desktop'
+
+# Columns produced by classify_user_agents, named after the Ticket/User device columns
+CLASSIFIED_COLUMNS = (
+    'device_type', 'browser', 'browser_version', 'operating_system', 'os_version',
+    'device_fingerprint', 'is_bot'
+)
+
+def _classify_unique(user_agent_string):
+    """Device columns for one distinct user agent string"""
+    parsed = parse_user_agent(user_agent_string)
+    device_type = _device_type(parsed)
+    return (
+        device_type,
+        parsed.browser_family,
+        parsed.browser_version_string,
+        parsed.os_family,
+        parsed.os_version_string,
+        f"{device_type}_{parsed.browser_family}_{parsed.os_family}",
+        parsed.is_bot
+    )
+
+def classify_user_agents(user_agents):
+    """Classify many user agent strings at once.
+    
+    Accepts any iterable (list, pandas Series, NumPy array). Empty values are
+    treated as "Unknown" like DeviceInfo does. Only distinct strings are
+    parsed; the results are broadcast back so every column has one entry per
+    input row. Columns are NumPy arrays when NumPy is installed, else lists.
+    """
+    if pd is not None:
+        values = pd.Series(user_agents, dtype=object)
+        values = values.where(values.notna() & (values != ''), 'Unknown')
+        codes, uniques = pd.factorize(values, sort=False)
+        uniques = list(uniques)
+    else:
+        index = {}
+        codes = []
+        for value in user_agents:
+            value = value or 'Unknown'
+            codes.append(index.setdefault(value, len(index)))
+        uniques = list(index)
+    
+    rows = [_classify_unique(value) for value in uniques]
+    columns = list(zip(*rows)) if rows else [()] * len(CLASSIFIED_COLUMNS)
+    
+    if np is not None:
+        codes = np.asarray(codes, dtype=np.intp)
+        return {
+            name: np.array(column, dtype=bool if name == 'is_bot' else object)[codes]
+            for name, column in zip(CLASSIFIED_COLUMNS, columns)
+        }
+    return {
+        name: [column[code] for code in codes]
+        for name, column in zip(CLASSIFIED_COLUMNS, columns)
+    }
 
 # Simple user agent parsing without external dependencies
 class SimpleUserAgentParser:
@@ -14,95 +197,39 @@ class SimpleUserAgentParser:
     
     def __init__(self, user_agent_string):
         self.user_agent_string = user_agent_string or ""
-        self.ua_lower = self.user_agent_string.lower()
+        self.parsed = parse_user_agent(self.user_agent_string)
+    
+    @property
+    def ua_lower(self):
+        return self.user_agent_string.lower()
     
     def get_browser_info(self):
         """Extract browser information from user agent"""
-        browser_patterns = {
-            'chrome': r'chrome/([\d.]+)',
-            'firefox': r'firefox/([\d.]+)',
-            'safari': r'version/([\d.]+).*safari',
-            'edge': r'edge/([\d.]+)',
-            'opera': r'opera/([\d.]+)',
-            'internet explorer': r'msie ([\d.]+)'
-        }
-        
-        for browser, pattern in browser_patterns.items():
-            match = re.search(pattern, self.ua_lower)
-            if match:
-                return {
-                    'family': browser.title(),
-                    'version_string': match.group(1),
-                    'version': [int(x) for x in match.group(1).split('.') if x.isdigit()]
-                }
-        
-        return {
-            'family': 'Unknown',
-            'version_string': '0.0',
-            'version': [0, 0]
-        }
+        return self.parsed.browser_info()
     
     def get_os_info(self):
         """Extract OS information from user agent"""
-        os_patterns = {
-            'windows': r'windows nt ([\d.]+)',
-            'macos': r'mac os x ([\d_]+)',
-            'ios': r'os ([\d_]+)',
-            'android': r'android ([\d.]+)',
-            'linux': r'linux'
-        }
-        
-        for os_name, pattern in os_patterns.items():
-            match = re.search(pattern, self.ua_lower)
-            if match:
-                if len(match.groups()) > 0:
-                    version = match.group(1).replace('_', '.')
-                    return {
-                        'family': os_name.title(),
-                        'version_string': version,
-                        'version': [int(x) for x in version.split('.') if x.isdigit()]
-                    }
-                else:
-                    return {
-                        'family': os_name.title(),
-                        'version_string': 'Unknown',
-                        'version': [0]
-                    }
-        
-        return {
-            'family': 'Unknown',
-            'version_string': 'Unknown',
-            'version': [0]
-        }
+        return self.parsed.os_info()
     
     @property
     def is_mobile(self):
         """Check if device is mobile"""
-        mobile_patterns = [
-            'mobile', 'android', 'iphone', 'ipod', 'blackberry',
-            'windows phone', 'palm', 'symbian'
-        ]
-        return any(pattern in self.ua_lower for pattern in mobile_patterns)
+        return self.parsed.is_mobile
     
     @property
     def is_tablet(self):
         """Check if device is tablet"""
-        tablet_patterns = ['ipad', 'tablet', 'kindle']
-        return any(pattern in self.ua_lower for pattern in tablet_patterns)
+        return self.parsed.is_tablet
     
     @property
     def is_pc(self):
         """Check if device is PC/desktop"""
-        return not (self.is_mobile or self.is_tablet)
+        return self.parsed.is_pc
     
     @property
     def is_bot(self):
         """Check if user agent indicates a bot"""
-        bot_patterns = [
-            'bot', 'crawler', 'spider', 'scraper', 'curl', 'wget',
-            'python-requests', 'googlebot', 'bingbot', 'facebookexternalhit'
-        ]
-        return any(pattern in self.ua_lower for pattern in bot_patterns)
+        return self.parsed.is_bot
 
 class DeviceInfo:
     """Device information parser and tracker - Standalone version"""
@@ -150,12 +277,47 @@ class DeviceInfo:
             'timestamp': datetime.utcnow().isoformat()
         }
 
+def _percentages(counts, total):
+    return {
+        name: round(count * 100.0 / total, 1)
+        for name, count in sorted(counts.items(), key=lambda item: -item[1])
+    }
+
 class DeviceAnalytics:
     """Device analytics and reporting - Standalone version"""
     
+    # Callable(start, end) -> [{'device_type', 'browser', 'operating_system', 'count'}],
+    # set by the app to read the daily rollup table
+    rollup_source = None
+    
+    @staticmethod
+    def get_device_stats(start_date=None, end_date=None):
+        """Get device usage statistics (percent of tickets) for an optional date range"""
+        if DeviceAnalytics.rollup_source is None:
+            return DeviceAnalytics._sample_device_stats()
+        
+        device_types, browsers, operating_systems = {}, {}, {}
+        total = 0
+        for row in DeviceAnalytics.rollup_source(start_date, end_date):
+            count = row['count']
+            total += count
+            device_types[row['device_type']] = device_types.get(row['device_type'], 0) + count
+            browsers[row['browser']] = browsers.get(row['browser'], 0) + count
+            operating_systems[row['operating_system']] = operating_systems.get(row['operating_system'], 0) + count
+        
+        if not total:
+            return {'device_types': {}, 'browsers': {}, 'operating_systems': {}, 'total': 0}
+        
+        return {
+            'device_types': _percentages(device_types, total),
+            'browsers': _percentages(browsers, total),
+            'operating_systems': _percentages(operating_systems, total),
+            'total': total
+        }
+    
     @staticmethod
-    def get_device_stats():
-        """Get device usage statistics"""
+    def _sample_device_stats():
+        """Static sample used when no rollup source is configured (standalone use)"""
         return {
             'device_types': {
                 'desktop': 60,
@@ -205,6 +367,9 @@ class DeviceAnalytics:
 
 # Export main classes
 __all__ = [
+    'ParsedUserAgent',
+    'parse_user_agent',
+    'classify_user_agents',
     'SimpleUserAgentParser',
     'DeviceInfo',
     'DeviceAnalytics'
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Deadline-Bounded Fan-Out
+Runs independent external calls concurrently under one overall deadline
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
+
+try:
+    from eventlet import tpool
+except ImportError:  # Only needed when serving under eventlet
+    tpool = None
+
+logger = logging.getLogger(__name__)
+
+# Shared by all requests; calls that miss their deadline finish here in the background
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='fanout')
+
+class DeadlineFanOut:
+    """Request-scoped group of concurrent calls with a single deadline.
+
+    Submit the calls, then wait() once. Calls that have not finished when the
+    deadline passes are abandoned: wait() returns without them and the caller
+    is expected to fill their results in later. Each call runs inside an app
+    context so it can use the database.
+    """
+
+    def __init__(self, deadline_ms: int = 800, app=None, cooperative: bool = False):
+        self.deadline_ms = deadline_ms
+        self.app = app
+        # Under eventlet, wait in a native thread so other greenlets keep running
+        self.cooperative = cooperative and tpool is not None
+        self.timings: Dict[str, float] = {}
+        self.missed: List[str] = []
+        self.failed: List[str] = []
+        self._futures = {}
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs):
+        """Start a call in the shared pool"""
+        self._futures[name] = _executor.submit(self._run, name, fn, args, kwargs)
+
+    def _run(self, name, fn, args, kwargs):
+        started = time.perf_counter()
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    return fn(*args, **kwargs)
+            return fn(*args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.timings[name] = elapsed_ms
+            if elapsed_ms > self.deadline_ms:
+                logger.info(f"Fan-out {name}: finished after its deadline in {elapsed_ms:.0f}ms")
+
+    def on_late_result(self, name: str, callback: Callable):
+        """Call callback(result) once a missed call finishes, or with None if it failed or was cancelled.
+
+        The callback always runs in the pool (in an app context), never in the
+        request, and must commit its own work.
+        """
+        def finished(future):
+            _executor.submit(self._run_late, name, future, callback)
+        self._futures[name].add_done_callback(finished)
+
+    def _run_late(self, name, future, callback):
+        result = None
+        if not future.cancelled():
+            try:
+                result = future.result()
+            except Exception:
+                pass  # Already logged by wait() or the call itself
+
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    return callback(result)
+            return callback(result)
+        except Exception as e:
+            logger.error(f"Fan-out {name}: handling late result failed: {e}")
+
+    def wait(self) -> Dict:
+        """Wait for all calls until the deadline and return results of those that finished"""
+        started = time.perf_counter()
+        futures = list(self._futures.values())
+        timeout = self.deadline_ms / 1000.0
+
+        if futures:
+            if self.cooperative:
+                tpool.execute(wait, futures, timeout)
+            else:
+                wait(futures, timeout)
+
+        waited_ms = (time.perf_counter() - started) * 1000
+        results = {}
+        for name, future in self._futures.items():
+            if not future.done():
+                future.cancel()
+                self.missed.append(name)
+                logger.warning(f"Fan-out {name}: missed {self.deadline_ms}ms deadline, left for background processing")
+                continue
+
+            try:
+                results[name] = future.result()
+                logger.info(f"Fan-out {name}: ok in {self.timings.get(name, 0):.0f}ms")
+            except Exception as e:
+                self.failed.append(name)
+                logger.warning(f"Fan-out {name}: failed in {self.timings.get(name, 0):.0f}ms: {e}")
+
+        logger.info(f"Fan-out finished in {waited_ms:.0f}ms: {len(results)} ok, "
+                    f"{len(self.failed)} failed, {len(self.missed)} missed")
+        return results
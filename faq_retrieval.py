@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+FAQ Retrieval
+In-process BM25 index over published FAQs and CommonQueries for Level-0 bot answers
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Optional: postings are scored as vectors when NumPy is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Very common English words carry no signal for matching support questions
+STOPWORDS = frozenset("""
+    a an and are as at be but by can could do does for from how i if in is it me my of on or our please
+    so that the this to was we what when where which who why will with would you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower())
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+class FAQIndex:
+    """BM25 index of FAQ and CommonQuery documents.
+
+    Documents are keyed ('faq', id) / ('common_query', QueryID) and indexed on
+    question, tags and answer, with the question counted twice. Postings live
+    in per-term dicts and are frozen into NumPy arrays on demand, so a change
+    to one FAQ only re-freezes the terms that FAQ uses.
+
+    refresh() compares a cheap version stamp (row counts and latest update
+    times) at most every `refresh_interval` seconds and applies only the rows
+    that changed since the previous refresh.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, refresh_interval: float = 30):
+        self.k1 = k1
+        self.b = b
+        self.refresh_interval = refresh_interval
+
+        self._docs: Dict[Tuple[str, int], Dict] = {}  # key -> document payload
+        self._slots: Dict[Tuple[str, int], int] = {}  # key -> slot in the length/score arrays
+        self._slot_keys: List[Optional[Tuple[str, int]]] = []
+        self._lengths: List[int] = []
+        self._slot_terms: List[Tuple[str, ...]] = []
+        self._slot_questions: List[Tuple[str, ...]] = []  # Distinct question terms, for calibration
+        self._length_array = None
+        self._postings: Dict[str, Dict[int, int]] = {}  # term -> {slot: term frequency}
+        self._frozen: Dict[str, Tuple] = {}  # term -> (slots array, tf array)
+        self._total_length = 0
+
+        self._stamp = None
+        self._since = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+        self.stats = {'refreshes': 0, 'documents_indexed': 0, 'queries': 0}
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+
+    def add(self, key: Tuple[str, int], question: str, answer: str, tags: str = None,
+            language: str = None):
+        """Index (or re-index) one document"""
+        with self._lock:
+            self.remove(key)
+
+            terms = Counter(tokenize(question) * 2 + tokenize(tags or '') + tokenize(answer))
+            if not terms:
+                return
+
+            slot = len(self._slot_keys)
+            self._slot_keys.append(key)
+            self._lengths.append(sum(terms.values()))
+            self._slot_terms.append(tuple(terms))
+            self._slot_questions.append(tuple(set(tokenize(question))))
+            self._length_array = None
+            self._slots[key] = slot
+            self._docs[key] = {
+                'source': key[0],
+                'id': key[1],
+                'question': question,
+                'answer': answer,
+                'language': language
+            }
+            self._total_length += self._lengths[slot]
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[slot] = tf
+                self._frozen.pop(term, None)
+            self.stats['documents_indexed'] += 1
+
+    def remove(self, key: Tuple[str, int]):
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                return
+            self._docs.pop(key, None)
+            self._slot_keys[slot] = None
+            self._total_length -= self._lengths[slot]
+            self._lengths[slot] = 0
+            self._length_array = None
+            for term in self._slot_terms[slot]:
+                del self._postings[term][slot]
+                if not self._postings[term]:
+                    del self._postings[term]
+                self._frozen.pop(term, None)
+
+            # Compact once dead slots pile up so score arrays stay dense
+            if len(self._slot_keys) > 64 and len(self._slots) < len(self._slot_keys) // 2:
+                self._compact()
+
+    def _compact(self):
+        remap = {}
+        keys, lengths, slot_terms, slot_questions = [], [], [], []
+        for old_slot, key in enumerate(self._slot_keys):
+            if key is not None:
+                remap[old_slot] = len(keys)
+                keys.append(key)
+                lengths.append(self._lengths[old_slot])
+                slot_terms.append(self._slot_terms[old_slot])
+                slot_questions.append(self._slot_questions[old_slot])
+        self._slot_keys, self._lengths, self._slot_terms = keys, lengths, slot_terms
+        self._slot_questions = slot_questions
+        self._length_array = None
+        self._slots = {key: slot for slot, key in enumerate(keys)}
+        self._postings = {
+            term: {remap[slot]: tf for slot, tf in postings.items()}
+            for term, postings in self._postings.items()
+        }
+        self._frozen.clear()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Apply FAQ/CommonQuery changes since the last refresh; returns True when anything changed"""
+        if not force and time.monotonic() - self._checked_at < self.refresh_interval:
+            return False
+
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.refresh_interval:
+                return False
+            try:
+                stamp = self._version_stamp()
+                changed = force or stamp != self._stamp
+                if changed:
+                    self._sync(full=force or self._stamp is None)
+                    self._stamp = stamp
+                    self.stats['refreshes'] += 1
+                self._checked_at = time.monotonic()
+                return changed
+            except Exception as e:
+                logger.error(f"Error refreshing FAQ index: {e}")
+                return False
+
+    def _version_stamp(self) -> Tuple:
+        from app import db, FAQ, CommonQuery
+
+        faq = db.session.query(func.count(FAQ.id), func.max(FAQ.updated_at)).one()
+        common = db.session.query(func.count(CommonQuery.QueryID), func.max(CommonQuery.UpdatedAt)).one()
+        return tuple(faq) + tuple(common)
+
+    def _sync(self, full: bool):
+        from app import FAQ, CommonQuery
+
+        since = None if full else self._since
+        started_at = time.perf_counter()
+
+        # Published ids are cheap to list and catch deletions and unpublishing
+        live_faqs = {row.id for row in FAQ.query.with_entities(FAQ.id).filter(
+            FAQ.status == 'published', FAQ.deleted_at.is_(None)
+        )}
+        live_queries = {row.QueryID for row in CommonQuery.query.with_entities(CommonQuery.QueryID)}
+        live = {('faq', faq_id) for faq_id in live_faqs} | {('common_query', query_id) for query_id in live_queries}
+
+        for key in [key for key in self._slots if key not in live]:
+            self.remove(key)
+
+        faq_query = FAQ.query.filter(FAQ.status == 'published', FAQ.deleted_at.is_(None))
+        common_query = CommonQuery.query
+        missing = [key for key in live if key not in self._slots]
+        if since and len(missing) > 1000:
+            since = None  # Too many to list in an IN clause; a full pass is cheaper anyway
+        if since:
+            missing_faqs = [key[1] for key in missing if key[0] == 'faq']
+            missing_queries = [key[1] for key in missing if key[0] == 'common_query']
+            faq_query = faq_query.filter((FAQ.updated_at > since) | FAQ.id.in_(missing_faqs or [0]))
+            common_query = common_query.filter(
+                (CommonQuery.UpdatedAt > since) | CommonQuery.QueryID.in_(missing_queries or [0])
+            )
+
+        latest = since
+        updated = 0
+        for faq in faq_query.all():
+            self.add(('faq', faq.id), faq.question, faq.answer, faq.tags, faq.language_code)
+            latest = max(filter(None, (latest, faq.updated_at)), default=None)
+            updated += 1
+        for query in common_query.all():
+            self.add(('common_query', query.QueryID), query.Question, query.Solution)
+            latest = max(filter(None, (latest, query.UpdatedAt)), default=None)
+            updated += 1
+
+        self._since = latest
+        logger.info(f"FAQ index {'built' if full else 'updated'}: {updated} documents indexed, "
+                    f"{len(self._slots)} total in {(time.perf_counter() - started_at) * 1000:.0f}ms")
+
+    # ------------------------------------------------------------------
+    # Searching
+    # ------------------------------------------------------------------
+
+    def _frozen_postings(self, term: str):
+        frozen = self._frozen.get(term)
+        if frozen is None:
+            postings = self._postings[term]
+            frozen = (np.fromiter(postings.keys(), dtype=np.int32, count=len(postings)),
+                      np.fromiter(postings.values(), dtype=np.float32, count=len(postings)))
+            self._frozen[term] = frozen
+        return frozen
+
+    def _idf(self, term: str, doc_count: int) -> float:
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+    def _confidence(self, slot: int, score: float, terms: List[str], doc_count: int,
+                    average_length: float) -> float:
+        """Score as a share of what the document's own question would score against it.
+
+        Asking a document's question verbatim gives 1.0. Query terms the
+        document lacks raise the bar by what they would have added had the
+        question contained them, so off-topic words lower the confidence
+        (words no document uses are ignored, as in the score).
+        """
+        k1, b = self.k1, self.b
+        norm = k1 * (1 - b + b * self._lengths[slot] / average_length)
+
+        def weight(tf):
+            return tf * (k1 + 1) / (tf + norm)
+
+        reference = sum(self._idf(term, doc_count) * weight(self._postings[term][slot])
+                        for term in self._slot_questions[slot])
+        reference += sum(self._idf(term, doc_count) * weight(2)  # Question terms are counted twice
+                         for term in terms if slot not in self._postings[term])
+        return round(min(1.0, score / reference), 3) if reference else 0.0
+
+    def search(self, text: str, top_k: int = 3, language: str = None) -> List[Dict]:
+        """Top-k documents for `text` with BM25 score and a 0..1 confidence (see _confidence)"""
+        self.stats['queries'] += 1
+        terms = [term for term in set(tokenize(text)) if term in self._postings]
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._slots)
+            if not doc_count:
+                return []
+            average_length = self._total_length / doc_count
+            k1, b = self.k1, self.b
+
+            idf = {term: self._idf(term, doc_count) for term in terms}
+
+            if np is not None:
+                if self._length_array is None:
+                    self._length_array = np.asarray(self._lengths, dtype=np.float32)
+                lengths = self._length_array
+                norms = k1 * (1 - b + b * lengths / average_length)
+                scores = np.zeros(len(self._slot_keys), dtype=np.float32)
+                for term in terms:
+                    slots, tfs = self._frozen_postings(term)
+                    scores[slots] += idf[term] * tfs * (k1 + 1) / (tfs + norms[slots])
+                candidates = np.flatnonzero(scores)
+                ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+                scored = ((int(slot), float(scores[slot])) for slot in ranked)
+            else:
+                totals: Dict[int, float] = {}
+                for term in terms:
+                    for slot, tf in self._postings[term].items():
+                        norm = k1 * (1 - b + b * self._lengths[slot] / average_length)
+                        totals[slot] = totals.get(slot, 0.0) + idf[term] * tf * (k1 + 1) / (tf + norm)
+                scored = iter(sorted(totals.items(), key=lambda item: -item[1]))
+
+            results = []
+            for slot, score in scored:
+                document = self._docs[self._slot_keys[slot]]
+                if language and document['language'] not in (None, language):
+                    continue
+                results.append(dict(document, score=round(score, 4),
+                                    confidence=self._confidence(slot, score, terms, doc_count, average_length)))
+                if len(results) >= top_k:
+                    break
+            return results
+
+    def check_questions(self, threshold: float) -> List[Dict]:
+        """Documents whose own question, asked verbatim, is not answered by them at `threshold`"""
+        with self._lock:
+            documents = list(self._docs.values())
+
+        failures = []
+        for document in documents:
+            matches = self.search(document['question'], top_k=1, language=document['language'])
+            best = matches[0] if matches else None
+            if not best or (best['source'], best['id']) != (document['source'], document['id']) \
+                    or best['confidence'] < threshold:
+                failures.append({
+                    'source': document['source'],
+                    'id': document['id'],
+                    'question': document['question'],
+                    'answered_by': (best['source'], best['id']) if best else None,
+                    'confidence': best['confidence'] if best else 0.0
+                })
+        return failures
+
+    def get_statistics(self) -> Dict:
+        return dict(self.stats, documents=len(self._slots), terms=len(self._postings),
+                    last_update=self._since.isoformat() if self._since else None)
+
+# Global FAQ index instance
+faq_index = FAQIndex()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Geolocation Backfill
+Re-resolves historical Ticket/User countries in resumable, rate-limited batches
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+from sqlalchemy import bindparam, text
+
+logger = logging.getLogger(__name__)
+
+# Table -> primary key column of the rows we backfill
+BACKFILL_TABLES = {
+    'Tickets': 'TicketID',
+    'Users': 'UserID'
+}
+
+IPAPI_BATCH_URL = 'http://ip-api.com/batch?fields=status,country,countryCode,query'
+IPAPI_BATCH_LIMIT = 100  # ip-api accepts at most 100 addresses per batch request
+UPDATE_ID_LIMIT = 1000  # Keep IN lists well below the MSSQL 2100 parameter limit
+
+class RateLimiter:
+    """Spaces out calls to at most `per_minute` per minute"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._next_at > now:
+                time.sleep(self._next_at - now)
+                now = self._next_at
+            self._next_at = now + self.interval
+
+class GeoBackfill:
+    """Streams rows with an ip_address in keyset chunks and fixes their Country.
+
+    Each chunk's IPs are de-duplicated, resolved through the offline database
+    and cache first, then through the ip-api batch endpoint, and written back
+    with one UPDATE per country. Progress is checkpointed after every chunk so
+    an interrupted run continues where it stopped. When an ip-api batch fails,
+    the checkpoint stops short of the first row it left unresolved and the
+    table is left for the next run to retry.
+    """
+
+    def __init__(self, db, location_service, chunk_size: int = 1000,
+                 requests_per_minute: float = 15, checkpoint_path: str = None,
+                 include_fallback_country: bool = True, use_http: bool = True,
+                 echo: Callable[[str], None] = None):
+        self.db = db
+        self.location_service = location_service
+        self.chunk_size = chunk_size
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.checkpoint_path = checkpoint_path
+        # Rows still carrying the hard-coded fallback country are re-resolved as well
+        self.include_fallback_country = include_fallback_country
+        self.use_http = use_http
+        self.echo = echo or logger.info
+        self.stats = {'rows': 0, 'unique_ips': 0, 'resolved_ips': 0, 'http_batches': 0, 'failed_ips': 0,
+                      'updated': 0}
+
+    # ------------------------------------------------------------------
+    # Checkpoints
+    # ------------------------------------------------------------------
+
+    def load_checkpoint(self) -> Dict[str, int]:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as handle:
+            return json.load(handle)
+
+    def save_checkpoint(self, checkpoint: Dict[str, int]):
+        if not self.checkpoint_path:
+            return
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, 'w') as handle:
+            json.dump(checkpoint, handle)
+        os.replace(temp_path, self.checkpoint_path)
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+
+    def run(self, tables: Iterable[str] = BACKFILL_TABLES) -> Dict:
+        checkpoint = self.load_checkpoint()
+        for table in tables:
+            self.backfill_table(table, checkpoint)
+        return self.stats
+
+    def backfill_table(self, table: str, checkpoint: Dict[str, int]):
+        key_column = BACKFILL_TABLES[table]
+        last_id = checkpoint.get(table, 0)
+        self.echo(f"Backfilling {table}.Country from {key_column} > {last_id}")
+
+        while True:
+            rows = self._fetch_chunk(table, key_column, last_id)
+            if not rows:
+                break
+
+            ips_by_row = {}
+            for row_id, raw_ip in rows:
+                ip_address = self._clean_ip(raw_ip)
+                if ip_address:
+                    ips_by_row[row_id] = ip_address
+
+            failed = set()
+            countries = self.resolve_ips(set(ips_by_row.values()), failed)
+            updated = self._write_countries(table, key_column, ips_by_row, countries)
+
+            if failed:
+                first_failed = min(row_id for row_id, ip_address in ips_by_row.items() if ip_address in failed)
+                done = [row_id for row_id, _ in rows if row_id < first_failed]
+                last_id = done[-1] if done else last_id
+            else:
+                done = rows
+                last_id = rows[-1][0]
+            checkpoint[table] = last_id
+            self.save_checkpoint(checkpoint)
+
+            self.stats['rows'] += len(done)
+            self.stats['updated'] += updated
+            self.echo(f"{table}: up to {key_column} {last_id}, {len(ips_by_row)} rows with IPs, "
+                      f"{len(set(ips_by_row.values()))} unique IPs, {updated} updated")
+            if failed:
+                self.echo(f"{table}: ip-api lookups failed for {len(failed)} IPs, stopping at "
+                          f"{key_column} {last_id}; run the backfill again to retry")
+                break
+
+    def _fetch_chunk(self, table: str, key_column: str, last_id: int) -> List:
+        countries = ["Unknown", ""]
+        if self.include_fallback_country:
+            countries.append("India")
+        statement = text(f"""
+            SELECT TOP (:chunk_size) [{key_column}], ip_address FROM [{table}]
+            WHERE [{key_column}] > :last_id
+              AND ip_address IS NOT NULL
+              AND (Country IS NULL OR Country IN :countries)
+            ORDER BY [{key_column}]
+        """).bindparams(bindparam('countries', expanding=True))
+        return self.db.session.execute(statement, {
+            'chunk_size': self.chunk_size,
+            'last_id': last_id,
+            'countries': countries
+        }).fetchall()
+
+    def _clean_ip(self, raw_ip: Optional[str]) -> Optional[str]:
+        """First public address of a stored (possibly X-Forwarded-For style) value"""
+        if not raw_ip:
+            return None
+        for candidate in raw_ip.split(','):
+            candidate = candidate.strip()
+            if candidate and not self.location_service._is_private_ip(candidate):
+                return candidate
+        return None
+
+    # ------------------------------------------------------------------
+    # Resolving
+    # ------------------------------------------------------------------
+
+    def resolve_ips(self, ip_addresses, failed: set = None) -> Dict[str, str]:
+        """Map each IP to a country name, leaving out the ones nobody could resolve.
+
+        IPs whose ip-api batch failed (as opposed to answering without a
+        country) are added to `failed`.
+        """
+        self.stats['unique_ips'] += len(ip_addresses)
+        countries = {}
+        pending = []
+
+        for ip_address in ip_addresses:
+            local = self.location_service._lookup_local(ip_address)
+            if local:
+                countries[ip_address] = local['country']
+                continue
+            cached = self.location_service.ip_cache.get(ip_address)
+            if cached and cached.get('source') != 'fallback':
+                countries[ip_address] = cached['country']
+                continue
+            pending.append(ip_address)
+
+        if self.use_http:
+            for start in range(0, len(pending), IPAPI_BATCH_LIMIT):
+                batch = pending[start:start + IPAPI_BATCH_LIMIT]
+                resolved = self._resolve_batch(batch)
+                if resolved is None:
+                    self.stats['failed_ips'] += len(batch)
+                    if failed is not None:
+                        failed.update(batch)
+                    continue
+                countries.update(resolved)
+
+        self.stats['resolved_ips'] += len(countries)
+        return countries
+
+    def _resolve_batch(self, ip_addresses: List[str]) -> Optional[Dict[str, str]]:
+        """Resolve up to 100 IPs with one ip-api batch request (None when the request failed)"""
+        self.rate_limiter.wait()
+        self.stats['http_batches'] += 1
+        try:
+            response = requests.post(IPAPI_BATCH_URL, json=ip_addresses, timeout=30)
+            if response.status_code == 429:
+                # Rate limited: back off for the window ip-api reports, then retry once
+                time.sleep(int(response.headers.get('X-Ttl', 60)))
+                response = requests.post(IPAPI_BATCH_URL, json=ip_addresses, timeout=30)
+            if response.status_code != 200:
+                logger.warning(f"ip-api batch returned {response.status_code}")
+                return None
+
+            countries = {}
+            for item in response.json():
+                if item.get('status') == 'success' and item.get('country'):
+                    countries[item['query']] = item['country']
+                    # Share the result with live lookups
+                    self.location_service.ip_cache.set(item['query'], {
+                        'country': item['country'],
+                        'country_code': item.get('countryCode', 'XX'),
+                        'city': 'Unknown',
+                        'region': 'Unknown',
+                        'ip': item['query'],
+                        'source': 'ipapi-batch',
+                        'timezone': 'Unknown'
+                    })
+            return countries
+        except Exception as e:
+            logger.warning(f"ip-api batch request failed: {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _write_countries(self, table: str, key_column: str, ips_by_row: Dict[int, str],
+                         countries: Dict[str, str]) -> int:
+        """Bulk UPDATE rows grouped by their resolved country"""
+        ids_by_country: Dict[str, List[int]] = {}
+        for row_id, ip_address in ips_by_row.items():
+            country = countries.get(ip_address)
+            if country:
+                ids_by_country.setdefault(country, []).append(row_id)
+
+        statement = text(
+            f"UPDATE [{table}] SET Country = :country WHERE [{key_column}] IN :ids"
+        ).bindparams(bindparam('ids', expanding=True))
+
+        updated = 0
+        try:
+            for country, row_ids in ids_by_country.items():
+                for start in range(0, len(row_ids), UPDATE_ID_LIMIT):
+                    result = self.db.session.execute(statement, {
+                        'country': country,
+                        'ids': row_ids[start:start + UPDATE_ID_LIMIT]
+                    })
+                    updated += result.rowcount or 0
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return updated
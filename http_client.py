@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+HTTP Client
+Pooled keep-alive HTTP sessions with per-endpoint latency tracking
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from provider_health import ProviderHealth
+
+logger = logging.getLogger(__name__)
+
+class HTTPClient:
+    """Shared client for outbound API calls.
+
+    One HTTPAdapter (a urllib3 pool manager, thread-safe) holds a keep-alive
+    connection pool per host and is mounted on a session per thread, so
+    threads share connections without sharing session state such as cookies.
+    Timeouts are (connect, read) pairs. Each call's latency and outcome is
+    recorded per endpoint (scheme://host/path unless a name is given).
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 20,
+                 connect_timeout: float = 3.05, read_timeout: float = 10):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.endpoints: Dict[str, ProviderHealth] = {}
+        self._endpoints_lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._build_adapter(pool_connections, pool_maxsize)
+
+    def _build_adapter(self, pool_connections: int, pool_maxsize: int):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        # pool_block=False: a burst beyond pool_maxsize opens extra connections instead of waiting
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                    pool_block=False)
+        self._generation += 1
+
+    def configure(self, pool_maxsize: int = None, connect_timeout: float = None,
+                  read_timeout: float = None):
+        """Apply app configuration (call once at startup)"""
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+        if read_timeout is not None:
+            self.read_timeout = read_timeout
+        if pool_maxsize and pool_maxsize != self.pool_maxsize:
+            old_adapter = self._adapter
+            self._build_adapter(self.pool_connections, pool_maxsize)
+            old_adapter.close()
+
+    @property
+    def session(self) -> requests.Session:
+        """This thread's session, mounted on the shared connection pools"""
+        session = getattr(self._local, 'session', None)
+        if session is None or self._local.generation != self._generation:
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            self._local.session = session
+            self._local.generation = self._generation
+        return session
+
+    def _endpoint(self, name: str) -> ProviderHealth:
+        health = self.endpoints.get(name)
+        if health is None:
+            with self._endpoints_lock:
+                health = self.endpoints.setdefault(name, ProviderHealth(name))
+        return health
+
+    def request(self, method: str, url: str, endpoint: str = None,
+                timeout: Union[float, Tuple[float, float], None] = None, **kwargs) -> requests.Response:
+        """Send a request through the pool. Raises requests.RequestException like requests does."""
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        if not endpoint:
+            parts = urlsplit(url)
+            endpoint = f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+        health = self._endpoint(endpoint)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            health.record((time.perf_counter() - started) * 1000, success=False)
+            raise
+
+        health.record((time.perf_counter() - started) * 1000, success=response.status_code < 500)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def endpoint_health(self, endpoint: str) -> Optional[ProviderHealth]:
+        return self.endpoints.get(endpoint)
+
+    def get_statistics(self) -> Dict:
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'timeouts': {'connect': self.connect_timeout, 'read': self.read_timeout},
+            'endpoints': {name: health.to_dict() for name, health in list(self.endpoints.items())}
+        }
+
+# Global HTTP client instance
+http_client = HTTPClient()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Idempotency Keys
+Makes client retries of ticket and message creation safe to replay
+"""
+
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+KEY_TTL_HOURS = 24
+IN_PROGRESS_LEASE = 120  # Seconds before an unfinished key (crashed worker, lost store) can be reclaimed
+PURGE_INTERVAL = 600  # Seconds between opportunistic purges of expired keys
+PURGE_BATCH_SIZE = 500
+
+_last_purge = 0.0
+
+def _request_fingerprint() -> str:
+    """Hash the request payload so a reused key with a different body is rejected"""
+    digest = hashlib.sha256()
+    digest.update(request.path.encode('utf-8'))
+
+    if request.is_json:
+        digest.update(request.get_data(cache=True))
+    else:
+        # Multipart bodies get a new boundary on every send, hash the fields instead
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode('utf-8'))
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{upload.filename}\n".encode('utf-8'))
+            # Same name, different file is a different request; rewind for the view
+            for chunk in iter(lambda: upload.stream.read(65536), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+
+    return digest.hexdigest()
+
+def _client_identity() -> str:
+    """Who sent the request: the logged-in user, else the client IP"""
+    from flask_login import current_user
+    from location_service import location_service
+
+    if current_user and current_user.is_authenticated:
+        return f"user:{current_user.get_id()}"
+    return f"ip:{location_service.get_client_ip(request)}"
+
+def _stored_response(record):
+    """Rebuild the original response from a completed key"""
+    response = current_app.response_class(
+        record.response_body or '',
+        status=record.response_status or 200,
+        content_type=record.response_content_type or 'application/json'
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _error_response(message, status):
+    from flask import jsonify
+
+    response = jsonify({'status': 'error', 'message': message})
+    response.status_code = status
+    return response
+
+def _claim_key(key, scope, request_hash):
+    """Insert an in-progress row for the key.
+
+    Returns (record, None) when this request owns the key, or (None, response)
+    when the key was already used and the response should be returned as is.
+    """
+    from app import db
+    from models import IdempotencyKey
+
+    now = datetime.utcnow()
+    for _ in range(2):
+        record = IdempotencyKey(
+            key=key,
+            scope=scope,
+            request_hash=request_hash,
+            status='in_progress',
+            created_at=now,
+            expires_at=now + timedelta(hours=KEY_TTL_HOURS)
+        )
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return record, None
+        except IntegrityError:
+            db.session.rollback()
+
+        existing = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+        if existing is None:
+            # Removed between our insert and lookup (failed request or purge), try again
+            continue
+
+        if existing.expires_at <= now:
+            db.session.delete(existing)
+            db.session.commit()
+            continue
+
+        if existing.status == 'in_progress' and existing.created_at < now - timedelta(seconds=IN_PROGRESS_LEASE):
+            # The request that claimed it never finished; take the key over (only one retry wins the delete)
+            reclaimed = IdempotencyKey.query.filter_by(id=existing.id, status='in_progress').filter(
+                IdempotencyKey.created_at < now - timedelta(seconds=IN_PROGRESS_LEASE)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            if reclaimed:
+                logger.warning(f"Reclaimed idempotency key {key} on {scope} after its lease expired")
+            continue
+
+        if existing.request_hash != request_hash:
+            return None, _error_response('Idempotency-Key was already used with a different request', 422)
+
+        if existing.status == 'completed':
+            logger.info(f"Replaying stored response for idempotency key {key} on {scope}")
+            return None, _stored_response(existing)
+
+        response = _error_response('A request with this Idempotency-Key is still being processed', 409)
+        response.headers['Retry-After'] = '1'
+        return None, response
+
+    return None, _error_response('Could not reserve Idempotency-Key, please retry', 409)
+
+def _release_key(record_id):
+    """Drop a key whose request failed so the client can retry it"""
+    from app import db
+    from models import IdempotencyKey
+
+    try:
+        db.session.rollback()
+        IdempotencyKey.query.filter_by(id=record_id).delete()
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error releasing idempotency key {record_id}: {e}")
+        db.session.rollback()
+
+def _store_response(record_id, response):
+    """Save the final response on the key for later replays"""
+    from app import db
+    from models import IdempotencyKey
+
+    try:
+        db.session.rollback()
+        record = IdempotencyKey.query.get(record_id)
+        if record:
+            record.status = 'completed'
+            record.response_status = response.status_code
+            record.response_body = response.get_data(as_text=True)
+            record.response_content_type = response.content_type
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Error storing response for idempotency key {record_id}: {e}")
+        db.session.rollback()
+
+def purge_expired_keys(force=False) -> int:
+    """Delete a batch of expired keys, at most once per PURGE_INTERVAL unless forced"""
+    global _last_purge
+    from app import db
+
+    if not force and time.time() - _last_purge < PURGE_INTERVAL:
+        return 0
+    _last_purge = time.time()
+
+    try:
+        result = db.session.execute(text(
+            "DELETE TOP (:batch_size) FROM idempotency_keys WHERE expires_at < :now"
+        ), {'batch_size': PURGE_BATCH_SIZE, 'now': datetime.utcnow()})
+        db.session.commit()
+        return result.rowcount or 0
+    except Exception as e:
+        logger.warning(f"Error purging expired idempotency keys: {e}")
+        db.session.rollback()
+        return 0
+
+def idempotent(f):
+    """Decorator that replays the stored response for a repeated Idempotency-Key.
+
+    Requests without the header run unchanged. The first request with a key
+    runs the view and stores its response; retries with the same key and
+    payload get that response back without running the view (and its ticket,
+    bot and Odoo side effects) again. Server errors release the key; a key
+    left in progress longer than IN_PROGRESS_LEASE is taken over by the next
+    retry. Keys are scoped to the client, so clients never share responses.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method != 'POST' or not key:
+            return f(*args, **kwargs)
+
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error_response(f'Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters', 400)
+
+        purge_expired_keys()
+
+        # Keys are only unique per client, so two clients reusing one never share a response
+        scope = f"{request.method} {request.path} {_client_identity()}"[:255]
+        record, response = _claim_key(key, scope, _request_fingerprint())
+        if response is not None:
+            return response
+        record_id = record.id
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            _release_key(record_id)
+            raise
+
+        if response.status_code >= 500:
+            _release_key(record_id)
+        else:
+            _store_response(record_id, response)
+        response.headers[IDEMPOTENCY_HEADER] = key
+        return response
+
+    return decorated_function
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Offline IP-to-Country Database
+Memory-mapped range table answering country lookups without network I/O
+"""
+
+import csv
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# File layout (all integers big-endian so packed addresses compare as bytes):
+#   header   MAGIC, country count, IPv4 range count, IPv6 range count
+#   countries  COUNTRY_RECORD per country: 2-byte ISO code + UTF-8 name, NUL padded
+#   ipv4       IPV4_RECORD per range: start uint32, end uint32, country index uint16
+#   ipv6       IPV6_RECORD per range: start uint128, end uint128, country index uint16
+# Ranges are sorted by start and do not overlap.
+MAGIC = b'IPCDB\x00\x01\x00'
+HEADER = struct.Struct('>8sIII')
+COUNTRY_RECORD = struct.Struct('>2s62s')
+IPV4_RECORD = struct.Struct('>IIH')
+IPV6_RECORD = struct.Struct('>16s16sH')
+
+class IPCountryDB:
+    """Read-only view of a packed range file.
+
+    The file is memory-mapped, so opening it is cheap and the pages are shared
+    between worker processes. Lookups are a binary search over fixed-size
+    records.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, country_count, v4_count, v6_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an IP country database")
+
+        self.v4_count = v4_count
+        self.v6_count = v6_count
+        self.countries: List[Tuple[str, str]] = []
+        offset = HEADER.size
+        for _ in range(country_count):
+            code, name = COUNTRY_RECORD.unpack_from(self._mm, offset)
+            self.countries.append((code.decode('ascii'), name.rstrip(b'\x00').decode('utf-8')))
+            offset += COUNTRY_RECORD.size
+
+        self._v4_offset = offset
+        self._v6_offset = offset + v4_count * IPV4_RECORD.size
+        self.mtime = os.path.getmtime(path)
+
+    def lookup(self, ip_address: str) -> Optional[Tuple[str, str]]:
+        """Return (country_code, country_name) for an address, None when not covered"""
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+
+        if ip.version == 4:
+            index = self._search(int(ip), self._v4_offset, self.v4_count, IPV4_RECORD)
+        else:
+            index = self._search(ip.packed, self._v6_offset, self.v6_count, IPV6_RECORD)
+        return self.countries[index] if index is not None else None
+
+    def _search(self, key, base: int, count: int, record: struct.Struct) -> Optional[int]:
+        """Binary search for the range containing key, returning its country index"""
+        low, high = 0, count - 1
+        found = -1
+        while low <= high:
+            middle = (low + high) // 2
+            start = record.unpack_from(self._mm, base + middle * record.size)[0]
+            if start <= key:
+                found = middle
+                low = middle + 1
+            else:
+                high = middle - 1
+
+        if found < 0:
+            return None
+        _, end, country_index = record.unpack_from(self._mm, base + found * record.size)
+        return country_index if key <= end else None
+
+    def close(self):
+        try:
+            self._mm.close()
+        finally:
+            self._file.close()
+
+    def stats(self) -> Dict:
+        return {
+            'path': self.path,
+            'countries': len(self.countries),
+            'ipv4_ranges': self.v4_count,
+            'ipv6_ranges': self.v6_count,
+            'built_at': self.mtime
+        }
+
+def _parse_address(value: str):
+    """Accept dotted/colon notation or a plain integer (as found in many range dumps)"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return ipaddress.IPv4Address(number) if number <= 0xFFFFFFFF else ipaddress.IPv6Address(number)
+    return ipaddress.ip_address(value)
+
+def read_csv_ranges(csv_path: str) -> Iterable[Tuple]:
+    """Yield (start, end, country_code, country_name) from a CSV range dump.
+
+    Expected columns: start_ip, end_ip, country_code[, country_name]. A header
+    row and rows with unknown countries ('-', 'ZZ') are skipped.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as handle:
+        for row in csv.reader(handle):
+            if len(row) < 3:
+                continue
+            try:
+                start = _parse_address(row[0])
+                end = _parse_address(row[1])
+            except ValueError:
+                continue  # Header or malformed row
+
+            code = row[2].strip().upper()
+            if len(code) != 2 or code in ('ZZ', '--'):
+                continue
+            name = row[3].strip() if len(row) > 3 and row[3].strip() else code
+            yield start, end, code, name
+
+def build_database(csv_path: str, output_path: str) -> Dict:
+    """Build a packed range file from a CSV dump.
+
+    The file is written next to the target and renamed into place, so running
+    processes never see a half-written database.
+    """
+    countries: List[Tuple[str, str]] = []
+    country_index: Dict[str, int] = {}
+    ranges = {4: [], 6: []}
+    skipped = 0
+
+    for start, end, code, name in read_csv_ranges(csv_path):
+        if start.version != end.version or int(end) < int(start):
+            skipped += 1
+            continue
+        if code not in country_index:
+            country_index[code] = len(countries)
+            countries.append((code, name))
+        ranges[start.version].append((int(start), int(end), country_index[code]))
+
+    if len(countries) > 0xFFFF:
+        raise ValueError("Too many distinct countries for a uint16 index")
+
+    packed = {}
+    for version, rows in ranges.items():
+        rows.sort()
+        kept = []
+        for row in rows:
+            if kept and row[0] <= kept[-1][1]:
+                skipped += 1  # Overlapping range, the earlier one wins
+                continue
+            kept.append(row)
+        packed[version] = kept
+
+    temp_path = f"{output_path}.tmp"
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(temp_path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, len(countries), len(packed[4]), len(packed[6])))
+        for code, name in countries:
+            # Cut on a character boundary so multi-byte names still decode
+            encoded = name.encode('utf-8')[:COUNTRY_RECORD.size - 2].decode('utf-8', 'ignore').encode('utf-8')
+            out.write(COUNTRY_RECORD.pack(code.encode('ascii'), encoded))
+        for start, end, index in packed[4]:
+            out.write(IPV4_RECORD.pack(start, end, index))
+        for start, end, index in packed[6]:
+            out.write(IPV6_RECORD.pack(start.to_bytes(16, 'big'), end.to_bytes(16, 'big'), index))
+    os.replace(temp_path, output_path)
+
+    result = {
+        'countries': len(countries),
+        'ipv4_ranges': len(packed[4]),
+        'ipv6_ranges': len(packed[6]),
+        'skipped': skipped
+    }
+    logger.info(f"Built IP country database {output_path}: {result}")
+    return result
+
+def open_database(path: Optional[str]) -> Optional[IPCountryDB]:
+    """Open the database if the file exists, None otherwise"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return IPCountryDB(path)
+    except Exception as e:
+        logger.error(f"Could not open IP country database {path}: {e}")
+        return None
@@ -5,9 +5,15 @@ Location detection service for country tracking
 
 import requests
 import logging
+import ipaddress
+import time
 from typing import Optional, Dict, Any
 from flask import request
 
+from ttl_cache import TTLCache
+from ip_country_db import open_database
+from provider_health import ProviderHealth
+
 logger = logging.getLogger(__name__)
 
 class LocationService:
@@ -32,6 +38,98 @@ class LocationService:
                 'country_field': 'country_name'
             }
         ]
+        
+        # Customer IPs and NAT gateways repeat constantly, cache lookups in process
+        self.ip_cache = TTLCache(maxsize=10000, ttl=6 * 3600)
+        # Country for /24 (IPv4) and /48 (IPv6) networks, used when the exact IP is not cached
+        self.prefix_cache = TTLCache(maxsize=5000, ttl=6 * 3600)
+        self.use_prefix_fallback = True
+        # Failed lookups are remembered briefly so an outage is not hammered on every ticket
+        self.negative_ttl = 300
+        # The server's own public IP location is effectively constant per process
+        self.current_location_ttl = 24 * 3600
+        self._current_location_cache = TTLCache(maxsize=1, ttl=self.current_location_ttl)
+        
+        # Offline range table answers the country; HTTP providers are then only
+        # used for city/timezone when http_enrichment is enabled
+        self.country_db = None
+        self.http_enrichment = False
+        
+        # Per-provider circuit breaker and recent success rate/latency
+        self.request_timeout = 10
+        self.provider_health = {
+            service['name']: ProviderHealth(service['name'], failure_threshold=3, cooldown=60)
+            for service in self.services
+        }
+    
+    def _ordered_services(self):
+        """Providers whose circuit is not open, best recent success rate/latency first"""
+        positions = {service['name']: index for index, service in enumerate(self.services)}
+        available = [
+            service for service in self.services
+            if self.provider_health[service['name']].breaker.is_available()
+        ]
+        return sorted(available, key=lambda service: (
+            self.provider_health[service['name']].score(), positions[service['name']]
+        ))
+    
+    def _provider_get(self, name: str, url: str):
+        """GET from a provider through its circuit breaker, recording latency and outcome.
+        
+        Returns the response, or None when the circuit is open or the call failed.
+        """
+        health = self.provider_health[name]
+        if not health.breaker.allow_request():
+            logger.info(f"Skipping {name}: circuit {health.breaker.state}")
+            return None
+        
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, timeout=self.request_timeout)
+        except Exception as e:
+            health.record((time.perf_counter() - started) * 1000, success=False)
+            logger.warning(f"Failed to get location from {name}: {e}")
+            return None
+        
+        # Rate limiting (429) and server errors count against the provider
+        health.record((time.perf_counter() - started) * 1000, success=response.status_code < 400)
+        return response
+    
+    def load_country_db(self, path: Optional[str]) -> bool:
+        """Open (or reopen after a rebuild) the offline IP-to-country database"""
+        country_db = open_database(path)
+        if country_db is None:
+            logger.info(f"No offline IP country database at {path}, using HTTP providers")
+            return False
+        
+        old_db, self.country_db = self.country_db, country_db
+        if old_db is not None:
+            old_db.close()
+        logger.info(f"Loaded offline IP country database: {country_db.stats()}")
+        return True
+    
+    def _lookup_local(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Resolve the country from the offline database, None when unavailable"""
+        if self.country_db is None:
+            return None
+        try:
+            match = self.country_db.lookup(ip_address)
+        except Exception as e:
+            logger.warning(f"Offline IP country lookup failed for {ip_address}: {e}")
+            return None
+        if match is None:
+            return None
+        
+        country_code, country = match
+        return {
+            'country': country,
+            'country_code': country_code,
+            'city': 'Unknown',
+            'region': 'Unknown',
+            'ip': ip_address,
+            'source': 'local-db',
+            'timezone': 'Unknown'
+        }
     
     def get_client_ip(self, request_obj=None) -> str:
         """Extract real client IP from request"""
@@ -81,6 +179,13 @@ class LocationService:
         if not ip or ip in ['127.0.0.1', 'localhost', '::1', 'unknown', 'current']:
             return True
         
+        if ':' in ip:
+            # IPv6: anything that is not globally routable is treated as local
+            try:
+                return not ipaddress.ip_address(ip).is_global
+            except ValueError:
+                return True
+        
         # Check for private IP ranges
         try:
             parts = ip.split('.')
@@ -105,18 +210,69 @@ class LocationService:
             
         return False
     
+    def _network_prefix(self, ip_address: str) -> Optional[str]:
+        """Return the /24 (IPv4) or /48 (IPv6) network an address belongs to"""
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        prefix_length = 24 if ip.version == 4 else 48
+        return str(ipaddress.ip_network(f"{ip}/{prefix_length}", strict=False))
+    
     def detect_country_by_ip(self, ip_address: str) -> Optional[Dict[str, Any]]:
         """Detect country information from IP address"""
         if self._is_private_ip(ip_address) or ip_address == 'current':
             logger.info(f"Private/local IP or current request: {ip_address}, getting public IP location")
             return self.get_current_location()
         
-        for service in self.services:
+        local = self._lookup_local(ip_address)
+        if local and not self.http_enrichment:
+            # Microsecond lookup with no network I/O, nothing worth caching
+            return local
+        
+        cached = self.ip_cache.get(ip_address)
+        if cached is not None:
+            return dict(cached)
+        
+        prefix = self._network_prefix(ip_address) if self.use_prefix_fallback else None
+        if prefix:
+            cached = self.prefix_cache.get(prefix)
+            if cached is not None:
+                location = dict(cached, ip=ip_address, source=f"{cached['source']}-prefix")
+                self.ip_cache.set(ip_address, location)
+                return dict(location)
+        
+        # Reached only when enriching, or when the offline database does not cover the IP
+        location = self._lookup_ip(ip_address)
+        if local:
+            # The offline database is authoritative for the country, providers only add city/timezone
+            enrichment = {field: location[field] for field in ('city', 'region', 'timezone')} if location else {}
+            location = dict(local, **enrichment)
+        if location is None:
+            # Negative cache: serve the fallback for a while instead of retrying every provider.
+            # With the offline database loaded, report the country as unknown rather than guess.
+            if self.country_db is None:
+                location = self._fallback_location(ip_address)
+            else:
+                location = self._unknown_location(ip_address)
+            self.ip_cache.set(ip_address, location, ttl=self.negative_ttl)
+            return dict(location)
+        
+        self.ip_cache.set(ip_address, location)
+        if prefix:
+            self.prefix_cache.set(prefix, location)
+        return dict(location)
+    
+    def _lookup_ip(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Query the geolocation providers in order, None when all of them fail"""
+        for service in self._ordered_services():
             try:
                 logger.info(f"Trying {service['name']} for IP: {ip_address}")
                 
                 url = service['url'].format(ip=ip_address)
-                response = requests.get(url, timeout=10)
+                response = self._provider_get(service['name'], url)
+                if response is None:
+                    continue
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -184,6 +340,11 @@ class LocationService:
                 logger.warning(f"Failed to get location from {service['name']}: {e}")
                 continue
         
+        logger.warning(f"All location services failed for IP {ip_address}")
+        return None
+    
+    def _fallback_location(self, ip_address: str) -> Dict[str, Any]:
+        """Location used when no provider could resolve the IP"""
         # If all services fail, default to India (since you mentioned you're in India)
         logger.warning(f"All location services failed for IP {ip_address}, defaulting to India")
         return {
@@ -196,16 +357,43 @@ class LocationService:
             'timezone': 'Asia/Kolkata'
         }
     
+    def _unknown_location(self, ip_address: str) -> Dict[str, Any]:
+        """Location for an IP neither the offline database nor the providers could resolve"""
+        logger.warning(f"Could not resolve IP {ip_address} offline or through any provider")
+        return {
+            'country': 'Unknown',
+            'country_code': 'XX',
+            'city': 'Unknown',
+            'region': 'Unknown',
+            'ip': ip_address,
+            'source': 'fallback',  # Never taken for a real answer (see GeoBackfill.resolve_ips)
+            'timezone': 'Unknown'
+        }
+    
     def get_current_location(self) -> Optional[Dict[str, Any]]:
-        """Get current user's location by detecting their public IP"""
+        """Get current user's location by detecting their public IP (cached per process)"""
+        cached = self._current_location_cache.get('current')
+        if cached is not None:
+            return dict(cached)
+        
+        location = self._lookup_current_location()
+        if location:
+            # Defaults are only kept briefly so a transient failure is retried
+            ttl = self.negative_ttl if location.get('source') == 'default' else self.current_location_ttl
+            self._current_location_cache.set('current', location, ttl=ttl)
+            return dict(location)
+        return location
+    
+    def _lookup_current_location(self) -> Optional[Dict[str, Any]]:
+        """Resolve the server's public IP location from the providers"""
         try:
             # Use the services directly to get current location
             logger.info("Getting current user's public IP location...")
             
             # Try ip-api first (most reliable for current location)
             try:
-                response = requests.get('http://ip-api.com/json/', timeout=10)
-                if response.status_code == 200:
+                response = self._provider_get('ipapi', 'http://ip-api.com/json/')
+                if response is not None and response.status_code == 200:
                     data = response.json()
                     logger.info(f"Current location response: {data}")
                     if data.get('status') == 'success':
@@ -226,8 +414,8 @@ class LocationService:
             
             # Fallback to ipinfo
             try:
-                response = requests.get('https://ipinfo.io/json', timeout=10)
-                if response.status_code == 200:
+                response = self._provider_get('ipinfo', 'https://ipinfo.io/json')
+                if response is not None and response.status_code == 200:
                     data = response.json()
                     logger.info(f"Current location response from ipinfo: {data}")
                     if 'country' in data:
@@ -270,6 +458,31 @@ class LocationService:
             logger.error(f"Error getting current location: {e}")
             return None
     
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the IP, prefix and current-location caches"""
+        return {
+            'ip': self.ip_cache.stats(),
+            'prefix': self.prefix_cache.stats(),
+            'current_location': self._current_location_cache.stats(),
+            'negative_ttl': self.negative_ttl,
+            'prefix_fallback': self.use_prefix_fallback,
+            'country_db': self.country_db.stats() if self.country_db else None,
+            'http_enrichment': self.http_enrichment
+        }
+    
+    def get_provider_stats(self) -> Dict[str, Any]:
+        """Health, circuit state and latency histogram per provider, in current order"""
+        return {
+            'order': [service['name'] for service in self._ordered_services()],
+            'providers': {name: health.to_dict() for name, health in self.provider_health.items()}
+        }
+    
+    def clear_cache(self):
+        """Drop all cached lookups"""
+        self.ip_cache.clear()
+        self.prefix_cache.clear()
+        self._current_location_cache.clear()
+    
     def detect_country_from_request(self, request_obj=None) -> Dict[str, Any]:
         """Detect country from Flask request object"""
         try:
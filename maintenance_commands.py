@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Maintenance CLI Commands
+One-off schema and backfill jobs, run with `flask <command>`
+"""
+
+import logging
+
+import click
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+def _ensure_columns(db, table_name, columns):
+    """Add any missing columns to an existing MSSQL table.
+
+    `columns` maps column name -> SQL type definition. db.create_all() only
+    creates missing tables, so new columns on existing tables go through here.
+    """
+    existing = {
+        row[0] for row in db.session.execute(text("""
+            SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_NAME = :table_name
+        """), {'table_name': table_name})
+    }
+
+    added = []
+    for column_name, definition in columns.items():
+        if column_name not in existing:
+            db.session.execute(text(f"ALTER TABLE [{table_name}] ADD [{column_name}] {definition}"))
+            added.append(column_name)
+
+    db.session.commit()
+    return added
+
+def _ensure_index(db, table_name, index_name, columns):
+    """Create an index on an existing MSSQL table if it does not exist yet"""
+    exists = db.session.execute(text("""
+        SELECT 1 FROM sys.indexes
+        WHERE name = :index_name AND object_id = OBJECT_ID(:table_name)
+    """), {'index_name': index_name, 'table_name': table_name}).first()
+
+    if not exists:
+        column_list = ', '.join(f'[{column}]' for column in columns)
+        db.session.execute(text(f"CREATE INDEX [{index_name}] ON [{table_name}] ({column_list})"))
+        db.session.commit()
+        return True
+    return False
+
+# Composite indexes declared on the Ticket model, for databases created before them
+TICKET_INDEXES = {
+    'IX_Tickets_CreatedAt_TicketID': ['CreatedAt', 'TicketID'],
+    'IX_Tickets_Status_CreatedAt': ['Status', 'CreatedAt'],
+    'IX_Tickets_Status_UpdatedAt': ['Status', 'UpdatedAt']
+}
+
+def register_commands(app):
+    """Register maintenance commands on the Flask CLI"""
+
+    @app.cli.command('create-ticket-indexes')
+    def create_ticket_indexes():
+        """Create the composite Tickets indexes used by ticket listing and pagination"""
+        from app import db
+
+        for index_name, columns in TICKET_INDEXES.items():
+            if _ensure_index(db, 'Tickets', index_name, columns):
+                click.echo(f"Created index {index_name}")
+            else:
+                click.echo(f"Index {index_name} already exists")
+
+    @app.cli.command('backfill-last-message')
+    @click.option('--batch-size', default=5000, show_default=True,
+                  help='Number of TicketIDs updated per transaction')
+    def backfill_last_message(batch_size):
+        """Add and backfill the denormalized last-message columns on Tickets"""
+        from app import db
+
+        added = _ensure_columns(db, 'Tickets', {
+            'LastMessageAt': 'DATETIME NULL',
+            'LastMessageID': 'INT NULL',
+            'UnreadUserMessageCount': 'INT NULL DEFAULT 0'
+        })
+        if added:
+            click.echo(f"Added columns to Tickets: {', '.join(added)}")
+
+        if _ensure_index(db, 'Tickets', 'IX_Tickets_Status_UpdatedAt', ['Status', 'UpdatedAt']):
+            click.echo("Created index IX_Tickets_Status_UpdatedAt")
+
+        bounds = db.session.execute(text("SELECT MIN(TicketID), MAX(TicketID) FROM Tickets")).first()
+        if not bounds or bounds[0] is None:
+            click.echo("No tickets to backfill")
+            return
+
+        low, high = bounds
+        updated = 0
+        for start in range(low, high + 1, batch_size):
+            end = start + batch_size - 1
+            # Latest message per ticket, and user messages after the latest human (non-bot) admin reply
+            result = db.session.execute(text("""
+                UPDATE t SET
+                    LastMessageID = lm.MessageID,
+                    LastMessageAt = lm.CreatedAt,
+                    UnreadUserMessageCount = (
+                        SELECT COUNT(*) FROM Messages um
+                        WHERE um.TicketID = t.TicketID
+                          AND um.IsAdminReply = 0
+                          AND um.MessageID > ISNULL((
+                              SELECT MAX(am.MessageID) FROM Messages am
+                              WHERE am.TicketID = t.TicketID AND am.IsAdminReply = 1
+                                AND ISNULL(am.IsBotResponse, 0) = 0
+                          ), 0)
+                    )
+                FROM Tickets t
+                CROSS APPLY (
+                    SELECT TOP 1 m.MessageID, m.CreatedAt FROM Messages m
+                    WHERE m.TicketID = t.TicketID
+                    ORDER BY m.CreatedAt DESC, m.MessageID DESC
+                ) lm
+                WHERE t.TicketID BETWEEN :start AND :end
+            """), {'start': start, 'end': end})
+            db.session.commit()
+            updated += result.rowcount or 0
+            click.echo(f"Backfilled tickets {start}-{end} ({updated} updated so far)")
+
+        click.echo(f"Done: {updated} tickets backfilled")
+
+    @app.cli.command('build-ip-country-db')
+    @click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--output', default=None,
+                  help='Target file (defaults to IP_COUNTRY_DB_PATH)')
+    def build_ip_country_db(csv_path, output):
+        """Build the offline IP-to-country database from a CSV range dump.
+
+        CSV columns: start_ip, end_ip, country_code[, country_name]. Addresses
+        may be dotted/colon notation or integers.
+        """
+        from ip_country_db import build_database
+
+        output = output or app.config.get('IP_COUNTRY_DB_PATH')
+        result = build_database(csv_path, output)
+        click.echo(f"Wrote {output}: {result['ipv4_ranges']} IPv4 and {result['ipv6_ranges']} IPv6 ranges "
+                   f"for {result['countries']} countries ({result['skipped']} rows skipped)")
+        click.echo("Restart the app (or call location_service.load_country_db) to pick it up")
+
+    @app.cli.command('backfill-geo')
+    @click.option('--table', 'tables', multiple=True, type=click.Choice(['Tickets', 'Users']),
+                  help='Table to backfill (repeatable, default: both)')
+    @click.option('--chunk-size', default=1000, show_default=True,
+                  help='Rows read and updated per transaction')
+    @click.option('--rate-limit', default=15.0, show_default=True,
+                  help='Maximum ip-api batch requests per minute')
+    @click.option('--checkpoint', default='geo_backfill_checkpoint.json', show_default=True,
+                  help='File recording the last processed ID per table')
+    @click.option('--reset', is_flag=True, help='Ignore an existing checkpoint and start over')
+    @click.option('--skip-fallback-country', is_flag=True,
+                  help='Only fix Unknown/empty countries, keep rows set to the India fallback')
+    @click.option('--no-http', is_flag=True, help='Only use the offline database and cache')
+    def backfill_geo(tables, chunk_size, rate_limit, checkpoint, reset, skip_fallback_country, no_http):
+        """Re-resolve Country for historical tickets and users from their stored IP"""
+        import os
+        from app import db
+        from location_service import location_service
+        from geo_backfill import GeoBackfill, BACKFILL_TABLES
+
+        if reset and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        backfill = GeoBackfill(
+            db, location_service,
+            chunk_size=chunk_size,
+            requests_per_minute=rate_limit,
+            checkpoint_path=checkpoint,
+            include_fallback_country=not skip_fallback_country,
+            use_http=not no_http,
+            echo=click.echo
+        )
+        stats = backfill.run(tables or BACKFILL_TABLES)
+        click.echo(f"Done: {stats}")
+
+    @app.cli.command('classify-devices')
+    @click.option('--table', 'tables', multiple=True, type=click.Choice(['Tickets', 'Users']),
+                  help='Table to classify (repeatable, default: both)')
+    @click.option('--chunk-size', default=5000, show_default=True,
+                  help='Rows read and updated per transaction')
+    @click.option('--only-missing', is_flag=True, help='Skip rows that already have a device_type')
+    def classify_devices(tables, chunk_size, only_missing):
+        """Recompute device/browser/OS columns from the stored user_agent in bulk.
+
+        The device rollups and the fingerprint index (whose device labels
+        change) are rebuilt afterwards.
+        """
+        from app import db, Ticket, User
+        from device_fingerprints import device_fingerprints
+        from device_rollup import device_rollups
+        from device_tracker_core import classify_user_agents
+
+        models = {'Tickets': (Ticket, 'TicketID'), 'Users': (User, 'UserID')}
+        earliest_ticket = None
+        classified = 0
+        for table in tables or models:
+            model, key_column = models[table]
+            key = getattr(model, key_column)
+            last_id = 0
+            updated = 0
+
+            while True:
+                query = db.session.query(key, model.user_agent, model.CreatedAt).filter(
+                    key > last_id, model.user_agent.isnot(None)
+                )
+                if only_missing:
+                    query = query.filter(model.device_type.is_(None))
+                rows = query.order_by(key).limit(chunk_size).all()
+                if not rows:
+                    break
+
+                ids = [row[0] for row in rows]
+                columns = classify_user_agents([row[1] for row in rows])
+                db.session.bulk_update_mappings(model, [
+                    {
+                        key_column: row_id,
+                        'device_type': columns['device_type'][i],
+                        'browser': columns['browser'][i],
+                        'browser_version': columns['browser_version'][i],
+                        'operating_system': columns['operating_system'][i],
+                        'os_version': columns['os_version'][i],
+                        'device_fingerprint': columns['device_fingerprint'][i]
+                    }
+                    for i, row_id in enumerate(ids)
+                ])
+                db.session.commit()
+
+                if model is Ticket:
+                    created = [row[2] for row in rows if row[2]] + ([earliest_ticket] if earliest_ticket else [])
+                    earliest_ticket = min(created, default=None)
+                last_id = ids[-1]
+                updated += len(ids)
+                click.echo(f"{table}: classified up to {key_column} {last_id} ({updated} rows)")
+
+            classified += updated
+            click.echo(f"{table}: done, {updated} rows classified")
+
+        if earliest_ticket:
+            rows = device_rollups.rebuild(earliest_ticket.date())
+            click.echo(f"Rebuilt device rollups from {earliest_ticket.date()} ({rows} rows)")
+        if classified:
+            result = device_fingerprints.backfill(echo=click.echo)
+            click.echo(f"Rebuilt device fingerprint index ({result['devices']} devices)")
+
+    @app.cli.command('rebuild-device-rollups')
+    @click.option('--since', default=None, help='Only rebuild days from this date (YYYY-MM-DD)')
+    def rebuild_device_rollups(since):
+        """Recompute the daily device analytics rollups from the Tickets table"""
+        from datetime import datetime
+        from device_rollup import device_rollups
+
+        start = datetime.strptime(since, '%Y-%m-%d').date() if since else None
+        rows = device_rollups.rebuild(start)
+        click.echo(f"Wrote {rows} rollup rows" + (f" from {start}" if start else ""))
+
+    @app.cli.command('backfill-device-fingerprints')
+    @click.option('--batch-size', default=5000, show_default=True,
+                  help='Tickets hashed per transaction')
+    def backfill_device_fingerprints(batch_size):
+        """Add Tickets.device_fingerprint_hash and rebuild the device fingerprint index"""
+        from app import db
+        from device_fingerprints import device_fingerprints
+
+        added = _ensure_columns(db, 'Tickets', {'device_fingerprint_hash': 'VARCHAR(64) NULL'})
+        if added:
+            click.echo("Added column Tickets.device_fingerprint_hash")
+
+        if _ensure_index(db, 'Tickets', 'IX_Tickets_DeviceFingerprintHash', ['device_fingerprint_hash', 'CreatedAt']):
+            click.echo("Created index IX_Tickets_DeviceFingerprintHash")
+
+        result = device_fingerprints.backfill(batch_size=batch_size, echo=click.echo)
+        click.echo(f"Done: {result['hashed_tickets']} tickets hashed, {result['devices']} devices indexed")
+
+    @app.cli.command('check-faq-index')
+    @click.option('--threshold', default=None, type=float,
+                  help='Confidence a verbatim question must reach (default: the bot confidence threshold)')
+    def check_faq_index(threshold):
+        """Ask every FAQ/CommonQuery its own question and list those the faq bot would not answer"""
+        from bot_service import bot_service
+        from faq_retrieval import faq_index
+
+        threshold = threshold if threshold is not None else bot_service.confidence_threshold
+        faq_index.refresh(force=True)
+        failures = faq_index.check_questions(threshold)
+        for failure in failures:
+            click.echo(f"{failure['source']} {failure['id']}: {failure['question']!r} -> "
+                       f"{failure['answered_by']} at confidence {failure['confidence']}")
+        click.echo(f"{len(failures)} of {faq_index.get_statistics()['documents']} questions "
+                   f"not answered at confidence {threshold}")
+        if failures:
+            raise SystemExit(1)
+
+    @app.cli.command('backfill-bot-attempts')
+    def backfill_bot_attempts():
+        """Add Tickets.bot_attempts and fill it from BotInteraction counts"""
+        from app import db
+
+        added = _ensure_columns(db, 'Tickets', {'bot_attempts': 'INT NOT NULL DEFAULT 0'})
+        if added:
+            click.echo("Added column Tickets.bot_attempts")
+
+        # Flush buffered interaction logs first so the counts include them
+        from bot_service import bot_service
+        bot_service.interaction_writer.flush()
+
+        result = db.session.execute(text("""
+            UPDATE t SET bot_attempts = ISNULL(b.attempts, 0)
+            FROM Tickets t
+            LEFT JOIN (
+                SELECT ticket_id, COUNT(*) AS attempts
+                FROM bot_interactions
+                WHERE ticket_id IS NOT NULL
+                GROUP BY ticket_id
+            ) b ON b.ticket_id = t.TicketID
+            WHERE t.bot_attempts IS NULL OR t.bot_attempts <> ISNULL(b.attempts, 0)
+        """))
+        db.session.commit()
+        click.echo(f"Updated bot_attempts on {result.rowcount} tickets")
@@ -119,7 +119,7 @@ class BotConfiguration(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
-    bot_type = db.Column(db.String(50), nullable=False)  # dialogflow, rasa, custom
+    bot_type = db.Column(db.String(50), nullable=False)  # dialogflow, rasa, custom, faq
     api_endpoint = db.Column(db.String(500), nullable=True)
     api_key = db.Column(db.String(255), nullable=True)
     config_data = db.Column(db.Text, nullable=True)  # JSON configuration
@@ -149,6 +149,118 @@ class BotInteraction(db.Model):
     # Relationships
     ticket = db.relationship('Ticket', backref=db.backref('bot_interactions', lazy=True))
 
+class OutboxEvent(db.Model):
+    """Durable side-effect queue processed by background workers"""
+    __tablename__ = 'outbox_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # ticket.geolocate, ticket.bot_reply, ticket.odoo_sync
+    ticket_id = db.Column(db.Integer, db.ForeignKey('Tickets.TicketID'), nullable=True)
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    status = db.Column(db.String(20), default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)  # Earliest time a worker may pick it up
+    locked_at = db.Column(db.DateTime, nullable=True)  # When a worker claimed it
+    processed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('IX_outbox_events_status_available', 'status', 'available_at'),
+    )
+
+class IdempotencyKey(db.Model):
+    """Stored responses for client retries carrying an Idempotency-Key header"""
+    __tablename__ = 'idempotency_keys'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False)  # Client supplied Idempotency-Key
+    scope = db.Column(db.String(255), nullable=False)  # Request method, path and client (user or IP) the key was used on
+    request_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the request payload
+    status = db.Column(db.String(20), default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_content_type = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='UQ_idempotency_keys_scope_key'),
+        db.Index('IX_idempotency_keys_expires_at', 'expires_at'),
+    )
+
+class DeviceDailyRollup(db.Model):
+    """Tickets per day and device/browser/OS for the device analytics.
+    
+    Ticket creation appends delta rows (compacted=False); the compactor folds
+    them into one compacted row per (day, device_type, browser, operating_system).
+    """
+    __tablename__ = 'device_daily_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    device_type = db.Column(db.String(20), nullable=False, default='Unknown')
+    browser = db.Column(db.String(50), nullable=False, default='Unknown')
+    operating_system = db.Column(db.String(50), nullable=False, default='Unknown')
+    ticket_count = db.Column(db.Integer, nullable=False, default=0)
+    compacted = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('IX_device_daily_rollups_day', 'day', 'compacted'),
+        db.Index('IX_device_daily_rollups_compacted', 'compacted', 'id'),
+    )
+
+class DeviceFingerprint(db.Model):
+    """One row per distinct device (user agent string + client IP), looked up by its hash"""
+    __tablename__ = 'device_fingerprints'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint_hash = db.Column(db.String(64), nullable=False)  # SHA-256 hex of user agent + client IP
+    device_fingerprint = db.Column(db.String(255), nullable=True)  # Device class label (type_browser_os)
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    ticket_count = db.Column(db.Integer, default=0)
+    login_count = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('fingerprint_hash', name='UQ_device_fingerprints_hash'),
+    )
+
+class DeviceFingerprintEvent(db.Model):
+    """A ticket or login seen on a device, waiting to be folded into device_fingerprints.
+    
+    Requests only insert these rows, so the few very common fingerprints never
+    become hot rows; the compactor merges them in the background.
+    """
+    __tablename__ = 'device_fingerprint_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint_hash = db.Column(db.String(64), nullable=False)
+    device_fingerprint = db.Column(db.String(255), nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    is_login = db.Column(db.Boolean, nullable=False, default=False)  # Login or registration, else a ticket
+    seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('IX_device_fingerprint_events_hash', 'fingerprint_hash'),
+    )
+
+class DeviceFingerprintUser(db.Model):
+    """Users seen on a device fingerprint"""
+    __tablename__ = 'device_fingerprint_users'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint_id = db.Column(db.Integer, db.ForeignKey('device_fingerprints.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.UserID'), nullable=False)
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('fingerprint_id', 'user_id', name='UQ_device_fingerprint_users'),
+        db.Index('IX_device_fingerprint_users_user', 'user_id'),
+    )
+
 # Extended Ticket model fields (we'll add these via migrations)
 """
 Additional fields to add to existing Ticket model:
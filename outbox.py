@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Outbox Service
+Durable background pipeline for side effects of ticket writes
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+class OutboxService:
+    """Runs side effects (geolocation, bot replies, Odoo sync) outside the request.
+
+    Events are written to the `outbox_events` table in the same transaction as
+    the ticket, so they survive restarts. Worker threads claim pending events,
+    run the registered handler and retry failures with exponential backoff.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.worker_count = 2
+        self.poll_interval = 5  # Seconds between polls when nobody calls notify()
+        self.batch_size = 10
+        self.max_attempts = 5
+        self.retry_base_delay = 10  # Seconds, doubled after each failed attempt
+        self.lock_timeout = 300  # Reclaim events stuck in 'processing' after 5 minutes
+        self.running = False
+        self.handlers: Dict[str, Callable] = {}
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+
+    def register(self, event_type: str, handler: Callable):
+        """Register handler(ticket_id, payload) for an event type"""
+        self.handlers[event_type] = handler
+
+    def enqueue(self, event_type: str, ticket_id: int = None, payload: Dict = None,
+                delay_seconds: float = 0):
+        """Add an event to the current database session.
+
+        The event becomes visible to workers when the caller commits; call
+        notify() afterwards to have it picked up immediately. `delay_seconds`
+        holds it back, e.g. while the request still tries the work itself.
+        """
+        from app import db
+        from models import OutboxEvent
+
+        event = OutboxEvent(
+            event_type=event_type,
+            ticket_id=ticket_id,
+            payload=json.dumps(payload) if payload else None,
+            status='pending',
+            attempts=0,
+            available_at=datetime.utcnow() + timedelta(seconds=delay_seconds)
+        )
+        db.session.add(event)
+        return event
+
+    def notify(self):
+        """Wake the workers after committing new events"""
+        self._wakeup.set()
+
+    def start(self):
+        """Start the worker threads"""
+        if self.running:
+            return
+
+        self.running = True
+        for index in range(self.worker_count):
+            thread = threading.Thread(target=self._worker_loop, name=f"outbox-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Outbox service started with {self.worker_count} workers")
+
+    def stop(self):
+        """Stop the worker threads"""
+        self.running = False
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+        logger.info("Outbox service stopped")
+
+    def _worker_loop(self):
+        """Claim and process events until stopped"""
+        while self.running:
+            try:
+                with self.app.app_context():
+                    processed = self.process_pending()
+
+                if not processed:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+            except Exception as e:
+                logger.error(f"Error in outbox worker loop: {e}")
+                time.sleep(self.poll_interval)
+
+    def process_pending(self) -> int:
+        """Claim one batch of due events and run their handlers"""
+        event_ids = self._claim_batch()
+        for event_id in event_ids:
+            self._process_event(event_id)
+        return len(event_ids)
+
+    def _claim_batch(self) -> List[int]:
+        """Atomically mark a batch of due events as processing and return their IDs"""
+        from app import db
+
+        now = datetime.utcnow()
+        try:
+            # READPAST lets concurrent workers (and processes) skip rows already being claimed
+            result = db.session.execute(text("""
+                UPDATE TOP (:batch_size) outbox_events WITH (ROWLOCK, READPAST)
+                SET status = 'processing', locked_at = :now, attempts = attempts + 1
+                OUTPUT inserted.id
+                WHERE (status = 'pending' AND available_at <= :now)
+                   OR (status = 'processing' AND locked_at < :stale_before)
+            """), {
+                'batch_size': self.batch_size,
+                'now': now,
+                'stale_before': now - timedelta(seconds=self.lock_timeout)
+            })
+            event_ids = [row[0] for row in result]
+            db.session.commit()
+            return event_ids
+        except Exception as e:
+            logger.error(f"Error claiming outbox events: {e}")
+            db.session.rollback()
+            return []
+
+    def _process_event(self, event_id: int):
+        """Run the handler for one claimed event and record the outcome"""
+        from app import db
+        from models import OutboxEvent
+
+        event = OutboxEvent.query.get(event_id)
+        if not event:
+            return
+
+        handler = self.handlers.get(event.event_type)
+        started = time.time()
+
+        try:
+            if not handler:
+                raise ValueError(f"No outbox handler registered for {event.event_type}")
+
+            payload = json.loads(event.payload) if event.payload else {}
+            handler(event.ticket_id, payload)
+
+            event = OutboxEvent.query.get(event_id)
+            event.status = 'done'
+            event.processed_at = datetime.utcnow()
+            event.last_error = None
+            db.session.commit()
+            logger.info(f"Outbox event {event_id} ({event.event_type}) done in {(time.time() - started) * 1000:.0f}ms")
+
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Outbox event {event_id} failed: {e}")
+            self._mark_failed(event_id, str(e))
+
+    def _mark_failed(self, event_id: int, error: str):
+        """Schedule a retry with backoff, or give up after max_attempts"""
+        from app import db
+        from models import OutboxEvent
+
+        try:
+            event = OutboxEvent.query.get(event_id)
+            if not event:
+                return
+
+            event.last_error = error[:4000]
+            event.locked_at = None
+            if (event.attempts or 0) >= self.max_attempts:
+                event.status = 'failed'
+                logger.error(f"Outbox event {event_id} ({event.event_type}) gave up after {event.attempts} attempts")
+            else:
+                delay = self.retry_base_delay * (2 ** max((event.attempts or 1) - 1, 0))
+                event.status = 'pending'
+                event.available_at = datetime.utcnow() + timedelta(seconds=delay)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Error recording outbox failure for event {event_id}: {e}")
+            db.session.rollback()
+
+    def get_statistics(self) -> Dict:
+        """Count events per status"""
+        from app import db
+        from models import OutboxEvent
+        from sqlalchemy import func
+
+        rows = db.session.query(OutboxEvent.status, func.count(OutboxEvent.id)).group_by(OutboxEvent.status).all()
+        return {
+            'running': self.running,
+            'workers': self.worker_count,
+            'events': {status: count for status, count in rows}
+        }
+
+# Global outbox instance
+outbox = OutboxService()
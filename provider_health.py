@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Provider Health Tracking
+Circuit breakers, latency histograms and health scores for external providers
+"""
+
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open ended
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    rejects calls for `cooldown` seconds. It then lets a single probe through
+    (half-open): success closes it again, failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to the provider right now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            # Half-open: only one probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def is_available(self) -> bool:
+        """Non-mutating check used for ordering (does not reserve a probe)"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not (self.state == self.HALF_OPEN and self._probe_in_flight)
+
+    def to_dict(self) -> Dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'times_opened': self.times_opened,
+            'retry_in': max(0.0, round(self.cooldown - (time.monotonic() - self.opened_at), 1))
+                        if self.state == self.OPEN else 0.0
+        }
+
+class ProviderHealth:
+    """Recent success rate and latency of one provider, plus its circuit breaker"""
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 30,
+                 alpha: float = 0.2, default_latency_ms: float = 500):
+        self.name = name
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.alpha = alpha  # Weight of the newest sample in the moving averages
+        self.ewma_latency_ms = default_latency_ms
+        self.success_rate = 1.0
+        self.calls = 0
+        self.failures = 0
+        self.histogram: List[int] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, success: bool):
+        """Add one call outcome"""
+        with self._lock:
+            self.calls += 1
+            if not success:
+                self.failures += 1
+            self.ewma_latency_ms += self.alpha * (latency_ms - self.ewma_latency_ms)
+            self.success_rate += self.alpha * ((1.0 if success else 0.0) - self.success_rate)
+            self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def score(self) -> float:
+        """Expected cost of trying this provider, lower is better"""
+        return self.ewma_latency_ms / max(self.success_rate, 0.05)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Approximate latency percentile (bucket upper bound) from the histogram"""
+        with self._lock:
+            total = sum(self.histogram)
+            if not total:
+                return None
+            threshold = fraction * total
+            running = 0
+            for index, count in enumerate(self.histogram):
+                running += count
+                if running >= threshold:
+                    # The open-ended last bucket reports its lower bound
+                    return float(LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)])
+        return None
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'failures': self.failures,
+            'success_rate': round(self.success_rate, 3),
+            'ewma_latency_ms': round(self.ewma_latency_ms, 1),
+            'p95_latency_ms': self.percentile(0.95),
+            'score': round(self.score(), 1),
+            'latency_histogram': dict(zip(labels, self.histogram)),
+            'circuit': self.breaker.to_dict()
+        }
@@ -179,10 +179,22 @@ document.addEventListener('DOMContentLoaded', () => {
     chatSocket.on('new_message', (data) => {
         console.log('📨 User received new message:', data);
         if (data.ticket_id === currentTicketId) {
+            // A streamed bot reply is already on screen; swap in the stored message
+            const streamed = streamedBotMessages[data.id];
+            if (streamed) {
+                delete streamedBotMessages[data.id];
+                streamed.remove();
+            }
             addChatMessage(data.content, data.is_admin ? 'admin' : 'user', data.created_at);
         }
     });
 
+    chatSocket.on('bot_message_chunk', (data) => {
+        if (data.ticket_id === currentTicketId) {
+            handleBotMessageChunk(data);
+        }
+    });
+
     chatSocket.on('error', (error) => {
         console.error('🚨 User WebSocket error:', error);
     });
@@ -954,6 +966,38 @@ function addChatMessage(content, type, timestamp) {
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
 }
 
+// Streamed bot replies: stream_id -> bubble while streaming, message_id -> bubble once stored
+const botMessageStreams = {};
+const streamedBotMessages = {};
+
+function handleBotMessageChunk(data) {
+    let bubble = botMessageStreams[data.stream_id];
+    if (!bubble) {
+        if (data.done) {
+            return;
+        }
+        const messagesContainer = document.getElementById('chat-messages-container');
+        bubble = document.createElement('div');
+        bubble.className = 'message admin streaming';
+        messagesContainer.appendChild(bubble);
+        botMessageStreams[data.stream_id] = bubble;
+    }
+
+    if (!data.done) {
+        bubble.appendChild(document.createTextNode(data.delta));
+        const messagesContainer = document.getElementById('chat-messages-container');
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        return;
+    }
+
+    delete botMessageStreams[data.stream_id];
+    if (data.discarded || !data.message_id) {
+        bubble.remove();
+    } else {
+        streamedBotMessages[data.message_id] = bubble;
+    }
+}
+
 // Create chat message HTML
 function createChatMessageHTML(content, type, timestamp) {
     const avatar = type === 'admin' ? 'A' : 'U';
@@ -958,6 +958,9 @@ def manage_bot_config():
             db.session.add(config)
             db.session.commit()
             
+            from bot_service import bot_service
+            bot_service.invalidate_config_cache()
+            
             log_admin_action('create', 'bot_config', config.id, data)
             
             return jsonify({
@@ -1291,6 +1294,9 @@ def save_bot_config():
         
         db.session.commit()
         
+        from bot_service import bot_service
+        bot_service.invalidate_config_cache()
+        
         log_admin_action('update', 'bot_config', config.id, data)
         
         return jsonify({
@@ -1310,6 +1316,8 @@ def get_bot_status():
     try:
         from app import db
         from models import BotInteraction
+        from bot_service import bot_service
+        from http_client import http_client
         from datetime import datetime, timedelta
         
         # Get bot interactions from last 24 hours
@@ -1337,6 +1345,14 @@ def get_bot_status():
                 'accuracy': round(accuracy, 1),
                 'total_interactions': total_interactions,
                 'avg_response_time': round(avg_response_time, 0)
+            },
+            'interaction_log': bot_service.interaction_writer.get_statistics(),
+            'http': http_client.get_statistics(),
+            'first_chunk_latency': bot_service.first_chunk_latency.to_dict(),
+            'hedging': bot_service.hedger.get_statistics(),
+            'answer_cache': bot_service.answer_cache.get_statistics(),
+            'providers': {
+                config_id: health.to_dict() for config_id, health in list(bot_service.provider_latency.items())
             }
         })
         
@@ -1794,13 +1810,13 @@ def get_dashboard_metrics_fixed():
         last_24h = current_time - timedelta(hours=24)
         last_week = current_time - timedelta(days=7)
         
-        # Basic ticket counts
-        total_tickets = db.session.query(func.count(Ticket.TicketID)).scalar() or 0
+        # Basic ticket counts from the incrementally maintained counters
+        from ticket_counters import ticket_counters
+        
+        total_tickets = ticket_counters.count()
         logger.info(f"Total tickets: {total_tickets}")
         
-        active_tickets = db.session.query(func.count(Ticket.TicketID)).filter(
-            Ticket.Status.in_(['open', 'in_progress'])
-        ).scalar() or 0
+        active_tickets = ticket_counters.count(statuses=('open', 'in_progress'))
         logger.info(f"Active tickets: {active_tickets}")
         
         # New tickets in last 24h
@@ -1893,6 +1909,83 @@ def get_dashboard_metrics_fixed():
             'lastUpdated': datetime.utcnow().isoformat()
         })
 
+@super_admin_bp.route('/api/dashboard/counters/rebuild', methods=['POST'])
+@super_admin_required
+def rebuild_dashboard_counters():
+    """Rebuild the ticket counters used by the dashboard endpoints"""
+    try:
+        from ticket_counters import ticket_counters
+        
+        total = ticket_counters.rebuild()
+        log_admin_action('rebuild', 'ticket_counters', None, {'total_tickets': total})
+        
+        return jsonify({
+            'success': True,
+            'message': 'Ticket counters rebuilt successfully',
+            'counters': ticket_counters.snapshot()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error rebuilding ticket counters: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@super_admin_bp.route('/api/location/cache-stats', methods=['GET'])
+@super_admin_required
+def get_location_cache_stats():
+    """Hit/miss counters for the IP geolocation cache"""
+    try:
+        from location_service import location_service
+
+        return jsonify({
+            'success': True,
+            'stats': location_service.get_cache_stats()
+        })
+
+    except Exception as e:
+        logger.error(f"Error getting location cache stats: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@super_admin_bp.route('/api/location/provider-stats', methods=['GET'])
+@super_admin_required
+def get_location_provider_stats():
+    """Circuit breaker state and latency histograms of the geolocation providers"""
+    try:
+        from location_service import location_service
+
+        return jsonify({
+            'success': True,
+            'stats': location_service.get_provider_stats()
+        })
+
+    except Exception as e:
+        logger.error(f"Error getting location provider stats: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@super_admin_bp.route('/api/analytics/devices', methods=['GET'])
+@super_admin_required
+def get_device_analytics():
+    """Device type/browser/OS share of tickets from the daily rollups"""
+    try:
+        from device_tracker_core import DeviceAnalytics
+
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+
+        return jsonify({
+            'success': True,
+            'start_date': start_date,
+            'end_date': end_date,
+            'stats': DeviceAnalytics.get_device_stats(start, end)
+        })
+
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
+    except Exception as e:
+        logger.error(f"Error getting device analytics: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @super_admin_bp.route('/api/critical-alerts', methods=['GET'])
 @super_admin_required
 def get_critical_alerts_fixed():
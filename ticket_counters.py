@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Ticket Counter Service
+Incrementally maintained ticket counts for the admin dashboards
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy import inspect as sa_inspect
+
+logger = logging.getLogger(__name__)
+
+SESSION_DELTAS_KEY = 'ticket_counter_deltas'
+
+class TicketCounters:
+    """Keeps ticket counts keyed by (status, priority, category) in process memory.
+
+    Changes are collected from the SQLAlchemy session while it flushes and are
+    only applied once the surrounding transaction commits, so rolled back work
+    never shows up in the counts. The counts are rebuilt from the database on
+    first use, on demand and every `rebuild_interval` seconds to pick up writes
+    made by other processes.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.db = None
+        self.ticket_model = None
+        self.rebuild_interval = 300  # Reconcile with the database every 5 minutes
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+        # Deltas committed while a rebuild is reading, one map per running rebuild
+        self._rebuild_deltas: List[Dict] = []
+        self._built_at = None
+        self._stale = True
+
+    def init_app(self, app, db, ticket_model):
+        """Bind to the application database and start tracking ticket writes"""
+        self.app = app
+        self.db = db
+        self.ticket_model = ticket_model
+
+        event.listen(db.session, 'before_flush', self._before_flush)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+        logger.info("Ticket counters attached to database session")
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict:
+        """Return total and per status/priority/category ticket counts"""
+        self._ensure_fresh()
+
+        with self._lock:
+            items = list(self._counts.items())
+
+        by_status = defaultdict(int)
+        by_priority = defaultdict(int)
+        by_category = defaultdict(int)
+        total = 0
+
+        for (status, priority, category_id), count in items:
+            if count <= 0:
+                continue
+            total += count
+            by_status[status] += count
+            by_priority[priority] += count
+            by_category[category_id] += count
+
+        return {
+            'total': total,
+            'by_status': dict(by_status),
+            'by_priority': dict(by_priority),
+            'by_category': dict(by_category),
+            'built_at': self._built_at
+        }
+
+    def count(self, statuses=None, priority: str = None, category_id: int = None) -> int:
+        """Count tickets matching the given statuses, priority and category"""
+        self._ensure_fresh()
+
+        with self._lock:
+            items = list(self._counts.items())
+
+        return sum(
+            count for (status, ticket_priority, ticket_category), count in items
+            if (statuses is None or status in statuses)
+            and (priority is None or ticket_priority == priority)
+            and (category_id is None or ticket_category == category_id)
+        )
+
+    def rebuild(self) -> int:
+        """Recompute all counts from the Tickets table with a single GROUP BY.
+
+        Deltas committed while the query runs may be missing from its result,
+        so they are collected on the side and applied to the new map before it
+        replaces the old one.
+        """
+        Ticket = self.ticket_model
+        late_deltas = defaultdict(int)
+        with self._lock:
+            self._rebuild_deltas.append(late_deltas)
+
+        try:
+            rows = self.db.session.query(
+                Ticket.Status, Ticket.Priority, Ticket.CategoryID, func.count(Ticket.TicketID)
+            ).group_by(Ticket.Status, Ticket.Priority, Ticket.CategoryID).all()
+        except Exception:
+            with self._lock:
+                self._rebuild_deltas.remove(late_deltas)
+            raise
+
+        counts = defaultdict(int)
+        for status, priority, category_id, count in rows:
+            counts[self._make_key(status, priority, category_id)] += count
+
+        with self._lock:
+            self._rebuild_deltas.remove(late_deltas)
+            for key, delta in late_deltas.items():
+                counts[key] += delta
+            self._counts = counts
+            self._built_at = time.time()
+            self._stale = False
+
+        total = sum(counts.values())
+        logger.info(f"Ticket counters rebuilt: {total} tickets in {len(counts)} buckets")
+        return total
+
+    def _ensure_fresh(self):
+        """Rebuild the counts if they were never built, are stale or too old"""
+        if (self._stale or self._built_at is None
+                or time.time() - self._built_at > self.rebuild_interval):
+            self.rebuild()
+
+    # ------------------------------------------------------------------
+    # Session tracking
+    # ------------------------------------------------------------------
+
+    def _before_flush(self, session, flush_context, instances):
+        """Record counter deltas for tickets created, changed or deleted in this flush"""
+        if self.ticket_model is None:
+            return
+
+        deltas = session.info.setdefault(SESSION_DELTAS_KEY, defaultdict(int))
+
+        try:
+            for obj in session.new:
+                if isinstance(obj, self.ticket_model):
+                    deltas[self._current_key(obj)] += 1
+
+            for obj in session.deleted:
+                if isinstance(obj, self.ticket_model):
+                    old_key = self._previous_key(obj)
+                    if old_key is None:
+                        self._stale = True
+                    else:
+                        deltas[old_key] -= 1
+
+            for obj in session.dirty:
+                if not isinstance(obj, self.ticket_model) or obj in session.deleted:
+                    continue
+
+                new_key = self._current_key(obj)
+                old_key = self._previous_key(obj)
+                if old_key is None:
+                    # Old value was never loaded - fall back to a rebuild on next read
+                    self._stale = True
+                elif old_key != new_key:
+                    deltas[old_key] -= 1
+                    deltas[new_key] += 1
+        except Exception as e:
+            logger.error(f"Error tracking ticket counter changes: {e}")
+            self._stale = True
+
+    def _after_commit(self, session):
+        """Apply the deltas collected during the committed transaction"""
+        deltas = session.info.pop(SESSION_DELTAS_KEY, None)
+        if not deltas:
+            return
+
+        with self._lock:
+            for key, delta in deltas.items():
+                if delta:
+                    self._counts[key] += delta
+                    for late_deltas in self._rebuild_deltas:
+                        late_deltas[key] += delta
+
+    def _after_rollback(self, session):
+        """Discard deltas from a rolled back transaction"""
+        session.info.pop(SESSION_DELTAS_KEY, None)
+
+    def _current_key(self, ticket) -> Tuple:
+        return self._make_key(ticket.Status, ticket.Priority, ticket.CategoryID)
+
+    def _previous_key(self, ticket) -> Optional[Tuple]:
+        """Key the ticket was counted under before the pending changes"""
+        state = sa_inspect(ticket)
+        values = []
+
+        for attr_name in ('Status', 'Priority', 'CategoryID'):
+            history = state.attrs[attr_name].history
+            if history.deleted:
+                values.append(history.deleted[0])
+            elif history.added:
+                # Value was replaced without the previous one ever being loaded
+                return None
+            else:
+                # Unchanged (possibly expired) attribute, the current value is the old one
+                values.append(getattr(ticket, attr_name))
+
+        return self._make_key(*values)
+
+    @staticmethod
+    def _make_key(status, priority, category_id) -> Tuple:
+        # Column defaults are only applied on insert, normalize them here
+        return (status or 'open', priority or 'medium', category_id)
+
+# Global ticket counters instance
+ticket_counters = TicketCounters()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Ticket Side Effects
+Outbox handlers that fill in ticket data from external systems after commit
+"""
+
+import logging
+import uuid
+from datetime import datetime
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Event types written by ticket creation
+GEOLOCATE_EVENT = 'ticket.geolocate'
+BOT_REPLY_EVENT = 'ticket.bot_reply'
+ODOO_SYNC_EVENT = 'ticket.odoo_sync'
+
+BOT_CONFIDENCE_THRESHOLD = 0.7
+
+def enqueue_ticket_side_effects(outbox, ticket, message_text, client_ip, user=None,
+                                skip=(), delay_seconds=0):
+    """Queue the post-commit side effects for a newly created ticket.
+
+    Returns the queued events keyed by event type.
+    """
+    events = {}
+    if GEOLOCATE_EVENT not in skip:
+        events[GEOLOCATE_EVENT] = outbox.enqueue(GEOLOCATE_EVENT, ticket.TicketID, {
+            'client_ip': client_ip,
+            'user_id': user.UserID if user and user.Country in (None, '', 'Unknown') else None
+        }, delay_seconds=delay_seconds)
+    if BOT_REPLY_EVENT not in skip:
+        events[BOT_REPLY_EVENT] = outbox.enqueue(BOT_REPLY_EVENT, ticket.TicketID, {
+            'message': message_text
+        }, delay_seconds=delay_seconds)
+    if ODOO_SYNC_EVENT not in skip:
+        events[ODOO_SYNC_EVENT] = outbox.enqueue(ODOO_SYNC_EVENT, ticket.TicketID, {
+            'message': message_text
+        }, delay_seconds=delay_seconds)
+    return events
+
+def handle_geolocate(ticket_id, payload):
+    """Resolve the client's country and store it on the ticket (and new user)"""
+    from app import db, Ticket, User, location_service
+
+    ticket = Ticket.query.get(ticket_id)
+    if not ticket:
+        return
+
+    location_info = location_service.detect_country_by_ip(payload.get('client_ip') or 'current')
+    if not location_info or not location_info.get('country'):
+        logger.warning(f"Could not detect country for ticket {ticket_id}")
+        return
+
+    user_id = payload.get('user_id')
+    user = User.query.get(user_id) if user_id else None
+    country = apply_country(ticket, location_info['country'], user)
+
+    db.session.commit()
+    logger.info(f"Country for ticket {ticket_id} resolved to {country}")
+
+def apply_country(ticket, country, user=None):
+    """Fill in a detected country on the ticket and user where still unknown"""
+    if not ticket.Country or ticket.Country == 'Unknown':
+        ticket.Country = country
+    if user is not None and (not user.Country or user.Country == 'Unknown'):
+        user.Country = country
+    return country
+
+def apply_bot_reply(ticket, bot_response):
+    """Store a bot result on the ticket, adding the reply message when confident.
+
+    Returns the bot Message when one was added. The caller commits.
+    """
+    from app import db, Message, record_ticket_message
+
+    ticket.bot_attempted = True
+
+    if bot_response and bot_response.get('confidence', 0) >= BOT_CONFIDENCE_THRESHOLD:
+        # Bot provided a confident response
+        bot_message = Message(
+            TicketID=ticket.TicketID,
+            SenderID=None,  # Bot response
+            Content=bot_response['response'],
+            IsAdminReply=True,
+            IsBotResponse=True
+        )
+        db.session.add(bot_message)
+        db.session.flush()
+        record_ticket_message(ticket, bot_message)
+        ticket.resolution_method = 'bot'
+        logger.info(f"Bot provided confident response for ticket {ticket.TicketID}")
+        return bot_message
+
+    # Bot response not confident enough, escalate to human
+    ticket.escalation_level = 1
+    ticket.resolution_method = 'human'
+    logger.info(f"Bot response not confident enough, escalating ticket {ticket.TicketID} to human")
+    return None
+
+def emit_ticket_message(message):
+    """Push a stored message to the ticket's SocketIO room"""
+    from app import socketio, format_timestamp_with_tz
+
+    try:
+        socketio.emit('new_message', {
+            'ticket_id': message.TicketID,
+            'id': message.MessageID,
+            'content': message.Content,
+            'is_admin': message.IsAdminReply,
+            'is_bot': message.IsBotResponse,
+            'created_at': format_timestamp_with_tz(message.CreatedAt),
+            'attachments': []
+        }, room=f"ticket_{message.TicketID}")
+    except Exception as e:
+        # The message is already stored, clients will pick it up on their next poll
+        logger.warning(f"Could not push message {message.MessageID} to ticket room: {e}")
+
+class BotReplyStream:
+    """on_chunk callback that pushes partial bot replies to the ticket's room.
+
+    Clients append `bot_message_chunk` deltas with the same stream_id to one
+    bubble. finish() sends a closing chunk carrying the stored message id, or
+    discarded=True when the reply was not kept (low confidence or bot error).
+    """
+
+    def __init__(self, ticket_id):
+        self.ticket_id = ticket_id
+        self.stream_id = uuid.uuid4().hex
+        self.sequence = 0
+
+    def _emit(self, data):
+        from app import socketio
+
+        try:
+            socketio.emit('bot_message_chunk', dict(data, ticket_id=self.ticket_id, stream_id=self.stream_id),
+                          room=f"ticket_{self.ticket_id}")
+        except Exception as e:
+            logger.warning(f"Could not stream bot reply to ticket {self.ticket_id}: {e}")
+
+    def __call__(self, delta):
+        self.sequence += 1
+        self._emit({'sequence': self.sequence, 'delta': delta, 'done': False})
+
+    def finish(self, message=None):
+        if not self.sequence:
+            return
+        self._emit({
+            'sequence': self.sequence + 1,
+            'delta': '',
+            'done': True,
+            'message_id': message.MessageID if message else None,
+            'discarded': message is None
+        })
+
+def handle_bot_reply(ticket_id, payload):
+    """Run the Level 0 bot on the first message and post its reply"""
+    from app import db, Ticket, bot_service
+
+    ticket = Ticket.query.get(ticket_id)
+    if not ticket or ticket.bot_attempted:
+        # Already handled (e.g. a retry after the reply was committed)
+        return
+
+    stream = BotReplyStream(ticket_id) if bot_service.stream_replies else None
+    bot_message = None
+    try:
+        bot_response = bot_service.process_query(payload.get('message', ''), ticket_id, on_chunk=stream)
+        stored = apply_bot_reply(ticket, bot_response)
+        db.session.commit()
+        bot_message = stored
+    finally:
+        # Close the streamed bubble even when storing fails (discarded); a retry streams a new one
+        if stream:
+            stream.finish(bot_message)
+
+    if bot_message:
+        emit_ticket_message(bot_message)
+
+def handle_odoo_sync(ticket_id, payload):
+    """Create the customer and helpdesk ticket in Odoo and store their IDs"""
+    from app import db, Ticket, odoo_service
+
+    if not odoo_service:
+        logger.warning("Odoo service not available for ticket sync")
+        return
+
+    ticket = Ticket.query.get(ticket_id)
+    if not ticket or ticket.odoo_ticket_id:
+        return
+
+    logger.info(f"Syncing ticket {ticket_id} to Odoo Online...")
+
+    # First, create/find customer in Odoo
+    odoo_customer_id = ticket.odoo_customer_id
+    user = ticket.user
+    if not odoo_customer_id and user and user.Email:
+        odoo_customer_id = odoo_service.create_customer(
+            name=user.Name,
+            email=user.Email,
+            comment=f"Organization: {user.OrganizationName}" if user.OrganizationName else None
+        )
+        logger.info(f"Created/found customer in Odoo with ID: {odoo_customer_id}")
+        if odoo_customer_id:
+            # Store right away so a retry does not create the customer twice
+            ticket.odoo_customer_id = odoo_customer_id
+            db.session.commit()
+
+    odoo_ticket_id = odoo_service.create_ticket(
+        name=ticket.Subject,
+        description=f"Ticket #{ticket.TicketID} from {ticket.OrganizationName}\n\nMessage: {payload.get('message', '')}",
+        partner_id=odoo_customer_id,
+        priority='2' if ticket.Priority == 'high' else '1',  # Odoo priority mapping
+        tag_ids=['chatbot-created']
+    )
+
+    ticket.odoo_ticket_id = odoo_ticket_id
+    ticket.UpdatedAt = datetime.utcnow()
+    db.session.commit()
+    logger.info(f"✅ Ticket {ticket_id} synced to Odoo ticket {odoo_ticket_id}")
+
+def run_ticket_fanout(ticket, user, message_text, client_ip, events, deadline_ms=800):
+    """Run geolocation, the bot and the Odoo customer lookup concurrently.
+
+    Used when the bot reply has to be part of the create_ticket response. The
+    calls share one deadline; results that arrive in time are applied to the
+    ticket and their outbox events closed. Calls still running at the deadline
+    keep their (delayed) events and settle them when they finish, so the
+    outbox workers only repeat calls that failed. The caller commits. Returns
+    the bot Message, if any.
+    """
+    from app import app, socketio, bot_service, location_service, odoo_service
+    from fanout import DeadlineFanOut
+
+    fanout = DeadlineFanOut(deadline_ms, app=app, cooperative=socketio.async_mode == 'eventlet')
+    fanout.submit(GEOLOCATE_EVENT, location_service.detect_country_by_ip, client_ip or 'current')
+    fanout.submit(BOT_REPLY_EVENT, bot_service.process_query, message_text, ticket.TicketID)
+    if odoo_service and user and user.Email and not ticket.odoo_customer_id:
+        fanout.submit(ODOO_SYNC_EVENT, odoo_service.create_customer,
+                      name=user.Name,
+                      email=user.Email,
+                      comment=f"Organization: {user.OrganizationName}" if user.OrganizationName else None)
+
+    results = fanout.wait()
+    done = set()
+    bot_message = None
+
+    location_info = results.get(GEOLOCATE_EVENT)
+    if location_info and location_info.get('country'):
+        apply_country(ticket, location_info['country'], user)
+        done.add(GEOLOCATE_EVENT)
+
+    if BOT_REPLY_EVENT in results:
+        bot_message = apply_bot_reply(ticket, results[BOT_REPLY_EVENT])
+        done.add(BOT_REPLY_EVENT)
+
+    if results.get(ODOO_SYNC_EVENT):
+        # Only the customer is resolved here, the helpdesk ticket is still created by the worker
+        ticket.odoo_customer_id = results[ODOO_SYNC_EVENT]
+
+    now = datetime.utcnow()
+    for event_type, event in events.items():
+        if event_type in done:
+            event.status = 'done'
+            event.processed_at = now
+        elif event_type in fanout.missed:
+            fanout.on_late_result(event_type, partial(
+                settle_late_result, event.id, ticket.TicketID, event_type, user.UserID if user else None
+            ))
+        else:
+            event.available_at = now
+
+    return bot_message
+
+def settle_late_result(event_id, ticket_id, event_type, user_id, result):
+    """Apply a fan-out result that missed the deadline and settle its outbox event.
+
+    A usable result closes the event (the Odoo event only records the customer
+    and is released, its helpdesk ticket is still the worker's job); a failed
+    or empty one releases the event to the workers right away. Nothing is
+    applied if a worker already claimed the event.
+    """
+    from app import db, Ticket, User
+    from models import OutboxEvent
+
+    if event_type == GEOLOCATE_EVENT:
+        usable = bool(result and result.get('country'))
+    else:
+        usable = bool(result) if event_type == ODOO_SYNC_EVENT else result is not None
+    close = usable and event_type != ODOO_SYNC_EVENT
+
+    now = datetime.utcnow()
+    changes = {'status': 'done', 'processed_at': now} if close else {'available_at': now}
+    claimed = OutboxEvent.query.filter_by(id=event_id, status='pending').update(changes, synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return
+
+    bot_message = None
+    ticket = Ticket.query.get(ticket_id) if usable else None
+    if ticket is not None:
+        if event_type == GEOLOCATE_EVENT:
+            apply_country(ticket, result['country'], User.query.get(user_id) if user_id else None)
+        elif event_type == BOT_REPLY_EVENT:
+            if not ticket.bot_attempted:
+                bot_message = apply_bot_reply(ticket, result)
+        elif not ticket.odoo_customer_id:
+            ticket.odoo_customer_id = result
+
+    db.session.commit()
+    logger.info(f"Late fan-out result for {event_type} on ticket {ticket_id} "
+                f"{'applied' if close else 'handed to the outbox'}")
+    if bot_message:
+        emit_ticket_message(bot_message)
+
+def register_ticket_side_effects(outbox):
+    """Register the ticket handlers with the outbox service"""
+    outbox.register(GEOLOCATE_EVENT, handle_geolocate)
+    outbox.register(BOT_REPLY_EVENT, handle_bot_reply)
+    outbox.register(ODOO_SYNC_EVENT, handle_odoo_sync)